@@ -0,0 +1,48 @@
+"""trigram indexes
+
+Revision ID: 5d8a0e6b7f21
+Revises: c3f18a2e5d47
+Create Date: 2026-10-17 11:48:05.331970
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5d8a0e6b7f21"
+down_revision: Union[str, None] = "c3f18a2e5d47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TRIGRAM_INDEXES = [
+    ("user", "email"),
+    ("initiative", "name"),
+    ("activity", "name"),
+    ("funder", "name"),
+    ("regulation", "name"),
+    ("grant", "name"),
+    ("bank_account", "iban"),
+    ("payment", "short_user_description"),
+]
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, column in TRIGRAM_INDEXES:
+        op.create_index(
+            f"ix_{table}_{column}_trgm",
+            table,
+            [column],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_ops={column: "gin_trgm_ops"},
+        )
+
+
+def downgrade() -> None:
+    for table, column in TRIGRAM_INDEXES:
+        op.drop_index(f"ix_{table}_{column}_trgm", table_name=table)
@@ -0,0 +1,82 @@
+"""hot path indexes
+
+Revision ID: 8e1c4b7a9f30
+Revises: 5d8a0e6b7f21
+Create Date: 2026-10-17 14:02:41.508213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8e1c4b7a9f30"
+down_revision: Union[str, None] = "5d8a0e6b7f21"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Foreign keys that are looked up from the referenced side. The role tables have a
+# primary key that starts with user_id, so it's the other side that needs an index.
+FOREIGN_KEY_INDEXES = [
+    ("user_initiative_roles", "initiative_id"),
+    ("user_activity_roles", "activity_id"),
+    ("user_bank_account_roles", "bank_account_id"),
+    ("user_regulation_roles", "regulation_id"),
+    ("user_grant_roles", "grant_id"),
+    ("user_visible_initiative", "initiative_id"),
+    ("requisition_bank_account", "bank_account_id"),
+    ("initiative", "grant_id"),
+    ("activity", "initiative_id"),
+    ("debitcard", "initiative_id"),
+    ("regulation", "funder_id"),
+    ("grant", "regulation_id"),
+]
+
+PAYMENT_LISTING_COLUMNS = ["initiative_id", "activity_id", "bank_account_id"]
+
+
+def upgrade() -> None:
+    for table, column in FOREIGN_KEY_INDEXES:
+        op.create_index(op.f(f"ix_{table}_{column}"), table, [column], unique=False)
+    op.create_index(
+        "ix_attachments_entity",
+        "attachments",
+        ["entity_type", "entity_id", "attachment_type"],
+        unique=False,
+    )
+    for column in PAYMENT_LISTING_COLUMNS:
+        op.create_index(
+            f"ix_payment_{column}_booking_date",
+            "payment",
+            [
+                column,
+                sa.text("booking_date DESC NULLS LAST"),
+                sa.text("id DESC"),
+            ],
+            unique=False,
+        )
+    op.create_index(
+        "ix_payment_unlinked_bank_account_id_booking_date",
+        "payment",
+        [
+            "bank_account_id",
+            sa.text("booking_date DESC NULLS LAST"),
+            sa.text("id DESC"),
+        ],
+        unique=False,
+        postgresql_where=sa.text("initiative_id IS NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_payment_unlinked_bank_account_id_booking_date", table_name="payment"
+    )
+    for column in PAYMENT_LISTING_COLUMNS:
+        op.drop_index(f"ix_payment_{column}_booking_date", table_name="payment")
+    op.drop_index("ix_attachments_entity", table_name="attachments")
+    for table, column in FOREIGN_KEY_INDEXES:
+        op.drop_index(op.f(f"ix_{table}_{column}"), table_name=table)
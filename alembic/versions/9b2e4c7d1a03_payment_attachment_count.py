@@ -0,0 +1,43 @@
+"""payment attachment count
+
+Revision ID: 9b2e4c7d1a03
+Revises: 4fef33fa6875
+Create Date: 2026-10-17 10:12:41.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9b2e4c7d1a03"
+down_revision: Union[str, None] = "4fef33fa6875"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "payment",
+        sa.Column("n_attachments", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.execute(
+        """
+        UPDATE payment
+        SET n_attachments = counts.n
+        FROM (
+            SELECT entity_id, count(*) AS n
+            FROM attachments
+            WHERE entity_type = 'payment'
+            AND attachment_type IN ('picture', 'pdf')
+            GROUP BY entity_id
+        ) AS counts
+        WHERE payment.id = counts.entity_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("payment", "n_attachments")
@@ -0,0 +1,31 @@
+"""cache generation
+
+Revision ID: a4e9d2b7c3f1
+Revises: f2c8b5e1a4d6
+Create Date: 2026-10-17 22:14:36.501928
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a4e9d2b7c3f1"
+down_revision: Union[str, None] = "f2c8b5e1a4d6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "cache_generation",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("generation", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("cache_generation")
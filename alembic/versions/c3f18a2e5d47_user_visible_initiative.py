@@ -0,0 +1,62 @@
+"""user visible initiative
+
+Revision ID: c3f18a2e5d47
+Revises: 9b2e4c7d1a03
+Create Date: 2026-10-17 11:03:27.904118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c3f18a2e5d47"
+down_revision: Union[str, None] = "9b2e4c7d1a03"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user_visible_initiative",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("initiative_id", sa.Integer(), nullable=False),
+        sa.Column("can_see_hidden_payments", sa.Boolean(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["initiative_id"], ["initiative.id"], ondelete="CASCADE"
+        ),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id", "initiative_id"),
+    )
+    op.execute(
+        """
+        INSERT INTO user_visible_initiative
+            (user_id, initiative_id, can_see_hidden_payments)
+        SELECT user_id, initiative_id, bool_or(can_see_hidden_payments)
+        FROM (
+            SELECT user_id, initiative_id, true AS can_see_hidden_payments
+            FROM user_initiative_roles
+            UNION ALL
+            SELECT user_grant_roles.user_id, initiative.id, true
+            FROM user_grant_roles
+            JOIN initiative ON initiative.grant_id = user_grant_roles.grant_id
+            UNION ALL
+            SELECT user_regulation_roles.user_id, initiative.id, true
+            FROM user_regulation_roles
+            JOIN "grant"
+                ON "grant".regulation_id = user_regulation_roles.regulation_id
+            JOIN initiative ON initiative.grant_id = "grant".id
+            UNION ALL
+            SELECT user_activity_roles.user_id, activity.initiative_id, false
+            FROM user_activity_roles
+            JOIN activity ON activity.id = user_activity_roles.activity_id
+        ) AS visible
+        GROUP BY user_id, initiative_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("user_visible_initiative")
@@ -0,0 +1,26 @@
+"""bank account sync watermark
+
+Revision ID: d7a3f1c9e2b8
+Revises: 8e1c4b7a9f30
+Create Date: 2026-10-17 16:41:09.224817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d7a3f1c9e2b8"
+down_revision: Union[str, None] = "8e1c4b7a9f30"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("bank_account", sa.Column("synced_until", sa.Date(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("bank_account", "synced_until")
@@ -0,0 +1,59 @@
+"""import job
+
+Revision ID: f2c8b5e1a4d6
+Revises: d7a3f1c9e2b8
+Create Date: 2026-10-17 18:07:52.613940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f2c8b5e1a4d6"
+down_revision: Union[str, None] = "d7a3f1c9e2b8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "import_job",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("requisition_id", sa.Integer(), nullable=False),
+        sa.Column("date_from", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("status", sa.VARCHAR(length=32), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column(
+            "run_after",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("leased_until", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("last_error", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["requisition_id"], ["requisition.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_import_job_queued_requisition_id",
+        "import_job",
+        ["requisition_id"],
+        unique=True,
+        postgresql_where=sa.text("status = 'queued'"),
+    )
+    op.create_index(
+        "ix_import_job_status_run_after", "import_job", ["status", "run_after"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_import_job_status_run_after", table_name="import_job")
+    op.drop_index("ix_import_job_queued_requisition_id", table_name="import_job")
+    op.drop_table("import_job")
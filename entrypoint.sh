@@ -3,7 +3,8 @@ set -e
 
 service ssh start
 
-/bin/sh /app/loop_script.sh >> /home/loop_script.log 2>&1 & disown $!
+# Imports the payments in the job queue. Every replica can run one.
+/usr/local/bin/open-poen worker >> /home/worker.log 2>&1 & disown $!
 
 # this does not seem to work completely. FQN for BNG is not extracted properly...
 # this ensures we have the right ENV variables when we SSH into the container.
@@ -0,0 +1,439 @@
+"""Maintains the income and expenses of initiatives, activities, debit cards and
+grants as payments are added, changed, relinked and deleted.
+
+Every flush applies the difference a payment makes to its old and its new parents,
+in the same transaction, instead of summing all payments of the parents again. The
+new totals are set on the parents that are loaded in the session.
+
+The old values of changed payments are read from the database before the flush, as
+the session doesn't know them when the attributes were expired. They are locked
+while they are read, so that concurrent changes of the same payment apply their
+deltas one after the other, each to the parents the other one left. Changes that
+don't go through the ORM, like bulk inserts, have to update the totals themselves.
+
+Imports and cascades that change many payments can defer all of this with
+`deferred_finance_aggregates`, which recomputes the affected parents once.
+
+`find_aggregate_drift` and `recompute_aggregates` compare all stored aggregates,
+including those of bank accounts, with what they are computed from, for use after
+incidents or changes outside of the application.
+"""
+import asyncio
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from decimal import Decimal
+
+from sqlalchemy import event, func, inspect, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from . import models as ent
+from .logger import audit_logger
+
+# The parents of a payment that keep totals, by the foreign key on the payment.
+PAYMENT_PARENTS = {
+    "initiative_id": ent.Initiative,
+    "activity_id": ent.Activity,
+    "debit_card_id": ent.DebitCard,
+}
+PAYMENT_KEYS = (*PAYMENT_PARENTS, "route", "transaction_amount")
+INITIATIVE_KEYS = ("grant_id", "income", "expenses")
+
+_ROUTE_COLUMNS = {ent.Route.INCOME: "income", ent.Route.EXPENSES: "expenses"}
+
+
+class FinanceDeltas:
+    """Differences in income and expenses per parent, to apply at once."""
+
+    def __init__(self):
+        self.deltas: dict[tuple[type, int], dict[str, Decimal]] = defaultdict(
+            lambda: {"income": Decimal("0.00"), "expenses": Decimal("0.00")}
+        )
+
+    def add(self, cls: type, id: int | None, route, amount, sign: int) -> None:
+        if id is None or route is None or amount is None:
+            return
+        self.deltas[(cls, id)][_ROUTE_COLUMNS[ent.Route(route)]] += sign * amount
+
+    def add_payment(self, values: dict, sign: int) -> None:
+        for key, cls in PAYMENT_PARENTS.items():
+            self.add(
+                cls, values[key], values["route"], values["transaction_amount"], sign
+            )
+
+    def add_initiative_to_grant(self, grant_id: int | None, values: dict, sign: int):
+        for route, column in _ROUTE_COLUMNS.items():
+            self.add(ent.Grant, grant_id, route, values[column], sign)
+
+    def __bool__(self):
+        return any(any(i.values()) for i in self.deltas.values())
+
+    def apply(self, session: Session) -> None:
+        for (cls, id), delta in self.deltas.items():
+            if not any(delta.values()):
+                continue
+            _set_totals(
+                session,
+                cls,
+                cls.id == id,
+                cls.income + delta["income"],
+                cls.expenses + delta["expenses"],
+            )
+            if cls is ent.Initiative:
+                # A grant's totals are those of its initiatives.
+                _set_totals(
+                    session,
+                    ent.Grant,
+                    ent.Grant.id
+                    == select(ent.Initiative.grant_id)
+                    .where(ent.Initiative.id == id)
+                    .scalar_subquery(),
+                    ent.Grant.income + delta["income"],
+                    ent.Grant.expenses + delta["expenses"],
+                )
+
+
+def _set_totals(session: Session, cls: type, where, income, expenses) -> None:
+    result = session.connection().execute(
+        update(cls)
+        .where(where)
+        .values(income=income, expenses=expenses)
+        .returning(cls.id, cls.income, cls.expenses)
+    )
+    for id, income, expenses in result:
+        instance = session.identity_map.get(session.identity_key(cls, id))
+        if instance is not None:
+            set_committed_value(instance, "income", income)
+            set_committed_value(instance, "expenses", expenses)
+
+
+def _persistent(instance) -> bool:
+    return inspect(instance).key is not None
+
+
+def _changed(instance, keys: tuple[str, ...]) -> bool:
+    state = inspect(instance)
+    return _persistent(instance) and any(
+        state.attrs[key].history.has_changes() for key in keys
+    )
+
+
+def _current(instance, keys: tuple[str, ...]) -> dict:
+    return {key: getattr(instance, key) for key in keys}
+
+
+def _stored(session: Session, cls: type, keys: tuple[str, ...], instances) -> dict:
+    """The values of the given instances as they are in the database, by id. The rows
+    are locked until the end of the transaction, so a concurrent flush of the same
+    rows waits, and then reads what this one committed."""
+    ids = [inspect(i).identity[0] for i in instances]
+    if len(ids) == 0:
+        return {}
+    rows = session.connection().execute(
+        select(cls.id, *[getattr(cls, key) for key in keys])
+        .where(cls.id.in_(ids))
+        .order_by(cls.id)
+        .with_for_update()
+    )
+    return {row[0]: dict(zip(keys, row[1:])) for row in rows}
+
+
+@event.listens_for(Session, "before_flush")
+def _store_old_finance_values(session, flush_context, instances):
+    payments = [
+        i
+        for i in session.dirty
+        if isinstance(i, ent.Payment) and _changed(i, PAYMENT_KEYS)
+    ] + [i for i in session.deleted if isinstance(i, ent.Payment) and _persistent(i)]
+    initiatives = [
+        i
+        for i in session.dirty
+        if isinstance(i, ent.Initiative) and _changed(i, ("grant_id",))
+    ] + [i for i in session.deleted if isinstance(i, ent.Initiative) and _persistent(i)]
+    session.info["old_finance_values"] = {
+        ent.Payment: _stored(session, ent.Payment, PAYMENT_KEYS, payments),
+        ent.Initiative: _stored(session, ent.Initiative, INITIATIVE_KEYS, initiatives),
+    }
+
+
+@event.listens_for(Session, "after_flush")
+def _maintain_finance_aggregates(session, flush_context):
+    old_values = session.info.pop("old_finance_values", None)
+    if old_values is None:
+        return
+    old_payments = old_values[ent.Payment]
+    old_initiatives = old_values[ent.Initiative]
+
+    deltas = FinanceDeltas()
+    for values in old_payments.values():
+        deltas.add_payment(values, -1)
+    for instance in session.new:
+        if isinstance(instance, ent.Payment):
+            deltas.add_payment(_current(instance, PAYMENT_KEYS), 1)
+    for instance in session.dirty:
+        if isinstance(instance, ent.Payment) and instance.id in old_payments:
+            deltas.add_payment(_current(instance, PAYMENT_KEYS), 1)
+        elif isinstance(instance, ent.Initiative) and instance.id in old_initiatives:
+            # Moving an initiative to another grant moves its totals along.
+            values = old_initiatives[instance.id]
+            deltas.add_initiative_to_grant(values["grant_id"], values, -1)
+            deltas.add_initiative_to_grant(instance.grant_id, values, 1)
+    for instance in session.deleted:
+        if isinstance(instance, ent.Initiative):
+            # Its payments are unlinked, but the grant can't be found through the
+            # initiative anymore, so its totals are taken from the grant at once.
+            values = old_initiatives.get(inspect(instance).identity[0])
+            if values is not None:
+                deltas.add_initiative_to_grant(values["grant_id"], values, -1)
+    if not deltas:
+        return
+    deferred = session.info.get("deferred_finance_parents")
+    if deferred is not None:
+        deferred.add_deltas(deltas)
+    else:
+        deltas.apply(session)
+
+
+def _payment_totals(*where) -> dict:
+    return {
+        column: select(ent.get_finance_aggregate(route)).where(*where).scalar_subquery()
+        for route, column in _ROUTE_COLUMNS.items()
+    }
+
+
+def _requisition_aggregate(aggregate):
+    return (
+        select(aggregate)
+        .select_from(ent.Requisition)
+        .join(
+            ent.requisition_bank_account,
+            ent.requisition_bank_account.c.requisition_id == ent.Requisition.id,
+        )
+        .where(ent.requisition_bank_account.c.bank_account_id == ent.BankAccount.id)
+        .scalar_subquery()
+    )
+
+
+# What every stored aggregate should be, as a subquery correlated to its row.
+AGGREGATES: dict[type, dict] = {
+    ent.Initiative: _payment_totals(ent.Payment.initiative_id == ent.Initiative.id),
+    ent.Activity: _payment_totals(ent.Payment.activity_id == ent.Activity.id),
+    ent.DebitCard: _payment_totals(ent.Payment.debit_card_id == ent.DebitCard.id),
+    ent.Grant: _payment_totals(
+        ent.Payment.initiative_id == ent.Initiative.id,
+        ent.Initiative.grant_id == ent.Grant.id,
+    ),
+    ent.BankAccount: {
+        "is_linked": _requisition_aggregate(
+            func.coalesce(
+                func.bool_or(ent.Requisition.status == ent.ReqStatus.LINKED.value),
+                False,
+            )
+        ),
+        "is_revoked": _requisition_aggregate(
+            func.coalesce(
+                func.bool_and(ent.Requisition.status == ent.ReqStatus.REVOKED.value),
+                False,
+            )
+        ),
+        "user_count": select(func.count())
+        .where(
+            ent.UserBankAccountRole.bank_account_id == ent.BankAccount.id,
+            ent.UserBankAccountRole.role == ent.BankAccountRole.USER.value,
+        )
+        .scalar_subquery(),
+        "expiration_date": _requisition_aggregate(
+            func.max(
+                ent.Requisition.created_at
+                + text("(requisition.n_days_access || ' days')::interval")
+            )
+        ),
+    },
+}
+
+
+class DeferredParents:
+    """The parents whose totals have to be recomputed at the end of a
+    `deferred_finance_aggregates` block."""
+
+    def __init__(self):
+        self.ids: dict[type, set[int]] = defaultdict(set)
+
+    def add(self, cls: type, id: int | None) -> None:
+        if id is not None:
+            self.ids[cls].add(id)
+
+    def add_deltas(self, deltas: FinanceDeltas) -> None:
+        for (cls, id), delta in deltas.deltas.items():
+            if any(delta.values()):
+                self.add(cls, id)
+
+    def add_payments(self, rows) -> None:
+        """Adds the parents of payments that are changed without the ORM, from rows
+        with the foreign keys of `PAYMENT_PARENTS`, like those returned by a bulk
+        delete."""
+        for row in rows:
+            for key, cls in PAYMENT_PARENTS.items():
+                self.add(cls, row._mapping[key])
+
+    def recompute(self, session: Session) -> None:
+        initiative_ids = self.ids.get(ent.Initiative, set())
+        grants = ent.Grant.id.in_(self.ids.get(ent.Grant, set())) | ent.Grant.id.in_(
+            select(ent.Initiative.grant_id).where(ent.Initiative.id.in_(initiative_ids))
+        )
+        parents = [
+            (cls, cls.id.in_(self.ids[cls]))
+            for cls in PAYMENT_PARENTS.values()
+            if self.ids.get(cls)
+        ]
+        if initiative_ids or self.ids.get(ent.Grant):
+            parents.append((ent.Grant, grants))
+        # The rows are locked first, so that deltas of concurrent flushes are
+        # committed before the totals are summed, in statements that see them,
+        # instead of being applied to totals that were summed without them.
+        for cls, where in parents:
+            session.connection().execute(
+                select(cls.id).where(where).order_by(cls.id).with_for_update()
+            )
+        for cls, where in parents:
+            _set_totals(session, cls, where, **AGGREGATES[cls])
+
+
+@asynccontextmanager
+async def deferred_finance_aggregates(session: AsyncSession):
+    """Suspends the maintenance of totals for the flushes of `session` in the block,
+    and recomputes the totals of all parents that were affected at the end, at once.
+
+    For imports and cascades that change many payments of the same parents, possibly
+    in many commits. The totals are stale until the block ends. Payments that are
+    changed without the ORM can be added with `DeferredParents.add_payments`."""
+    if "deferred_finance_parents" in session.info:
+        # Nested blocks are recomputed by the outer one.
+        yield session.info["deferred_finance_parents"]
+        return
+    parents = session.info["deferred_finance_parents"] = DeferredParents()
+    try:
+        yield parents
+        await session.flush()
+    except BaseException:
+        await session.rollback()
+        del session.info["deferred_finance_parents"]
+        # Earlier commits in the block have to be recomputed, even after an error.
+        # In a session of its own, and without hiding the error if it fails too.
+        if parents.ids:
+            try:
+                async with AsyncSession(session.bind) as recompute_session:
+                    await recompute_session.run_sync(parents.recompute)
+                    await recompute_session.commit()
+            except Exception:
+                audit_logger.exception(
+                    "Recomputing the totals after a failed deferred block failed. "
+                    "Run `open-poen recompute-aggregates` to repair them."
+                )
+        raise
+    del session.info["deferred_finance_parents"]
+    if parents.ids:
+        await session.run_sync(parents.recompute)
+        await session.commit()
+
+
+def _drifted(cls: type):
+    return or_(
+        *[
+            getattr(cls, column).is_distinct_from(expected)
+            for column, expected in AGGREGATES[cls].items()
+        ]
+    )
+
+
+async def _id_ranges(session_maker, chunk_size: int) -> list[tuple[type, int, int]]:
+    ranges = []
+    async with session_maker() as session:
+        for cls in AGGREGATES:
+            result = await session.execute(select(func.min(cls.id), func.max(cls.id)))
+            first, last = result.one()
+            if first is None:
+                continue
+            ranges += [
+                (cls, start, min(start + chunk_size - 1, last))
+                for start in range(first, last + 1, chunk_size)
+            ]
+    return ranges
+
+
+async def _in_chunks(session_maker, chunk_size: int, concurrency: int, run_chunk):
+    """Runs `run_chunk` for ranges of ids of every class, each with its own session,
+    at most `concurrency` at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(cls, first, last):
+        async with semaphore:
+            async with session_maker() as session:
+                return cls, await run_chunk(session, cls, cls.id.between(first, last))
+
+    chunks = await asyncio.gather(
+        *[run(*i) for i in await _id_ranges(session_maker, chunk_size)]
+    )
+    results: dict[str, list] = {cls.__name__: [] for cls in AGGREGATES}
+    for cls, rows in chunks:
+        results[cls.__name__] += rows
+    return results
+
+
+async def _find_chunk(session, cls: type, in_chunk) -> list[dict]:
+    columns = AGGREGATES[cls]
+    result = await session.execute(
+        select(
+            cls.id,
+            *[getattr(cls, column) for column in columns],
+            *columns.values(),
+        )
+        .where(in_chunk, _drifted(cls))
+        .order_by(cls.id)
+    )
+    drift = []
+    for id, *values in result:
+        stored, expected = values[: len(columns)], values[len(columns) :]
+        drift.append(
+            {"id": id}
+            | {
+                column: (s, e)
+                for column, s, e in zip(columns, stored, expected)
+                if s != e
+            }
+        )
+    return drift
+
+
+async def _recompute_chunk(session, cls: type, in_chunk) -> list[int]:
+    result = await session.execute(
+        update(cls)
+        .where(in_chunk, _drifted(cls))
+        .values(**AGGREGATES[cls])
+        .returning(cls.id)
+        .execution_options(synchronize_session=False)
+    )
+    ids = result.scalars().all()
+    await session.commit()
+    return ids
+
+
+async def find_aggregate_drift(
+    session_maker: async_sessionmaker, chunk_size: int = 10000, concurrency: int = 4
+) -> dict[str, list[dict]]:
+    """The rows whose stored aggregates differ from what they are computed from, by
+    class name, with the stored and the computed value of every differing column."""
+    return await _in_chunks(session_maker, chunk_size, concurrency, _find_chunk)
+
+
+async def recompute_aggregates(
+    session_maker: async_sessionmaker, chunk_size: int = 10000, concurrency: int = 4
+) -> dict[str, list[int]]:
+    """Sets the stored aggregates that differ to what they are computed from, and
+    returns the ids of the changed rows by class name.
+
+    Every chunk is committed on its own. A payment that's changed while its parent
+    is recomputed can be left out of its totals, so this should run while there
+    are no imports, and can be followed by `find_aggregate_drift` to make sure."""
+    return await _in_chunks(session_maker, chunk_size, concurrency, _recompute_chunk)
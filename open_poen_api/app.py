@@ -2,6 +2,7 @@ from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from .managers import fastapi_users, auth_backend
 from .exc import CustomException
+from .authorization import decision_cache
 from .routes import (
     user_router,
     initiative_router,
@@ -12,7 +13,9 @@ from .routes import (
 )
 from starlette.middleware.cors import CORSMiddleware
 import os
-from .logger import audit_logger
+from .logger import audit_logger, sql_logger
+from .database import record_queries
+import json
 
 
 tags_metadata = [
@@ -54,6 +57,39 @@ app.include_router(permission_router, prefix="/auth/entity-access", tags=["auth"
 app.include_router(utils_router)
 
 
+@app.middleware("http")
+async def authorization_decision_cache(request: Request, call_next):
+    with decision_cache():
+        return await call_next(request)
+
+
+@app.middleware("http")
+async def sql_instrumentation(request: Request, call_next):
+    with record_queries() as queries:
+        response = await call_next(request)
+    # Streamed bodies, like exports, query after this, so they're not included.
+    response.headers.append("Server-Timing", queries.server_timing())
+    repeated = queries.repeated()
+    log = sql_logger.warning if repeated else sql_logger.info
+    log(
+        json.dumps(
+            {
+                "method": request.method,
+                "path": request.url.path,
+                "status_code": response.status_code,
+                "queries": queries.count,
+                "db_ms": round(queries.duration * 1000, 1),
+                # Likely N+1 patterns.
+                "repeated": [
+                    {"statement": statement, "count": count}
+                    for statement, count in repeated.items()
+                ],
+            }
+        )
+    )
+    return response
+
+
 @app.exception_handler(CustomException)
 async def custom_exception_handler(request: Request, exc: CustomException):
     audit_logger.info(
@@ -7,6 +7,7 @@ from dateutil.parser import parse
 import pytz
 from .api import read_account_information, read_transaction_list
 from .. import models as ent
+from ..aggregates import deferred_finance_aggregates
 from sqlalchemy.ext.asyncio import AsyncSession
 from decimal import Decimal
 from sqlalchemy import select
@@ -30,63 +31,68 @@ def _flatten(d, parent_key="", sep="_"):
 
 
 async def _parse_and_save_payments(session: AsyncSession, payments):
-    for payment in payments:
-        payment = _flatten(payment)
-        # Convert from camel case to snake case to match the column names in the database.
-        payment = {
-            CAMEL_CASE_PATTERN.sub("_", k).lower(): v for (k, v) in payment.items()
-        }
-        payment["booking_date"] = parse(payment["booking_date"])
-        # Transactions are only definitive past one day after entry.
-        diff = datetime.today() - payment["booking_date"]
-        if diff.days < 1:
-            continue
-        payment["transaction_amount"] = Decimal(payment["transaction_amount"])
-        route = (
-            ent.Route.INCOME
-            if payment["transaction_amount"] > 0
-            else ent.Route.EXPENSES
-        )
-        # Parse the debit card, if any, in the payment information field.
-        found = re.search("6731924\d*", payment["remittance_information_unstructured"])
-        card_number = found.group(0) if found is not None else None
-        # Ensure we save empty strings as NULL.
-        payment = {k: (v if v != "" else None) for (k, v) in payment.items()}
-
-        # Skip payments that are already in the database.
-        payment_db_q = await session.execute(
-            select(ent.Payment).where(
-                ent.Payment.transaction_id == payment["transaction_id"]
+    async with deferred_finance_aggregates(session):
+        for payment in payments:
+            payment = _flatten(payment)
+            # Convert from camel case to snake case to match the column names in the database.
+            payment = {
+                CAMEL_CASE_PATTERN.sub("_", k).lower(): v for (k, v) in payment.items()
+            }
+            payment["booking_date"] = parse(payment["booking_date"])
+            # Transactions are only definitive past one day after entry.
+            diff = datetime.today() - payment["booking_date"]
+            if diff.days < 1:
+                continue
+            payment["transaction_amount"] = Decimal(payment["transaction_amount"])
+            route = (
+                ent.Route.INCOME
+                if payment["transaction_amount"] > 0
+                else ent.Route.EXPENSES
             )
-        )
-        if payment_db_q.scalars().first():
-            continue
-
-        # card_id should be None if it's not a debit card payment. It should be the
-        # id of the debit card in the database if the debit card used for the payment
-        # is already in the database. It should be the id of a newly created debit card
-        # if this payment is the first payment that we encounter with this debit card.
-        if card_number is None:
-            card_id = None
-        else:
-            debit_card_q = await session.execute(
-                select(ent.DebitCard).where(ent.DebitCard.card_number == card_number)
+            # Parse the debit card, if any, in the payment information field.
+            found = re.search(
+                "6731924\d*", payment["remittance_information_unstructured"]
             )
-            debit_card = debit_card_q.scalars().first()
-            if debit_card:
-                card_id = debit_card.id
+            card_number = found.group(0) if found is not None else None
+            # Ensure we save empty strings as NULL.
+            payment = {k: (v if v != "" else None) for (k, v) in payment.items()}
+
+            # Skip payments that are already in the database.
+            payment_db_q = await session.execute(
+                select(ent.Payment).where(
+                    ent.Payment.transaction_id == payment["transaction_id"]
+                )
+            )
+            if payment_db_q.scalars().first():
+                continue
+
+            # card_id should be None if it's not a debit card payment. It should be the
+            # id of the debit card in the database if the debit card used for the payment
+            # is already in the database. It should be the id of a newly created debit card
+            # if this payment is the first payment that we encounter with this debit card.
+            if card_number is None:
+                card_id = None
             else:
-                debit_card = ent.DebitCard(card_number=card_number)
-                session.add(debit_card)
-                await session.commit()
-                await session.refresh(debit_card)
-                card_id = debit_card.id
-
-        payment = ent.Payment(
-            **payment, route=route, type=ent.PaymentType.BNG, debit_card_id=card_id
-        )
-        session.add(payment)
-        await session.commit()
+                debit_card_q = await session.execute(
+                    select(ent.DebitCard).where(
+                        ent.DebitCard.card_number == card_number
+                    )
+                )
+                debit_card = debit_card_q.scalars().first()
+                if debit_card:
+                    card_id = debit_card.id
+                else:
+                    debit_card = ent.DebitCard(card_number=card_number)
+                    session.add(debit_card)
+                    await session.commit()
+                    await session.refresh(debit_card)
+                    card_id = debit_card.id
+
+            payment = ent.Payment(
+                **payment, route=route, type=ent.PaymentType.BNG, debit_card_id=card_id
+            )
+            session.add(payment)
+            await session.commit()
 
 
 async def import_bng_payments(
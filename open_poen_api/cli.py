@@ -1,5 +1,6 @@
 import typer
 from .database import (
+    async_session_maker,
     get_async_session_context,
     get_user_db_context,
     create_db_and_tables,
@@ -10,13 +11,15 @@ from .gocardless import get_nordigen_client
 from .utils.utils import temp_password_generator
 from .managers import UserManager
 from .gocardless.payments import get_gocardless_payments
+from .gocardless.jobs import run_workers
 from .utils.utils import create_media_container
+from . import aggregates
 
 # from fastapi_users.exceptions import UserAlreadyExists
 from .exc import EntityAlreadyExists
 import asyncio
 from rich import print
-from datetime import datetime, timedelta
+from datetime import datetime
 
 app = typer.Typer()
 
@@ -87,29 +90,33 @@ def clear_db():
         asyncio.run(drop_all())
 
 
+def parse_date_from(date_from: str) -> datetime | None:
+    if date_from == "":
+        # Retrieve the payments of every account since it was last retrieved.
+        return None
+    try:
+        return datetime.strptime(date_from, "%Y-%m-%d")
+    except ValueError:
+        typer.echo("Invalid date format. Use YYYY-MM-DD.")
+        raise typer.Abort()
+
+
 @app.command()
 def retrieve_payments(requisition_id: int, date_from: str = ""):
-    if date_from != "":
-        try:
-            parsed_date_from = datetime.strptime(date_from, "%Y-%m-%d")
-        except ValueError:
-            typer.echo("Invalid date format. Use YYYY-MM-DD.")
-            raise typer.Abort()
-
-    asyncio.run(get_gocardless_payments(requisition_id, parsed_date_from))
+    asyncio.run(get_gocardless_payments(requisition_id, parse_date_from(date_from)))
 
 
 @app.command()
 def retrieve_all_payments(date_from: str = ""):
-    if date_from != "":
-        try:
-            parsed_date_from = datetime.strptime(date_from, "%Y-%m-%d")
-        except ValueError:
-            typer.echo("Invalid date format. Use YYYY-MM-DD.")
-            raise typer.Abort()
-    else:
-        parsed_date_from = datetime.now() - timedelta(weeks=1)
-    asyncio.run(get_gocardless_payments(date_from=parsed_date_from))
+    asyncio.run(get_gocardless_payments(date_from=parse_date_from(date_from)))
+
+
+@app.command()
+def worker(concurrency: int = 4):
+    """Runs the imports in the job queue, `concurrency` at a time, until stopped, and
+    queues the imports of all requisitions every hour. Any number of workers can run
+    at once, on any number of nodes."""
+    asyncio.run(run_workers(concurrency))
 
 
 @app.command()
@@ -182,3 +189,34 @@ def create_local_media_container():
     The environments on Azure: test, acceptance and production, have the media container created
     by Terraform."""
     asyncio.run(create_media_container())
+
+
+@app.command()
+def check_aggregates(chunk_size: int = 10000, concurrency: int = 4, show: int = 20):
+    """Reports the stored aggregates, like the income of initiatives or the user count of
+    bank accounts, that differ from what they are computed from, without changing them.
+    Exits with 1 if any differ."""
+    drift = asyncio.run(
+        aggregates.find_aggregate_drift(async_session_maker, chunk_size, concurrency)
+    )
+    for name, rows in drift.items():
+        print(f"{name}: {len(rows)} rows differ")
+        for row in rows[:show]:
+            columns = ", ".join(
+                f"{column} {stored} != {expected}"
+                for column, (stored, expected) in row.items()
+                if column != "id"
+            )
+            print(f"  {row['id']}: {columns}")
+    if any(drift.values()):
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def recompute_aggregates(chunk_size: int = 10000, concurrency: int = 4):
+    """Sets the stored aggregates that differ to what they are computed from."""
+    changed = asyncio.run(
+        aggregates.recompute_aggregates(async_session_maker, chunk_size, concurrency)
+    )
+    for name, ids in changed.items():
+        print(f"{name}: recomputed {len(ids)} rows")
@@ -1,4 +1,5 @@
 from .models import User, Base
+from . import aggregates  # Maintains the finance totals on every flush.
 from typing import AsyncGenerator
 from fastapi_users.db import SQLAlchemyUserDatabase
 from fastapi import Depends
@@ -6,13 +7,146 @@ import contextlib
 
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import default
 import os
+import time
+from collections import Counter
+from contextvars import ContextVar
 
-# TODO: Configure this with environment variables.
-async_engine = create_async_engine(os.environ["ASYNC_DATABASE_URL"])
+
+def engine_options() -> dict:
+    """Pool and driver settings, the same for the primary and the read engine. The
+    defaults are SQLAlchemy's and asyncpg's."""
+    return {
+        "pool_size": int(os.environ.get("DATABASE_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DATABASE_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.environ.get("DATABASE_POOL_TIMEOUT", 30)),
+        # Seconds after which a connection is replaced, -1 to keep them.
+        "pool_recycle": int(os.environ.get("DATABASE_POOL_RECYCLE", -1)),
+        "pool_pre_ping": os.environ.get("DATABASE_POOL_PRE_PING", "false").lower()
+        == "true",
+        "connect_args": {
+            # Prepared statements asyncpg keeps per connection. Set it to 0 behind a
+            # pooler in transaction mode, like PgBouncer, that doesn't support them.
+            "statement_cache_size": int(
+                os.environ.get("DATABASE_STATEMENT_CACHE_SIZE", 100)
+            ),
+        },
+    }
+
+
+# A statement executed this many times in one request is logged as a likely N+1.
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("SQL_N_PLUS_ONE_THRESHOLD", 10))
+
+async_engine = create_async_engine(os.environ["ASYNC_DATABASE_URL"], **engine_options())
 async_session_maker = async_sessionmaker(async_engine, expire_on_commit=False)
 
+# Endpoints that only read can use a replica, so that reads and the writes of the
+# imports don't compete for the same connections. Without a replica they read from
+# the primary. A replica can lag behind, so don't read back what was just written.
+if os.environ.get("ASYNC_READ_DATABASE_URL"):
+    async_read_engine = create_async_engine(
+        os.environ["ASYNC_READ_DATABASE_URL"], **engine_options()
+    )
+else:
+    async_read_engine = async_engine
+async_read_session_maker = async_sessionmaker(async_read_engine, expire_on_commit=False)
+
+
+class StatementCacheStats:
+    """Counts how many executed statements were found in SQLAlchemy's compiled
+    cache. Statements that can't be cached, like raw SQL, are counted separately."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+
+    @property
+    def hit_rate(self) -> float | None:
+        cached = self.hits + self.misses
+        return self.hits / cached if cached > 0 else None
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        if context is None:
+            return
+        if context.cache_hit is default.CACHE_HIT:
+            self.hits += 1
+        elif context.cache_hit is default.CACHE_MISS:
+            self.misses += 1
+        else:
+            self.uncached += 1
+
+
+statement_cache_stats = StatementCacheStats()
+
+
+class RequestQueries:
+    """The statements executed while handling a request, to see what an endpoint
+    costs and to find N+1 patterns: the same statement executed over and over with
+    different parameters, like a lazy relationship loaded per row."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Counter[str] = Counter()
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> dict[str, int]:
+        return {
+            statement: count
+            for statement, count in self.statements.items()
+            if count >= threshold
+        }
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.duration * 1000:.1f};desc="{self.count} queries"'
+
+
+_request_queries: ContextVar[RequestQueries | None] = ContextVar(
+    "request_queries", default=None
+)
+
+
+@contextlib.contextmanager
+def record_queries():
+    """Records the statements executed within the block, in this context."""
+    queries = RequestQueries()
+    token = _request_queries.set(queries)
+    try:
+        yield queries
+    finally:
+        _request_queries.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _request_queries.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    queries = _request_queries.get()
+    if queries is None or not conn.info.get("query_start"):
+        return
+    queries.record(statement, time.perf_counter() - conn.info["query_start"].pop())
+
+
+for engine in (
+    [async_engine]
+    if async_read_engine is async_engine
+    else [async_engine, async_read_engine]
+):
+    event.listen(
+        engine.sync_engine, "after_cursor_execute", statement_cache_stats.record
+    )
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
 
 async def create_db_and_tables():
     async with async_engine.begin() as conn:
@@ -30,6 +164,11 @@ async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+async def get_async_read_session() -> AsyncGenerator[AsyncSession, None]:
+    async with async_read_session_maker() as session:
+        yield session
+
+
 async def get_user_db(session: AsyncSession = Depends(get_async_session)):
     yield SQLAlchemyUserDatabase(session, User)
 
@@ -6,3 +6,4 @@ from .utils import (
     GoCardlessInstitutionList,
 )
 from .payments import get_gocardless_payments
+from .jobs import enqueue_import, run_workers
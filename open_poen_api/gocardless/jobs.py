@@ -0,0 +1,311 @@
+"""A queue of imports in the `import_job` table, run by `open-poen worker`.
+
+Workers claim a job with `FOR UPDATE SKIP LOCKED` and lease it while it runs, so any
+number of workers in any number of processes can take jobs from the same queue. A
+job that fails is retried later with exponential backoff, and a job whose lease
+passed, because its worker stopped, is run again. At most one job per requisition is
+waiting and one is running, and `account_lock` keeps an account from being imported
+by two jobs at once.
+"""
+import asyncio
+import os
+import signal
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, exists, func, not_, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from .. import models as ent
+from ..database import async_session_maker
+from ..logger import audit_logger
+from .payments import EXCLUDED_STATUSES, process_requisition_by_id
+
+# The payments of every requisition are retrieved every N seconds.
+GOCARDLESS_IMPORT_INTERVAL = int(os.environ.get("GOCARDLESS_IMPORT_INTERVAL", 3600))
+# A running job is run again if its worker doesn't renew its lease for N seconds.
+JOB_LEASE = int(os.environ.get("JOB_LEASE", 300))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 5))
+# A failed job waits JOB_BACKOFF * 2 ** (attempts - 1) seconds, at most JOB_MAX_BACKOFF.
+JOB_BACKOFF = int(os.environ.get("JOB_BACKOFF", 60))
+JOB_MAX_BACKOFF = int(os.environ.get("JOB_MAX_BACKOFF", 3600))
+# Idle workers look for new jobs every N seconds.
+JOB_POLL_INTERVAL = 5
+# Finished jobs are removed after this long. Failed jobs are kept.
+JOB_RETENTION = timedelta(days=7)
+
+
+def get_backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(JOB_BACKOFF * 2 ** (attempts - 1), JOB_MAX_BACKOFF))
+
+
+def _queue(requisition_id: int, date_from: datetime | None, **retry):
+    """Adds a job for the requisition, or merges it into the one that is waiting
+    already. A running job isn't merged into, as it might have retrieved that period
+    already. `retry` has the attempts, run_after and last_error of a job that is
+    queued again."""
+    statement = insert(ent.ImportJob).values(
+        requisition_id=requisition_id, date_from=date_from, **retry
+    )
+    excluded = statement.excluded
+    # LEAST ignores NULL, and a job without a date_from retrieves since the last
+    # time, which is later than any date.
+    merged = {"date_from": func.least(ent.ImportJob.date_from, excluded.date_from)}
+    if retry:
+        merged |= {
+            "attempts": func.greatest(ent.ImportJob.attempts, excluded.attempts),
+            "run_after": func.least(ent.ImportJob.run_after, excluded.run_after),
+            "last_error": excluded.last_error,
+        }
+    return statement.on_conflict_do_update(
+        index_elements=[ent.ImportJob.requisition_id],
+        index_where=ent.QUEUED_JOB,
+        set_=merged,
+    )
+
+
+async def enqueue_import(
+    session: AsyncSession, requisition_id: int, date_from: datetime | None = None
+):
+    """Adds a job for the requisition, or retrieves from the earliest `date_from` if
+    one is waiting already."""
+    await session.execute(_queue(requisition_id, date_from))
+    await session.commit()
+
+
+async def enqueue_scheduled_imports(session: AsyncSession):
+    """Adds a job for every requisition that didn't have one in the last
+    `GOCARDLESS_IMPORT_INTERVAL`, and isn't running one. Safe to run from every
+    worker process."""
+    recent = exists().where(
+        ent.ImportJob.requisition_id == ent.Requisition.id,
+        or_(
+            ent.ImportJob.run_after
+            > func.now() - timedelta(seconds=GOCARDLESS_IMPORT_INTERVAL),
+            ent.ImportJob.status == ent.JobStatus.RUNNING,
+        ),
+    )
+    await session.execute(
+        insert(ent.ImportJob)
+        .from_select(
+            ["requisition_id"],
+            select(ent.Requisition.id).where(
+                not_(ent.Requisition.status.in_(EXCLUDED_STATUSES)), ~recent
+            ),
+        )
+        .on_conflict_do_nothing(
+            index_elements=[ent.ImportJob.requisition_id],
+            index_where=ent.QUEUED_JOB,
+        )
+    )
+    await session.execute(
+        delete(ent.ImportJob).where(
+            ent.ImportJob.status == ent.JobStatus.DONE,
+            ent.ImportJob.run_after < func.now() - JOB_RETENTION,
+        )
+    )
+    await session.commit()
+
+
+async def claim_job(session: AsyncSession):
+    """Leases the job that is due first, and returns its id, requisition id,
+    date_from and attempts, or None if there is none. A waiting job isn't due while
+    another job of its requisition runs."""
+    running = aliased(ent.ImportJob)
+    due = or_(
+        and_(
+            ent.ImportJob.status == ent.JobStatus.QUEUED,
+            ent.ImportJob.run_after <= func.now(),
+            ~exists().where(
+                running.requisition_id == ent.ImportJob.requisition_id,
+                running.status == ent.JobStatus.RUNNING,
+                running.leased_until >= func.now(),
+            ),
+        ),
+        and_(
+            ent.ImportJob.status == ent.JobStatus.RUNNING,
+            ent.ImportJob.leased_until < func.now(),
+        ),
+    )
+    result = await session.execute(
+        update(ent.ImportJob)
+        .where(
+            ent.ImportJob.id
+            == select(ent.ImportJob.id)
+            .where(due)
+            .order_by(ent.ImportJob.run_after)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        .values(
+            status=ent.JobStatus.RUNNING,
+            attempts=ent.ImportJob.attempts + 1,
+            leased_until=func.now() + timedelta(seconds=JOB_LEASE),
+        )
+        .returning(
+            ent.ImportJob.id,
+            ent.ImportJob.requisition_id,
+            ent.ImportJob.date_from,
+            ent.ImportJob.attempts,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    job = result.first()
+    await session.commit()
+    return job
+
+
+def _leased(job_id: int, attempts: int):
+    """The job, as long as it's still leased by the worker that claimed it for the
+    given attempt. A worker whose lease passed mustn't change a job that another
+    worker claimed since."""
+    return and_(
+        ent.ImportJob.id == job_id,
+        ent.ImportJob.status == ent.JobStatus.RUNNING,
+        ent.ImportJob.attempts == attempts,
+    )
+
+
+async def renew_lease(session: AsyncSession, job_id: int, attempts: int) -> bool:
+    """Returns whether the job was still leased."""
+    result = await session.execute(
+        update(ent.ImportJob)
+        .where(_leased(job_id, attempts))
+        .values(leased_until=func.now() + timedelta(seconds=JOB_LEASE))
+        .returning(ent.ImportJob.id)
+        .execution_options(synchronize_session=False)
+    )
+    renewed = result.first() is not None
+    await session.commit()
+    return renewed
+
+
+async def finish_job(session: AsyncSession, job_id: int, attempts: int):
+    await session.execute(
+        update(ent.ImportJob)
+        .where(_leased(job_id, attempts))
+        .values(status=ent.JobStatus.DONE, leased_until=None, last_error=None)
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+
+
+async def fail_job(session: AsyncSession, job_id: int, attempts: int, error: str):
+    """Queues the job again after a backoff, or marks it as failed after
+    `JOB_MAX_ATTEMPTS`.
+
+    A job is queued again by moving it into the waiting job of its requisition, as
+    one might have been added while it ran."""
+    if attempts >= JOB_MAX_ATTEMPTS:
+        await session.execute(
+            update(ent.ImportJob)
+            .where(_leased(job_id, attempts))
+            .values(status=ent.JobStatus.FAILED, leased_until=None, last_error=error)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        return
+    result = await session.execute(
+        delete(ent.ImportJob)
+        .where(_leased(job_id, attempts))
+        .returning(ent.ImportJob.requisition_id, ent.ImportJob.date_from)
+        .execution_options(synchronize_session=False)
+    )
+    job = result.first()
+    if job is not None:
+        await session.execute(
+            _queue(
+                job.requisition_id,
+                job.date_from,
+                attempts=attempts,
+                run_after=func.now() + get_backoff(attempts),
+                last_error=error,
+            )
+        )
+    await session.commit()
+
+
+async def run_job(job):
+    async def keep_lease():
+        while True:
+            await asyncio.sleep(JOB_LEASE / 3)
+            # A renewal that fails is tried again, there's time until the lease
+            # passes.
+            try:
+                async with async_session_maker() as session:
+                    renewed = await renew_lease(session, job.id, job.attempts)
+            except Exception:
+                audit_logger.exception(
+                    f"Renewing the lease of import job {job.id} failed."
+                )
+                continue
+            if not renewed:
+                audit_logger.warning(
+                    f"The lease of import job {job.id} passed, and it's run again elsewhere."
+                )
+                return
+
+    audit_logger.info(
+        f"Running import job {job.id} of requisition {job.requisition_id}."
+    )
+    lease = asyncio.create_task(keep_lease())
+    try:
+        locked_account_ids = await process_requisition_by_id(
+            job.requisition_id, job.date_from, set()
+        )
+    except Exception as e:
+        audit_logger.exception(f"Import job {job.id} failed.")
+        async with async_session_maker() as session:
+            await fail_job(session, job.id, job.attempts, repr(e))
+    else:
+        async with async_session_maker() as session:
+            if locked_account_ids and job.date_from is not None:
+                # The job that imports them retrieves since the last time, which
+                # can be after date_from.
+                await fail_job(
+                    session,
+                    job.id,
+                    job.attempts,
+                    f"Accounts {locked_account_ids} were being imported elsewhere.",
+                )
+            else:
+                await finish_job(session, job.id, job.attempts)
+    finally:
+        lease.cancel()
+
+
+async def sleep_until(stop: asyncio.Event, seconds: float):
+    try:
+        await asyncio.wait_for(stop.wait(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def work(stop: asyncio.Event):
+    while not stop.is_set():
+        async with async_session_maker() as session:
+            job = await claim_job(session)
+        if job is None:
+            await sleep_until(stop, JOB_POLL_INTERVAL)
+        else:
+            await run_job(job)
+
+
+async def schedule(stop: asyncio.Event):
+    while not stop.is_set():
+        async with async_session_maker() as session:
+            await enqueue_scheduled_imports(session)
+        await sleep_until(stop, min(GOCARDLESS_IMPORT_INTERVAL, 60))
+
+
+async def run_workers(concurrency: int):
+    """Runs `concurrency` jobs at once until the process is stopped, and schedules the
+    imports of all requisitions. Running jobs are finished before stopping."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop.set)
+    audit_logger.info(f"Starting {concurrency} import workers.")
+    await asyncio.gather(schedule(stop), *[work(stop) for _ in range(concurrency)])
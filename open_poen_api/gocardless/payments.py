@@ -1,16 +1,20 @@
 from .. import models as ent
-from sqlalchemy import select, and_, inspect, not_
+from sqlalchemy import select, and_, inspect, not_, update, func
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.exc import IntegrityError
-from .utils import get_nordigen_client, get_institutions
-from datetime import datetime, timedelta
+from sqlalchemy.dialects.postgresql import insert
+from .utils import get_nordigen_client, get_institutions, GoCardlessInstitutionList
+from .rate_limit import rate_limiter, RateLimited
+from nordigen import NordigenClient
+import os
+from datetime import datetime, timedelta, timezone, time
 from collections.abc import MutableMapping
 from dateutil.parser import parse
 import re
 from decimal import Decimal
 from sqlalchemy.orm import selectinload
-from asyncio import sleep
-from ..database import async_session_maker
+import asyncio
+from ..database import async_session_maker, async_engine
+from contextlib import asynccontextmanager
 from ..logger import audit_logger
 from .payment_schema import Payment, AccountMetadata, AccountDetails
 from typing import Sequence
@@ -18,6 +22,18 @@ from aiohttp import ClientResponseError
 
 # Retrieve payments in chunks of N days.
 PAYMENT_RETRIEVAL_INTERVAL = 14
+# Insert at most N payments per statement, to stay below the maximum number of
+# parameters of a statement.
+PAYMENT_INSERT_BATCH_SIZE = 1000
+# Scheduled runs retrieve the payments of an account from N days before the last day
+# that was retrieved, for payments that are booked late, or from N days ago for
+# accounts that were never retrieved.
+GOCARDLESS_SYNC_OVERLAP_DAYS = int(os.environ.get("GOCARDLESS_SYNC_OVERLAP_DAYS", 3))
+GOCARDLESS_INITIAL_SYNC_DAYS = int(os.environ.get("GOCARDLESS_INITIAL_SYNC_DAYS", 7))
+# Process at most N requisitions at once. All of them share the same rate limit.
+GOCARDLESS_CONCURRENCY = int(os.environ.get("GOCARDLESS_CONCURRENCY", 4))
+# Namespace of the advisory locks on accounts that are being imported.
+ACCOUNT_LOCK_NAMESPACE = 1
 # Don't process requisitions with these statuses. Requisitions with
 # statuses will never again become valid for payment retrieval.
 EXCLUDED_STATUSES = [
@@ -52,26 +68,209 @@ def should_be_skipped(
         return False
 
 
-async def process_requisition(
+async def save_payments(
+    session: AsyncSession, account: ent.BankAccount, payments: list[Payment]
+) -> tuple[int, int]:
+    """Inserts the payments that aren't in the database yet, in batches, and returns
+    the numbers of imported and skipped payments.
+
+    This bypasses the ORM, so the totals of parents aren't maintained. New payments
+    aren't linked to initiatives, activities or debit cards, so they don't change any,
+    nor any cached finance series.
+    """
+    rows = [
+        {**payment.to_dict(), "bank_account_id": account.id} for payment in payments
+    ]
+    imported = 0
+    for start in range(0, len(rows), PAYMENT_INSERT_BATCH_SIZE):
+        result = await session.execute(
+            insert(ent.Payment)
+            .values(rows[start : start + PAYMENT_INSERT_BATCH_SIZE])
+            .on_conflict_do_nothing(index_elements=[ent.Payment.transaction_id])
+            .returning(ent.Payment.id)
+        )
+        imported += len(result.all())
+    await session.commit()
+    return imported, len(rows) - imported
+
+
+@asynccontextmanager
+async def account_lock(account_api_id: str):
+    """Yields whether the account could be locked, so that it isn't imported by two
+    processes at once. The lock is held by a connection of its own, so it's released
+    when the process stops, and it covers accounts that aren't saved yet."""
+    key = (ACCOUNT_LOCK_NAMESPACE, func.hashtext(account_api_id))
+    async with async_engine.connect() as connection:
+        locked = await connection.scalar(select(func.pg_try_advisory_lock(*key)))
+        try:
+            yield locked
+        finally:
+            if locked:
+                await connection.scalar(select(func.pg_advisory_unlock(*key)))
+
+
+def get_sync_start(account: ent.BankAccount, date_from: datetime | None) -> datetime:
+    if date_from is not None:
+        return date_from
+    if account.synced_until is None:
+        return datetime.combine(
+            datetime.today() - timedelta(days=GOCARDLESS_INITIAL_SYNC_DAYS), time()
+        )
+    return datetime.combine(
+        account.synced_until - timedelta(days=GOCARDLESS_SYNC_OVERLAP_DAYS), time()
+    )
+
+
+async def process_account(
     session: AsyncSession,
+    client: NordigenClient,
+    institutions: GoCardlessInstitutionList,
     requisition: ent.Requisition,
-    date_from: datetime,
+    account_api_id: str,
+    date_from: datetime | None,
     processed_accounts: set[str],
 ):
+    expiration_date_q = await session.execute(
+        select(ent.BankAccount.expiration_date).where(
+            ent.BankAccount.api_account_id == account_api_id
+        )
+    )
+    expiration_date = expiration_date_q.scalars().first()
+    if expiration_date is not None and expiration_date < datetime.now(timezone.utc):
+        audit_logger.info(
+            f"Skipping account with id {account_api_id} because its access expired on {expiration_date}."
+        )
+        return
+
+    api_account = client.account_api(account_api_id)
+    metadata = await rate_limiter.call(api_account.get_metadata)
+    parsed_metadata = AccountMetadata(**metadata)
+    details = await rate_limiter.call(api_account.get_details)
+    parsed_details = AccountDetails(**details)
+
+    if parsed_metadata.id is None:
+        audit_logger.info(
+            f"Skipping account with id {account_api_id} because its parsed metadata id is None."
+        )
+        return
+
+    account_q = await session.execute(
+        select(ent.BankAccount)
+        .where(ent.BankAccount.api_account_id == parsed_metadata.id)
+        .options(
+            selectinload(ent.BankAccount.requisitions),
+            selectinload(ent.BankAccount.user_roles).selectinload(
+                ent.UserBankAccountRole.user
+            ),
+            selectinload(ent.BankAccount.owner_role).selectinload(
+                ent.UserBankAccountRole.user
+            ),
+        )
+    )
+    account = account_q.scalars().first()
+
+    if should_be_skipped(account, account_api_id, parsed_metadata, processed_accounts):
+        return
+
+    if not account:
+        account = ent.BankAccount(
+            api_account_id=parsed_metadata.id,
+            iban=parsed_metadata.iban,
+            name=parsed_details.get_name(),
+            created=parsed_metadata.created,
+            last_accessed=parsed_metadata.last_accessed,
+            institution_id=parsed_metadata.institution_id,
+            institution_name=institutions.get_name(metadata["institution_id"]),
+            institution_logo=institutions.get_logo(metadata["institution_id"]),
+            requisitions=[requisition],
+        )
+        session.add(account)
+        await session.commit()
+        await session.refresh(account)
+        new_role = ent.UserBankAccountRole(
+            user_id=requisition.user_id,
+            bank_account_id=account.id,
+            role=ent.BankAccountRole.OWNER,
+        )
+        session.add(new_role)
+        await session.commit()
+    else:
+        if requisition.user is not account.owner:
+            # In this case a third user requisitioned this bank account earlier.
+            requisition.status = ent.ReqStatus.CONFLICTED
+            await session.commit()
+        if requisition not in account.requisitions:
+            account.requisitions.append(requisition)
+        account.last_accessed = parsed_metadata.last_accessed
+        await session.commit()
+
+    date_to = datetime.now()
+    cur_start_date = get_sync_start(account, date_from)
+    async with async_session_maker() as payment_session:
+        while cur_start_date < date_to:
+            cur_end_date = min(
+                cur_start_date + timedelta(days=PAYMENT_RETRIEVAL_INTERVAL), date_to
+            )
+            audit_logger.info(
+                f"Retrieving payments for user {requisition.user} with period {cur_start_date.strftime('%Y-%m-%d')} till {cur_end_date.strftime('%Y-%m-%d')}."
+            )
+            api_transactions = await rate_limiter.call(
+                api_account.get_transactions,
+                date_from=cur_start_date.strftime("%Y-%m-%d"),
+                date_to=cur_end_date.strftime("%Y-%m-%d"),
+            )
+
+            parsed_payments = []
+            for payment in api_transactions["transactions"]["booked"]:
+                parsed_payment = Payment(**payment)
+                if parsed_payment.transaction_id is None:
+                    audit_logger.warning(
+                        f"Skipping a parsed payment {parsed_payment} because its transaction_id is None."
+                    )
+                    continue
+                parsed_payments.append(parsed_payment)
+            # Committed with the payments, so that a run that stops resumes after
+            # the last window that was saved. Retrieving older payments again
+            # doesn't move it back.
+            await payment_session.execute(
+                update(ent.BankAccount)
+                .where(ent.BankAccount.id == account.id)
+                .values(
+                    synced_until=func.greatest(
+                        ent.BankAccount.synced_until, cur_end_date.date()
+                    )
+                )
+            )
+            imported, skipped = await save_payments(
+                payment_session, account, parsed_payments
+            )
+
+            audit_logger.info(f"Retrieved {imported} and skipped {skipped} payments.")
+            cur_start_date = cur_end_date + timedelta(days=1)
+
+
+async def process_requisition(
+    session: AsyncSession,
+    requisition: ent.Requisition,
+    date_from: datetime | None,
+    processed_accounts: set[str],
+) -> list[str]:
+    """Retrieves the payments of the accounts of `requisition` from `date_from`, or
+    since they were last retrieved if it's None. Returns the ids of the accounts
+    that were skipped because they were being imported elsewhere."""
     client = await get_nordigen_client()
     institutions = await get_institutions()
 
     try:
-        api_requisition = await client.requisition.get_requisition_by_id(
-            requisition.api_requisition_id
+        api_requisition = await rate_limiter.call(
+            client.requisition.get_requisition_by_id, requisition.api_requisition_id
         )
     except ClientResponseError as e:
         if e.status == 404:
             audit_logger.info(f"Requisition not found for {requisition}.")
-            return
+            return []
         else:
             raise
-    await sleep(0.5)
 
     requisition.status = ent.ReqStatus(api_requisition["status"])
     await session.commit()
@@ -80,156 +279,105 @@ async def process_requisition(
         audit_logger.info(
             f"Skipping {requisition} because of its status {requisition.status}."
         )
-        return
+        return []
 
+    locked_account_ids = []
     for account_api_id in api_requisition["accounts"]:
-        api_account = client.account_api(account_api_id)
-        metadata = await api_account.get_metadata()
-        parsed_metadata = AccountMetadata(**metadata)
-        await sleep(0.5)
-        details = await api_account.get_details()
-        parsed_details = AccountDetails(**details)
-        await sleep(0.5)
-
-        if parsed_metadata.id is None:
-            audit_logger.info(
-                f"Skipping account with id {account_api_id} because its parsed metadata id is None."
-            )
-            continue
-
-        account_q = await session.execute(
-            select(ent.BankAccount)
-            .where(ent.BankAccount.api_account_id == parsed_metadata.id)
-            .options(
-                selectinload(ent.BankAccount.requisitions),
-                selectinload(ent.BankAccount.user_roles).selectinload(
-                    ent.UserBankAccountRole.user
-                ),
-                selectinload(ent.BankAccount.owner_role).selectinload(
-                    ent.UserBankAccountRole.user
-                ),
+        try:
+            async with account_lock(account_api_id) as locked:
+                if not locked:
+                    audit_logger.info(
+                        f"Skipping account with id {account_api_id} because it's being imported elsewhere."
+                    )
+                    locked_account_ids.append(account_api_id)
+                    continue
+                await process_account(
+                    session,
+                    client,
+                    institutions,
+                    requisition,
+                    account_api_id,
+                    date_from,
+                    processed_accounts,
+                )
+        except RateLimited as e:
+            audit_logger.warning(
+                f"Skipping account with id {account_api_id} of {requisition}: {e}"
             )
+    return locked_account_ids
+
+
+async def process_requisition_by_id(
+    requisition_id: int,
+    date_from: datetime | None,
+    processed_accounts: set[str],
+) -> list[str]:
+    # Every requisition has its own session, as a session can't be used by several
+    # tasks at once.
+    async with async_session_maker() as session:
+        requisition_q = await session.execute(
+            select(ent.Requisition)
+            .options(selectinload(ent.Requisition.user))
+            .where(ent.Requisition.id == requisition_id)
         )
-        account = account_q.scalars().first()
-
-        if should_be_skipped(
-            account, account_api_id, parsed_metadata, processed_accounts
-        ):
-            continue
-
-        if not account:
-            account = ent.BankAccount(
-                api_account_id=parsed_metadata.id,
-                iban=parsed_metadata.iban,
-                name=parsed_details.get_name(),
-                created=parsed_metadata.created,
-                last_accessed=parsed_metadata.last_accessed,
-                institution_id=parsed_metadata.institution_id,
-                institution_name=institutions.get_name(metadata["institution_id"]),
-                institution_logo=institutions.get_logo(metadata["institution_id"]),
-                requisitions=[requisition],
+        requisition = requisition_q.scalars().one()
+        if requisition.status in EXCLUDED_STATUSES:
+            audit_logger.info(
+                f"Skipping {requisition} because of its status {requisition.status}."
             )
-            session.add(account)
-            await session.commit()
-            await session.refresh(account)
-            new_role = ent.UserBankAccountRole(
-                user_id=requisition.user_id,
-                bank_account_id=account.id,
-                role=ent.BankAccountRole.OWNER,
+            return []
+        try:
+            return await process_requisition(
+                session, requisition, date_from, processed_accounts
             )
-            session.add(new_role)
-            await session.commit()
-        else:
-            if requisition.user is not account.owner:
-                # In this case a third user requisitioned this bank account earlier.
-                requisition.status = ent.ReqStatus.CONFLICTED
-                await session.commit()
-            if requisition not in account.requisitions:
-                account.requisitions.append(requisition)
-            account.last_accessed = parsed_metadata.last_accessed
-            await session.commit()
-
-        date_to = datetime.now()
-        cur_start_date = date_from
-        async with async_session_maker() as payment_session:
-            while cur_start_date < date_to:
-                cur_end_date = min(
-                    cur_start_date + timedelta(days=PAYMENT_RETRIEVAL_INTERVAL), date_to
-                )
-                audit_logger.info(
-                    f"Retrieving payments for user {requisition.user} with period {cur_start_date.strftime('%Y-%m-%d')} till {cur_end_date.strftime('%Y-%m-%d')}."
-                )
-                api_transactions = await api_account.get_transactions(
-                    date_from=cur_start_date.strftime("%Y-%m-%d"),
-                    date_to=cur_end_date.strftime("%Y-%m-%d"),
-                )
-                await sleep(0.5)
-
-                skipped, imported = 0, 0
-                for payment in api_transactions["transactions"]["booked"]:
-                    parsed_payment = Payment(**payment)
-                    if parsed_payment.transaction_id is None:
-                        audit_logger.warning(
-                            f"Skipping a parsed payment {parsed_payment} because its transaction_id is None."
-                        )
-                        continue
-                    new_payment = ent.Payment(
-                        **parsed_payment.to_dict(),
-                        bank_account_id=account.id,
-                    )
-
-                    payment_session.add(new_payment)
-                    try:
-                        await payment_session.commit()
-                    except IntegrityError as e:
-                        if "unique transaction id" in str(e):
-                            audit_logger.info(
-                                f"Skipping a parsed payment because its transaction_id {parsed_payment.transaction_id} is already in the database."
-                            )
-                        await payment_session.rollback()
-                        skipped += 1
-                        continue
-                    imported += 1
-
-                audit_logger.info(
-                    f"Retrieved {imported} and skipped {skipped} payments."
-                )
-                cur_start_date = cur_end_date + timedelta(days=1)
+        except Exception:
+            audit_logger.exception(f"Processing {requisition} failed.")
+            raise
 
 
 async def get_gocardless_payments(
     requisition_id: int | None = None,
-    date_from: datetime = datetime.today() - timedelta(days=7),
+    date_from: datetime | None = None,
 ):
+    # Claiming an account in `should_be_skipped` doesn't await, so it's safe for
+    # the concurrent tasks to share this set.
     processed_accounts: set[str] = set()
 
     async with async_session_maker() as session:
         if requisition_id is not None:
             requisition_q = await session.execute(
-                select(ent.Requisition)
-                .options(
-                    selectinload(ent.Requisition.user),
-                )
-                .where(
+                select(ent.Requisition.id).where(
                     and_(
                         ent.Requisition.id == requisition_id,
                         not_(ent.Requisition.status.in_(EXCLUDED_STATUSES)),
                     )
                 )
             )
-            requisition = requisition_q.scalars().first()
-            if not requisition:
+            requisition_ids: Sequence = requisition_q.scalars().all()
+            if len(requisition_ids) == 0:
                 raise ValueError("No valid Requisition found")
-            requisitions: Sequence = [requisition]
         elif requisition_id is None:
             requisition_q = await session.execute(
-                select(ent.Requisition)
-                .options(selectinload(ent.Requisition.user))
-                .where(not_(ent.Requisition.status.in_(EXCLUDED_STATUSES)))
+                select(ent.Requisition.id).where(
+                    not_(ent.Requisition.status.in_(EXCLUDED_STATUSES))
+                )
             )
-            requisitions = requisition_q.scalars().all()
+            requisition_ids = requisition_q.scalars().all()
         else:
             raise ValueError()
 
-        for i in requisitions:
-            await process_requisition(session, i, date_from, processed_accounts)
+    semaphore = asyncio.Semaphore(GOCARDLESS_CONCURRENCY)
+
+    async def process(requisition_id: int):
+        async with semaphore:
+            await process_requisition_by_id(
+                requisition_id, date_from, processed_accounts
+            )
+
+    results = await asyncio.gather(
+        *[process(i) for i in requisition_ids], return_exceptions=True
+    )
+    # A failing requisition doesn't stop the others, but the run still fails.
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
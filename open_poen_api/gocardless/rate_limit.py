@@ -0,0 +1,110 @@
+import asyncio
+import os
+from aiohttp import ClientResponseError
+from ..logger import audit_logger
+
+# Requests per second to GoCardless, and how many can be made at once after a
+# quiet period.
+GOCARDLESS_REQUEST_RATE = float(os.environ.get("GOCARDLESS_REQUEST_RATE", 2))
+GOCARDLESS_REQUEST_BURST = int(os.environ.get("GOCARDLESS_REQUEST_BURST", 4))
+# Rate limited requests are retried if GoCardless asks to wait at most this many
+# seconds. Longer waits, like those of the daily limits per account, aren't.
+GOCARDLESS_MAX_RETRY_WAIT = float(os.environ.get("GOCARDLESS_MAX_RETRY_WAIT", 60))
+GOCARDLESS_MAX_RETRIES = 3
+
+# Headers with the number of seconds until the limit resets, in order of preference.
+RESET_HEADERS = (
+    "Retry-After",
+    "HTTP_X_RATELIMIT_RESET",
+    "X-RateLimit-Reset",
+    "HTTP_X_RATELIMIT_ACCOUNT_SUCCESS_RESET",
+    "X-RateLimit-Account-Success-Reset",
+)
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float | None):
+        self.retry_after = retry_after
+        super().__init__(f"Rate limited by GoCardless, retry after {retry_after}s.")
+
+
+def get_retry_after(e: ClientResponseError) -> tuple[float | None, bool]:
+    """The seconds to wait according to the headers of a 429 response, and whether
+    the limit is of a single account rather than of all requests."""
+    headers = e.headers or {}
+    for header in RESET_HEADERS:
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            return float(value), "account" in header.lower()
+        except ValueError:
+            continue
+    return None, False
+
+
+class TokenBucket:
+    """Limits the requests to GoCardless of all tasks in the process to `rate` per
+    second. A rate limited response pauses all requests for as long as GoCardless
+    asks, instead of every task finding out by itself."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at: float | None = None
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                if self.updated_at is not None:
+                    self.tokens = min(
+                        self.capacity,
+                        self.tokens + (now - self.updated_at) * self.rate,
+                    )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        loop = asyncio.get_running_loop()
+        self.paused_until = max(self.paused_until, loop.time() + seconds)
+        self.tokens = 0
+
+    async def call(self, function, *args, **kwargs):
+        """Awaits `function` when the limit allows it, and retries it if it's rate
+        limited anyway. Raises `RateLimited` if it can't be retried soon enough."""
+        for attempt in range(GOCARDLESS_MAX_RETRIES + 1):
+            await self.acquire()
+            try:
+                return await function(*args, **kwargs)
+            except ClientResponseError as e:
+                if e.status != 429:
+                    raise
+                retry_after, per_account = get_retry_after(e)
+                wait = retry_after if retry_after is not None else 2**attempt
+                if (
+                    wait > GOCARDLESS_MAX_RETRY_WAIT
+                    or attempt == GOCARDLESS_MAX_RETRIES
+                ):
+                    raise RateLimited(retry_after) from e
+                audit_logger.warning(
+                    f"Rate limited by GoCardless, retrying in {wait} seconds."
+                )
+                if per_account:
+                    # Other accounts can go on.
+                    await asyncio.sleep(wait)
+                else:
+                    self.pause(wait)
+
+
+rate_limiter = TokenBucket(GOCARDLESS_REQUEST_RATE, GOCARDLESS_REQUEST_BURST)
@@ -4,3 +4,4 @@ logging.basicConfig(
     level=logging.INFO, format="%(levelname)s :: %(name)s :: %(message)s"
 )
 audit_logger = logging.getLogger("audit")
+sql_logger = logging.getLogger("sql")
@@ -13,4 +13,4 @@ from .regulation_manager import RegulationManager
 from .grant_manager import GrantManager
 from .bank_account_manager import BankAccountManager
 from .payment_manager import PaymentManager
-from .base_manager import BaseManager
+from .base_manager import BaseManager, reading
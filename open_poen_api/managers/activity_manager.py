@@ -9,6 +9,7 @@ from sqlalchemy.orm import selectinload
 from ..exc import EntityNotFound, raise_err_if_unique_constraint
 from .base_manager import BaseManager
 from .handlers import ProfilePictureHandler
+from .visibility import refresh_visible_initiatives
 from .user_manager.user_manager_ex_current_user import optional_login
 
 
@@ -54,7 +55,15 @@ class ActivityManager(BaseManager):
     async def delete(
         self, activity: ent.Activity, request: Request | None = None
     ) -> None:
-        await self.crud.delete(activity, request)
+        owner_ids_q = await self.session.execute(
+            select(ent.UserActivityRole.user_id).where(
+                ent.UserActivityRole.activity_id == activity.id
+            )
+        )
+        owner_ids = owner_ids_q.scalars().all()
+        await self.crud.delete(activity, request, commit=False)
+        await refresh_visible_initiatives(self.session, owner_ids)
+        await self.session.commit()
 
     async def make_users_owner(
         self,
@@ -89,23 +98,27 @@ class ActivityManager(BaseManager):
             new_role = ent.UserActivityRole(user_id=user_id, activity_id=activity.id)
             self.session.add(new_role)
 
+        await self.session.flush()
+        await refresh_visible_initiatives(self.session, unlink_user_ids | link_user_ids)
         await self.session.commit()
         return activity
 
+    def _detail_q(self):
+        return select(ent.Activity).options(
+            selectinload(ent.Activity.user_roles).joinedload(ent.UserActivityRole.user),
+        )
+
     async def detail_load(self, activity_id: int):
         query_result_q = await self.session.execute(
-            select(ent.Activity)
-            .options(
-                selectinload(ent.Activity.user_roles).joinedload(
-                    ent.UserActivityRole.user
-                ),
-            )
-            .where(ent.Activity.id == activity_id)
+            self._detail_q().where(ent.Activity.id == activity_id)
         )
         query_result = query_result_q.scalars().first()
         if query_result is None:
             raise EntityNotFound(message="Activity not found")
         return query_result
 
+    async def detail_load_many(self, ids: list[int]) -> list[ent.Activity]:
+        return await self.load.many_load(self._detail_q(), ent.Activity, ids)
+
     async def min_load(self, activity_id: int) -> ent.Activity:
         return await self.load.min_load(ent.Activity, activity_id)
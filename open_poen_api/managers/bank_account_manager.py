@@ -13,6 +13,8 @@ from ..database import get_async_session
 from .user_manager.user_manager_ex_current_user import optional_login
 from aiohttp import ClientResponseError
 from ..logger import audit_logger
+from ..aggregates import PAYMENT_PARENTS, deferred_finance_aggregates
+from ..utils.finance_cache import invalidate_finance_cache
 from sqlalchemy import func
 
 
@@ -45,22 +47,29 @@ class BankAccountManager(BaseManager):
             self.session.add(req)
         await self.session.commit()
 
-        await self.session.execute(
-            delete(ent.Payment).where(
-                and_(
-                    ent.Payment.bank_account_id.in_(
-                        select(ent.BankAccount.id)
-                        .join(ent.BankAccount.requisitions)
-                        .group_by(ent.BankAccount.id)
-                        .having(
-                            func.every(ent.Requisition.status == ent.ReqStatus.REVOKED)
-                        )
-                    ),
-                    ent.Payment.initiative_id == None,
+        async with deferred_finance_aggregates(self.session) as parents:
+            deleted = await self.session.execute(
+                delete(ent.Payment)
+                .where(
+                    and_(
+                        ent.Payment.bank_account_id.in_(
+                            select(ent.BankAccount.id)
+                            .join(ent.BankAccount.requisitions)
+                            .group_by(ent.BankAccount.id)
+                            .having(
+                                func.every(
+                                    ent.Requisition.status == ent.ReqStatus.REVOKED
+                                )
+                            )
+                        ),
+                        ent.Payment.initiative_id == None,
+                    )
                 )
+                .returning(*[getattr(ent.Payment, i) for i in PAYMENT_PARENTS])
             )
-        )
-        await self.session.commit()
+            # Only unlinked payments, which aren't in any finance series.
+            parents.add_payments(deleted)
+            await self.session.commit()
         await self.session.refresh(bank_account)
         return bank_account
 
@@ -84,28 +93,34 @@ class BankAccountManager(BaseManager):
 
         # TODO: Make sure an error is returned if there are payments for this bank
         # account that are coupled to a finished or justified activity or initiative.
-        await self.session.execute(
-            delete(ent.Payment).where(
-                ent.Payment.bank_account_id == bank_account.id,
-                or_(
-                    ent.Payment.initiative_id == None,
-                    and_(
-                        ent.Payment.initiative_id != None,
-                        ent.Payment.initiative.has(ent.Initiative.justified == False),
+        async with deferred_finance_aggregates(self.session) as parents:
+            deleted = await self.session.execute(
+                delete(ent.Payment)
+                .where(
+                    ent.Payment.bank_account_id == bank_account.id,
+                    or_(
+                        ent.Payment.initiative_id == None,
+                        and_(
+                            ent.Payment.initiative_id != None,
+                            ent.Payment.initiative.has(
+                                ent.Initiative.justified == False
+                            ),
+                        ),
                     ),
-                ),
-                or_(
-                    ent.Payment.activity_id == None,
-                    and_(
-                        ent.Payment.activity_id != None,
-                        ent.Payment.activity.has(ent.Activity.finished == False),
+                    or_(
+                        ent.Payment.activity_id == None,
+                        and_(
+                            ent.Payment.activity_id != None,
+                            ent.Payment.activity.has(ent.Activity.finished == False),
+                        ),
                     ),
-                ),
+                )
+                .returning(*[getattr(ent.Payment, i) for i in PAYMENT_PARENTS])
             )
-        )
-
-        await self.session.delete(bank_account)
-        await self.session.commit()
+            parents.add_payments(deleted)
+            invalidate_finance_cache(self.session, parents.ids.get(ent.Initiative, ()))
+            await self.session.delete(bank_account)
+            await self.session.commit()
 
     async def make_users_user(
         self,
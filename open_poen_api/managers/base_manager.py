@@ -1,5 +1,6 @@
 from fastapi import Depends
-from ..database import get_async_session, AsyncSession
+from functools import cache
+from ..database import get_async_session, get_async_read_session, AsyncSession
 from .user_manager.user_manager_ex_current_user import optional_login
 from ..models import User
 from .bases import BaseLogger, BaseCRUD, BaseLoad
@@ -16,3 +17,16 @@ class BaseManager:
         self.load = BaseLoad(session)
         self.session = session
         self.current_user = current_user
+
+
+@cache
+def reading(manager_class):
+    """Dependency for a manager on the read session, for endpoints that only read."""
+
+    def dependency(
+        session: AsyncSession = Depends(get_async_read_session),
+        current_user: User | None = Depends(optional_login),
+    ):
+        return manager_class(session, current_user)
+
+    return dependency
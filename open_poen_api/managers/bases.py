@@ -6,6 +6,8 @@ from pydantic import BaseModel
 from fastapi import Request
 from ..logger import audit_logger
 from typing import Dict, Any
+from sqlalchemy import Select
+from ..visibility import in_ids
 
 T = TypeVar("T", bound=Base)
 
@@ -35,16 +37,25 @@ class BaseCRUD:
         self.current_user = current_user
         self.logger = BaseLogger(current_user)
 
+    async def _commit(self, commit: bool) -> None:
+        if commit:
+            await self.session.commit()
+        else:
+            await self.session.flush()
+
     async def create(
         self,
         entity_create: BaseModel,
         db_model: Type[T],
         request: Request | None = None,
+        commit: bool = True,
         **kwargs,
     ) -> T:
+        """With `commit=False` the entity is only flushed, so that the caller can
+        make more changes in the same transaction before committing."""
         entity = db_model(**entity_create.dict(), **kwargs)
         self.session.add(entity)
-        await self.session.commit()
+        await self._commit(commit)
         await self.logger.after_create(entity, request)
         return entity
 
@@ -59,9 +70,11 @@ class BaseCRUD:
         await self.logger.after_update(db_entity, update_dict, request)
         return db_entity
 
-    async def delete(self, entity: T, request: Request | None = None) -> None:
+    async def delete(
+        self, entity: T, request: Request | None = None, commit: bool = True
+    ) -> None:
         await self.session.delete(entity)
-        await self.session.commit()
+        await self._commit(commit)
         await self.logger.after_delete(entity, request)
 
 
@@ -74,3 +87,13 @@ class BaseLoad:
         if query_result is None:
             raise EntityNotFound(message=f"{db_model.__name__} not found")
         return query_result
+
+    async def many_load(
+        self, query: Select, db_model: Type[T], ids: list[int]
+    ) -> list[T]:
+        """Runs the detail query of a manager for a list of ids at once, so that every
+        relationship is loaded with one query for all of them. Returns the entities in
+        the order of `ids` and leaves out ids that don't exist."""
+        query_result = await self.session.execute(query.where(in_ids(db_model.id, ids)))
+        by_id = {i.id: i for i in query_result.scalars().unique().all()}
+        return [by_id[i] for i in ids if i in by_id]
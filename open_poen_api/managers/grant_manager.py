@@ -1,4 +1,5 @@
 from .base_manager import BaseManager
+from .visibility import refresh_visible_initiatives
 from ..schemas import GrantCreate, GrantUpdate
 from .. import models as ent
 from fastapi import Request
@@ -73,6 +74,8 @@ class GrantManager(BaseManager):
             new_role = ent.UserGrantRole(user_id=user_id, grant_id=grant.id)
             self.session.add(new_role)
 
+        await self.session.flush()
+        await refresh_visible_initiatives(self.session, unlink_user_ids | link_user_ids)
         await self.session.commit()
         return grant
 
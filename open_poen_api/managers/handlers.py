@@ -9,6 +9,8 @@ from ..models import (
 )
 from typing import TypeVar, Generic
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, inspect, update
+from sqlalchemy.orm.attributes import set_committed_value
 from ..utils.utils import upload_attachment, AttachmentUpdate
 from .base_manager import BaseManager
 import datetime
@@ -121,6 +123,7 @@ class AttachmentHandler(BaseManager, Generic[V]):
             )
 
             attachment = assign_attachment_urls(attachment, au)
+            await self.update_attachment_count(db_entity, 1)
 
             await self.crud.session.commit()
             await self.logger.after_update(
@@ -128,16 +131,43 @@ class AttachmentHandler(BaseManager, Generic[V]):
             )
 
     async def delete(self, db_entity: V, attachment_id: int, request: Request) -> None:
-        was_deleted = False
-        for attachment in db_entity.attachments:
-            if attachment.id == attachment_id:
-                await self.crud.session.delete(attachment)
-                was_deleted = True
-
-        if not was_deleted:
+        # The count is decremented by the rows that this delete removed, so that two
+        # concurrent deletes of the same attachment only decrement it once.
+        result = await self.crud.session.execute(
+            delete(Attachment)
+            .where(
+                Attachment.id == attachment_id,
+                Attachment.entity_id == db_entity.id,
+                Attachment.entity_type == self.entity_type,
+                Attachment.attachment_type.in_(
+                    [AttachmentAttachmentType.PICTURE, AttachmentAttachmentType.PDF]
+                ),
+            )
+            .returning(Attachment.id)
+        )
+        n_deleted = len(result.all())
+        if n_deleted == 0:
             raise EntityNotFound("Attachment not found")
+        if "attachments" in inspect(db_entity).dict:
+            set_committed_value(
+                db_entity,
+                "attachments",
+                [i for i in db_entity.attachments if i.id != attachment_id],
+            )
 
+        await self.update_attachment_count(db_entity, -n_deleted)
         await self.crud.session.commit()
         await self.logger.after_update(
             db_entity, {"attachment": "deleted"}, request=request
         )
+
+    async def update_attachment_count(self, db_entity: V, delta: int) -> None:
+        # Increment in SQL so concurrent uploads don't overwrite each other's count.
+        # The evaluated synchronization keeps the loaded entity in sync as well.
+        entity_class = type(db_entity)
+        await self.crud.session.execute(
+            update(entity_class)
+            .where(entity_class.id == db_entity.id)
+            .values(n_attachments=entity_class.n_attachments + delta)
+            .execution_options(synchronize_session="evaluate")
+        )
@@ -8,6 +8,10 @@ from sqlalchemy import select
 from sqlalchemy.orm import selectinload, joinedload
 from .base_manager import BaseManager
 from .handlers import ProfilePictureHandler
+from .visibility import (
+    refresh_visible_initiatives,
+    refresh_visible_initiatives_for_grant,
+)
 from .user_manager.user_manager_ex_current_user import optional_login
 from ..database import get_async_session
 
@@ -31,11 +35,19 @@ class InitiativeManager(BaseManager):
     ) -> ent.Initiative:
         try:
             initiative = await self.crud.create(
-                initiative_create, ent.Initiative, request, grant_id=grant_id
+                initiative_create,
+                ent.Initiative,
+                request,
+                commit=False,
+                grant_id=grant_id,
             )
         except IntegrityError as e:
             raise_err_if_unique_constraint("unique initiative name", e)
             raise
+        # In the same transaction, so that the overseers and officers of the grant
+        # never miss the initiative.
+        await refresh_visible_initiatives_for_grant(self.session, grant_id)
+        await self.session.commit()
         return initiative
 
     async def update(
@@ -93,6 +105,8 @@ class InitiativeManager(BaseManager):
             )
             self.session.add(new_role)
 
+        await self.session.flush()
+        await refresh_visible_initiatives(self.session, unlink_user_ids | link_user_ids)
         await self.session.commit()
         return initiative
 
@@ -159,22 +173,26 @@ class InitiativeManager(BaseManager):
         await self.session.commit()
         return initiative
 
+    def _detail_q(self):
+        return select(ent.Initiative).options(
+            selectinload(ent.Initiative.user_roles).joinedload(
+                ent.UserInitiativeRole.user
+            ),
+            selectinload(ent.Initiative.activities),
+            joinedload(ent.Initiative.profile_picture),
+        )
+
     async def detail_load(self, id: int):
         query_result_q = await self.session.execute(
-            select(ent.Initiative)
-            .options(
-                selectinload(ent.Initiative.user_roles).joinedload(
-                    ent.UserInitiativeRole.user
-                ),
-                selectinload(ent.Initiative.activities),
-                joinedload(ent.Initiative.profile_picture),
-            )
-            .where(ent.Initiative.id == id)
+            self._detail_q().where(ent.Initiative.id == id)
         )
         query_result = query_result_q.scalars().first()
         if query_result is None:
             raise EntityNotFound(message="Initiative not found")
         return query_result
 
+    async def detail_load_many(self, ids: list[int]) -> list[ent.Initiative]:
+        return await self.load.many_load(self._detail_q(), ent.Initiative, ids)
+
     async def min_load(self, initiative_id: int):
         return await self.load.min_load(ent.Initiative, initiative_id)
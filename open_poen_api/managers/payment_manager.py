@@ -10,7 +10,6 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from ..database import get_async_session
 from .user_manager import optional_login
 from sqlalchemy.orm import selectinload
-from decimal import Decimal
 
 
 class PaymentManager(BaseManager):
@@ -62,12 +61,6 @@ class PaymentManager(BaseManager):
         initiative_id: int | None,
         request: Request | None = None,
     ) -> ent.Payment:
-        # https://github.com/kvesteri/sqlalchemy-utils/issues/345
-        old_transaction_amount = payment.transaction_amount
-        payment.transaction_amount = Decimal("0.00")
-        self.session.add(payment)
-        await self.session.commit()
-        payment.transaction_amount = old_transaction_amount
         payment.initiative_id = initiative_id
         self.session.add(payment)
         await self.session.commit()
@@ -82,12 +75,6 @@ class PaymentManager(BaseManager):
         activity_id: int | None,
         request: Request | None = None,
     ) -> ent.Payment:
-        # https://github.com/kvesteri/sqlalchemy-utils/issues/345
-        old_transaction_amount = payment.transaction_amount
-        payment.transaction_amount = Decimal("0.00")
-        self.session.add(payment)
-        await self.session.commit()
-        payment.transaction_amount = old_transaction_amount
         payment.activity_id = activity_id
         self.session.add(payment)
         await self.session.commit()
@@ -96,14 +83,20 @@ class PaymentManager(BaseManager):
         )
         return payment
 
+    def _detail_q(self):
+        return select(ent.Payment)
+
     async def detail_load(self, id: int):
         query_result_q = await self.session.execute(
-            select(ent.Payment).where(ent.Payment.id == id)
+            self._detail_q().where(ent.Payment.id == id)
         )
         query_result = query_result_q.scalars().first()
         if query_result is None:
             raise EntityNotFound(message="Payment not found")
         return query_result
 
+    async def detail_load_many(self, ids: list[int]) -> list[ent.Payment]:
+        return await self.load.many_load(self._detail_q(), ent.Payment, ids)
+
     async def min_load(self, payment_id: int):
         return await self.load.min_load(ent.Payment, payment_id)
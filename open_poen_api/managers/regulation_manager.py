@@ -1,4 +1,5 @@
 from .base_manager import BaseManager
+from .visibility import refresh_visible_initiatives
 from ..schemas import RegulationCreate, RegulationUpdate
 from .. import models as ent
 from fastapi import Request
@@ -87,6 +88,8 @@ class RegulationManager(BaseManager):
             )
             self.session.add(new_role)
 
+        await self.session.flush()
+        await refresh_visible_initiatives(self.session, unlink_user_ids | link_user_ids)
         await self.session.commit()
         return regulation
 
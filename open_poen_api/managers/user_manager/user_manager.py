@@ -24,39 +24,41 @@ class UserManager(BaseManager, UserManagerExCurrentUser):
             session, current_user, ent.AttachmentEntityType.USER
         )
 
+    def _detail_q(self):
+        return select(ent.User).options(
+            selectinload(ent.User.initiative_roles).joinedload(
+                ent.UserInitiativeRole.initiative
+            ),
+            selectinload(ent.User.activity_roles).joinedload(
+                ent.UserActivityRole.activity
+            ),
+            selectinload(ent.User.user_bank_account_roles).joinedload(
+                ent.UserBankAccountRole.bank_account
+            ),
+            selectinload(ent.User.owner_bank_account_roles).joinedload(
+                ent.UserBankAccountRole.bank_account
+            ),
+            selectinload(ent.User.grant_officer_regulation_roles).joinedload(
+                ent.UserRegulationRole.regulation
+            ),
+            selectinload(ent.User.policy_officer_regulation_roles).joinedload(
+                ent.UserRegulationRole.regulation
+            ),
+            selectinload(ent.User.overseer_roles).joinedload(ent.UserGrantRole.grant),
+            joinedload(ent.User.profile_picture),
+        )
+
     async def detail_load(self, id: int):
         query_result_q = await self.session.execute(
-            select(ent.User)
-            .options(
-                selectinload(ent.User.initiative_roles).joinedload(
-                    ent.UserInitiativeRole.initiative
-                ),
-                selectinload(ent.User.activity_roles).joinedload(
-                    ent.UserActivityRole.activity
-                ),
-                selectinload(ent.User.user_bank_account_roles).joinedload(
-                    ent.UserBankAccountRole.bank_account
-                ),
-                selectinload(ent.User.owner_bank_account_roles).joinedload(
-                    ent.UserBankAccountRole.bank_account
-                ),
-                selectinload(ent.User.grant_officer_regulation_roles).joinedload(
-                    ent.UserRegulationRole.regulation
-                ),
-                selectinload(ent.User.policy_officer_regulation_roles).joinedload(
-                    ent.UserRegulationRole.regulation
-                ),
-                selectinload(ent.User.overseer_roles).joinedload(
-                    ent.UserGrantRole.grant
-                ),
-                joinedload(ent.User.profile_picture),
-            )
-            .where(ent.User.id == id)
+            self._detail_q().where(ent.User.id == id)
         )
         query_result = query_result_q.scalars().first()
         if query_result is None:
             raise EntityNotFound(message="User not found")
         return query_result
 
+    async def detail_load_many(self, ids: list[int]) -> list[ent.User]:
+        return await self.load.many_load(self._detail_q(), ent.User, ids)
+
     async def min_load(self, user_id: int) -> ent.User:
         return await self.load.min_load(ent.User, user_id)
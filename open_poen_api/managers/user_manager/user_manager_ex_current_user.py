@@ -27,6 +27,7 @@ from ..bases import BaseLogger
 from typing import Any, Dict, cast
 from pydantic import EmailStr
 from ...logger import audit_logger
+from ...utils.role_cache import role_cache, role_cache_key
 
 
 WEBSITE_NAME = os.environ["WEBSITE_NAME"]
@@ -179,11 +180,19 @@ def with_joins(original_dependency):
         if user is None:
             return None
 
+        # The key is taken before loading, so that a user that is loaded while its
+        # roles change isn't cached under the new generation.
+        key = await role_cache_key(user_manager.user_db.session, user.id)
+        cached_user = role_cache.get(key)
+        if cached_user is not None:
+            return cached_user
+
         user = await user_manager.requesting_user_load(user.id)
         # This expunge is important to prevent the data on this user from being
         # manipulated and or erased after another instance is queried that shares
         # data with this user instance. SQL-Alchemy optimization it seems.
         user_manager.user_db.session.expunge(user)
+        role_cache.set(key, user)
         return user
 
     return _user_with_extra_joins
@@ -0,0 +1,77 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, insert, delete, union_all, func, true, false
+from typing import Iterable
+from .. import models as ent
+
+
+async def refresh_visible_initiatives(
+    session: AsyncSession, user_ids: Iterable[int]
+) -> None:
+    """Recomputes the rows in `UserVisibleInitiative` of the given users from their
+    roles. Call this in the same transaction as the change to the roles, after
+    flushing it."""
+    user_ids = set(user_ids)
+    if len(user_ids) == 0:
+        return
+
+    await session.execute(
+        delete(ent.UserVisibleInitiative).where(
+            ent.UserVisibleInitiative.user_id.in_(user_ids)
+        )
+    )
+
+    visible = union_all(
+        # Initiative owners.
+        select(
+            ent.UserInitiativeRole.user_id,
+            ent.UserInitiativeRole.initiative_id,
+            true().label("can_see_hidden_payments"),
+        ).where(ent.UserInitiativeRole.user_id.in_(user_ids)),
+        # Overseers of the initiative's grant.
+        select(ent.UserGrantRole.user_id, ent.Initiative.id, true())
+        .join(ent.Initiative, ent.Initiative.grant_id == ent.UserGrantRole.grant_id)
+        .where(ent.UserGrantRole.user_id.in_(user_ids)),
+        # Grant and policy officers of the grant's regulation.
+        select(ent.UserRegulationRole.user_id, ent.Initiative.id, true())
+        .join(
+            ent.Grant, ent.Grant.regulation_id == ent.UserRegulationRole.regulation_id
+        )
+        .join(ent.Initiative, ent.Initiative.grant_id == ent.Grant.id)
+        .where(ent.UserRegulationRole.user_id.in_(user_ids)),
+        # Activity owners.
+        select(ent.UserActivityRole.user_id, ent.Activity.initiative_id, false())
+        .join(ent.Activity, ent.Activity.id == ent.UserActivityRole.activity_id)
+        .where(ent.UserActivityRole.user_id.in_(user_ids)),
+    ).subquery()
+
+    await session.execute(
+        insert(ent.UserVisibleInitiative).from_select(
+            ["user_id", "initiative_id", "can_see_hidden_payments"],
+            select(
+                visible.c.user_id,
+                visible.c.initiative_id,
+                func.bool_or(visible.c.can_see_hidden_payments),
+            ).group_by(visible.c.user_id, visible.c.initiative_id),
+        )
+    )
+
+
+async def refresh_visible_initiatives_for_grant(
+    session: AsyncSession, grant_id: int
+) -> None:
+    """For when initiatives are added to a grant: overseers and officers that were
+    assigned before can see the new initiatives too."""
+    user_ids_q = await session.execute(
+        union_all(
+            select(ent.UserGrantRole.user_id).where(
+                ent.UserGrantRole.grant_id == grant_id
+            ),
+            select(ent.UserRegulationRole.user_id)
+            .join(
+                ent.Grant,
+                ent.Grant.regulation_id == ent.UserRegulationRole.regulation_id,
+            )
+            .where(ent.Grant.id == grant_id),
+        )
+    )
+    await refresh_visible_initiatives(session, user_ids_q.scalars().all())
@@ -2,8 +2,10 @@ from pydantic import EmailStr
 from sqlalchemy import (
     Column,
     Integer,
+    BigInteger,
     ForeignKey,
     DateTime,
+    Date,
     String,
     VARCHAR,
     Boolean,
@@ -12,8 +14,11 @@ from sqlalchemy import (
     DECIMAL,
     Interval,
     literal_column,
+    Index,
+    DDL,
+    event,
 )
-from datetime import datetime
+from datetime import datetime, date
 from enum import Enum
 from sqlalchemy_utils import ChoiceType
 from typing import Optional, Literal
@@ -55,7 +60,7 @@ requisition_bank_account = Table(
     "requisition_bank_account",
     Base.metadata,
     Column("requisition_id", Integer, ForeignKey("requisition.id")),
-    Column("bank_account_id", Integer, ForeignKey("bank_account.id")),
+    Column("bank_account_id", Integer, ForeignKey("bank_account.id"), index=True),
 )
 
 
@@ -74,6 +79,11 @@ class AttachmentAttachmentType(str, Enum):
 
 class Attachment(Base, TimeStampMixin):
     __tablename__ = "attachments"
+    # The attachment relationships join on all three columns.
+    __table_args__ = (
+        Index("ix_attachments_entity", "entity_type", "entity_id", "attachment_type"),
+    )
+
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     entity_id: Mapped[int] = mapped_column(Integer)
     entity_type: Mapped[AttachmentEntityType] = mapped_column(
@@ -138,6 +148,11 @@ class AttachmentMixin(Base):
     id_column: str
     entity_type: str
 
+    # Maintained by AttachmentHandler, so listings don't have to aggregate.
+    n_attachments: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
+    )
+
     @declared_attr
     def attachments(cls) -> Mapped[list[Attachment]]:
         return relationship(
@@ -158,7 +173,10 @@ class UserInitiativeRole(Base, TimeStampMixin):
         Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True
     )
     initiative_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("initiative.id", ondelete="CASCADE"), primary_key=True
+        Integer,
+        ForeignKey("initiative.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
     )
     user: Mapped["User"] = relationship(
         "User", back_populates="initiative_roles", uselist=False
@@ -174,7 +192,10 @@ class UserActivityRole(Base, TimeStampMixin):
         Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True
     )
     activity_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("activity.id", ondelete="CASCADE"), primary_key=True
+        Integer,
+        ForeignKey("activity.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
     )
     user: Mapped["User"] = relationship(
         "User", back_populates="activity_roles", uselist=False
@@ -195,7 +216,10 @@ class UserBankAccountRole(Base, TimeStampMixin):
         Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True
     )
     bank_account_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("bank_account.id", ondelete="CASCADE"), primary_key=True
+        Integer,
+        ForeignKey("bank_account.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
     )
     role: Mapped[BankAccountRole] = mapped_column(
         ChoiceType(BankAccountRole, impl=VARCHAR(length=32)), primary_key=True
@@ -216,7 +240,10 @@ class UserRegulationRole(Base, TimeStampMixin):
         Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True
     )
     regulation_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("regulation.id", ondelete="CASCADE"), primary_key=True
+        Integer,
+        ForeignKey("regulation.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
     )
     role: Mapped[RegulationRole] = mapped_column(
         ChoiceType(RegulationRole, impl=VARCHAR(length=32)), primary_key=True
@@ -232,7 +259,10 @@ class UserGrantRole(Base, TimeStampMixin):
         Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True
     )
     grant_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("grant.id", ondelete="CASCADE"), primary_key=True
+        Integer,
+        ForeignKey("grant.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
     )
 
     user: Mapped["User"] = relationship(
@@ -243,6 +273,27 @@ class UserGrantRole(Base, TimeStampMixin):
     )
 
 
+class UserVisibleInitiative(Base):
+    """Derived from the role tables above, so that list queries can check visibility
+    with a single join instead of a subquery per role. Rows are kept up to date by
+    the managers through `refresh_visible_initiatives`."""
+
+    __tablename__ = "user_visible_initiative"
+    user_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True
+    )
+    initiative_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("initiative.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    )
+    # Initiative owners, overseers and officers see all payments of the initiative.
+    # Activity owners only see the initiative itself and the payments of their
+    # activities.
+    can_see_hidden_payments: Mapped[bool] = mapped_column(Boolean, nullable=False)
+
+
 class UserRole(str, Enum):
     """These are the roles we save in the db, but there are more roles that
     are not based on a a field, but on relationship(s)."""
@@ -446,16 +497,8 @@ class Initiative(ProfilePictureMixin, Base, TimeStampMixin):
 
     income: Mapped[Decimal] = mapped_column(DECIMAL(precision=10, scale=2), default=0)
 
-    @aggregated("payments", column="income")
-    def _set_income(self):
-        return get_finance_aggregate(Route.INCOME)
-
     expenses: Mapped[Decimal] = mapped_column(DECIMAL(precision=10, scale=2), default=0)
 
-    @aggregated("payments", column="expenses")
-    def _set_expenses(self):
-        return get_finance_aggregate(Route.EXPENSES)
-
     user_roles: Mapped[list[UserInitiativeRole]] = relationship(
         "UserInitiativeRole",
         back_populates="initiative",
@@ -478,7 +521,7 @@ class Initiative(ProfilePictureMixin, Base, TimeStampMixin):
         "DebitCard", back_populates="initiative", lazy="noload"
     )
     grant_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("grant.id", ondelete="CASCADE")
+        Integer, ForeignKey("grant.id", ondelete="CASCADE"), index=True
     )
     grant: Mapped["Grant"] = relationship(
         # Lazy is set to "select" to ensure grant is also set when an initiative
@@ -523,19 +566,11 @@ class Activity(ProfilePictureMixin, Base, TimeStampMixin):
         default=0,
     )
 
-    @aggregated("payments", column="income")
-    def _set_income(self):
-        return get_finance_aggregate(Route.INCOME)
-
     expenses: Mapped[Decimal] = mapped_column(
         DECIMAL(precision=10, scale=2),
         default=0,
     )
 
-    @aggregated("payments", column="expenses")
-    def _set_expenses(self):
-        return get_finance_aggregate(Route.EXPENSES)
-
     user_roles: Mapped[list[UserActivityRole]] = relationship(
         "UserActivityRole",
         back_populates="activity",
@@ -546,7 +581,7 @@ class Activity(ProfilePictureMixin, Base, TimeStampMixin):
         "user_roles", "user"
     )
     initiative_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("initiative.id", ondelete="CASCADE")
+        Integer, ForeignKey("initiative.id", ondelete="CASCADE"), index=True
     )
     initiative: Mapped[Initiative] = relationship(
         "Initiative", back_populates="activities", lazy="joined", uselist=False
@@ -660,18 +695,13 @@ class DebitCard(Base):
 
     income: Mapped[Decimal] = mapped_column(DECIMAL(precision=10, scale=2), default=0)
 
-    @aggregated("payments", column="income")
-    def _set_income(self):
-        return get_finance_aggregate(Route.INCOME)
-
     expenses: Mapped[Decimal] = mapped_column(DECIMAL(precision=10, scale=2), default=0)
 
-    @aggregated("payments", column="expenses")
-    def _set_expenses(self):
-        return get_finance_aggregate(Route.EXPENSES)
-
     initiative_id: Mapped[int | None] = mapped_column(
-        Integer, ForeignKey("initiative.id", ondelete="SET NULL"), nullable=True
+        Integer,
+        ForeignKey("initiative.id", ondelete="SET NULL"),
+        nullable=True,
+        index=True,
     )
     initiative: Mapped[Initiative | None] = relationship(
         "Initiative", back_populates="debit_cards", lazy="noload", uselist=False
@@ -741,6 +771,67 @@ class Requisition(Base, TimeStampMixin):
         )
 
 
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+# The jobs that are waiting. A requisition can have a job waiting while another runs.
+QUEUED_JOB = text("status = 'queued'")
+
+
+class ImportJob(Base, TimeStampMixin):
+    """A retrieval of the payments of a requisition, run by `open-poen worker`."""
+
+    __tablename__ = "import_job"
+    __table_args__ = (
+        Index(
+            "ix_import_job_queued_requisition_id",
+            "requisition_id",
+            unique=True,
+            postgresql_where=QUEUED_JOB,
+        ),
+        Index("ix_import_job_status_run_after", "status", "run_after"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    requisition_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("requisition.id", ondelete="CASCADE"), nullable=False
+    )
+    # None to retrieve the payments since they were last retrieved.
+    date_from: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    status: Mapped[JobStatus] = mapped_column(
+        ChoiceType(JobStatus, impl=VARCHAR(length=32)),
+        default=JobStatus.QUEUED,
+        nullable=False,
+    )
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    run_after: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=sql_func.now(), nullable=False
+    )
+    # A running job whose lease has passed was abandoned, and is run again.
+    leased_until: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    last_error: Mapped[str | None] = mapped_column(String, nullable=True)
+
+    def __repr__(self):
+        return f"ImportJob(id='{self.id}', requisition_id='{self.requisition_id}', status='{self.status}')"
+
+
+class CacheGeneration(Base):
+    """Counts the commits that changed what a cache is computed from, so that every
+    process can tell that what it cached is stale. See `utils.cache_generation`."""
+
+    __tablename__ = "cache_generation"
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    generation: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+
+
 class BankAccount(Base, TimeStampMixin):
     __tablename__ = "bank_account"
 
@@ -757,6 +848,8 @@ class BankAccount(Base, TimeStampMixin):
     institution_id: Mapped[str] = mapped_column(String, nullable=False)
     institution_name: Mapped[str] = mapped_column(String, nullable=True)
     institution_logo: Mapped[str] = mapped_column(String, nullable=True)
+    # The last day of which all payments were retrieved from GoCardless.
+    synced_until: Mapped[date | None] = mapped_column(Date, nullable=True)
 
     is_linked: Mapped[bool] = mapped_column(Boolean, default=False)
 
@@ -871,7 +964,7 @@ class Regulation(Base, TimeStampMixin):
         cascade="all, delete-orphan",
     )
     funder_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("funder.id", ondelete="CASCADE")
+        Integer, ForeignKey("funder.id", ondelete="CASCADE"), index=True
     )
     funder: Mapped["Funder"] = relationship(
         "Funder", back_populates="regulations", lazy="noload", uselist=False
@@ -899,18 +992,10 @@ class Grant(Base, TimeStampMixin):
 
     income: Mapped[Decimal] = mapped_column(DECIMAL(precision=10, scale=2), default=0)
 
-    @aggregated("initiatives.payments", column="income")
-    def _set_income(self):
-        return get_finance_aggregate(Route.INCOME)
-
     expenses: Mapped[Decimal] = mapped_column(DECIMAL(precision=10, scale=2), default=0)
 
-    @aggregated("initiatives.payments", column="expenses")
-    def _set_expenses(self):
-        return get_finance_aggregate(Route.EXPENSES)
-
     regulation_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("regulation.id", ondelete="CASCADE")
+        Integer, ForeignKey("regulation.id", ondelete="CASCADE"), index=True
     )
     regulation: Mapped[Regulation] = relationship(
         "Regulation", back_populates="grants", lazy="joined", uselist=False
@@ -952,3 +1037,45 @@ class Funder(Base, TimeStampMixin):
 
     def __repr__(self):
         return f"Funder(id={self.id}, name='{self.name}')"
+
+
+# Trigram indexes, so that the ILIKE '%...%' filters on the list endpoints and
+# search can use an index. The extension has to exist before the indexes do.
+event.listen(
+    Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+)
+for column in (
+    User.email,
+    Initiative.name,
+    Activity.name,
+    Funder.name,
+    Regulation.name,
+    Grant.name,
+    BankAccount.iban,
+    Payment.short_user_description,
+):
+    Index(
+        f"ix_{column.table.name}_{column.key}_trgm",
+        column,
+        postgresql_using="gin",
+        postgresql_ops={column.key: "gin_trgm_ops"},
+    )
+
+# The payment listings filter on one of these columns and sort on (booking_date, id),
+# newest first. With the sort order in the index, a page is read straight from the
+# index instead of sorting all payments of the initiative, activity or bank account.
+for column in (Payment.initiative_id, Payment.activity_id, Payment.bank_account_id):
+    Index(
+        f"ix_payment_{column.key}_booking_date",
+        column,
+        Payment.booking_date.desc().nulls_last(),
+        Payment.id.desc(),
+    )
+# The payments of a bank account that are not linked to an initiative yet.
+Index(
+    "ix_payment_unlinked_bank_account_id_booking_date",
+    Payment.bank_account_id,
+    Payment.booking_date.desc().nulls_last(),
+    Payment.id.desc(),
+    postgresql_where=Payment.initiative_id == None,
+)
@@ -1,62 +1,21 @@
 from . import models as ent
 from sqlalchemy.orm import selectinload, joinedload, noload
-from sqlalchemy import select, or_, literal, and_
+from sqlalchemy import select, or_, literal_column, and_, tuple_, union_all
 from .exc import UnprocessableContent
+from .visibility import (
+    RequestingUser,
+    apply_user_visibility,
+    apply_initiative_visibility,
+    apply_payment_visibility,
+    apply_payment_initiative_visibility,
+    in_ids,
+)
 from datetime import datetime, date, timedelta
-from .schemas import TransactionAmount
+from .schemas import TransactionAmount, FinanceInterval
 from sqlalchemy import func, case
-
-
-class RequestingUser:
-    def __init__(self, user: ent.User):
-        self.user = user
-
-    @property
-    def initiative_ids(self):
-        return [i.initiative_id for i in self.user.initiative_roles]
-
-    @property
-    def activity_ids(self):
-        return [i.activity_id for i in self.user.activity_roles]
-
-    @property
-    def grant_ids(self):
-        return [i.grant_id for i in self.user.overseer_roles]
-
-    @property
-    def go_regulation_ids(self):
-        return [i.regulation_id for i in self.user.grant_officer_regulation_roles]
-
-    @property
-    def po_regulation_ids(self):
-        return [i.regulation_id for i in self.user.policy_officer_regulation_roles]
-
-    @property
-    def is_officer(self):
-        return (
-            len(self.user.grant_officer_regulation_roles) > 0
-            or len(self.user.policy_officer_regulation_roles) > 0
-        )
-
-    @property
-    def is_administrator(self):
-        return self.user.role == ent.UserRole.ADMINISTRATOR
-
-    @property
-    def is_superuser(self):
-        return self.user.is_superuser
-
-    @property
-    def id(self):
-        return self.user.id
-
-    @property
-    def used_and_owned_bank_accounts(self):
-        return [
-            i.bank_account_id
-            for i in self.user.user_bank_account_roles
-            + self.user.owner_bank_account_roles
-        ]
+import base64
+import binascii
+import json
 
 
 def get_users_q(
@@ -64,20 +23,7 @@ def get_users_q(
 ):
     q = select(ent.User).options(joinedload(ent.User.profile_picture))
 
-    if optional_user is not None:
-        requesting_user = RequestingUser(optional_user)
-
-    if optional_user is None:
-        q = q.where(ent.User.hidden == False)
-    else:
-        q = q.where(
-            or_(
-                ent.User.hidden == False,
-                ent.User.id == requesting_user.id,
-                literal(requesting_user.is_administrator),
-                literal(requesting_user.is_superuser),
-            )
-        )
+    q = apply_user_visibility(q, optional_user)
 
     if email:
         q = q.where(ent.User.email.ilike(f"%{email}%"))
@@ -94,39 +40,12 @@ def get_initiatives_q(
     offset: int,
     limit: int,
 ):
-    q = select(ent.Initiative).join(ent.Grant).join(ent.Regulation)
+    q = select(ent.Initiative)
 
     if optional_user is not None:
         requesting_user = RequestingUser(optional_user)
 
-    if optional_user is None:
-        q = q.where(ent.Initiative.hidden == False)
-    else:
-        q = q.where(
-            or_(
-                ent.Initiative.hidden == False,
-                # You can see initiatives of your activities.
-                ent.Initiative.id.in_(
-                    select(ent.Activity.initiative_id).where(
-                        ent.Activity.id.in_(requesting_user.activity_ids)
-                    )
-                ),
-                # You can see your own initiatives.
-                ent.Initiative.id.in_(requesting_user.initiative_ids),
-                # You can see initiatives where you're overseer.
-                ent.Initiative.id.in_(
-                    select(ent.Initiative.id)
-                    .join(ent.Grant)
-                    .where(ent.Grant.id.in_(requesting_user.grant_ids))
-                ),
-                # You can see initiatives in your regulation as an officer.
-                ent.Regulation.id.in_(requesting_user.go_regulation_ids),
-                ent.Regulation.id.in_(requesting_user.po_regulation_ids),
-                # Administrators or super users can see everything.
-                literal(requesting_user.is_administrator),
-                literal(requesting_user.is_superuser),
-            )
-        )
+    q = apply_initiative_visibility(q, optional_user)
 
     if only_mine and optional_user is None:
         raise UnprocessableContent(
@@ -138,11 +57,11 @@ def get_initiatives_q(
                 # You can see initiatives of your activities.
                 ent.Initiative.id.in_(
                     select(ent.Activity.initiative_id).where(
-                        ent.Activity.id.in_(requesting_user.activity_ids)
+                        in_ids(ent.Activity.id, requesting_user.activity_ids)
                     )
                 ),
                 # You can see your own initiatives.
-                ent.Initiative.id.in_(requesting_user.initiative_ids),
+                in_ids(ent.Initiative.id, requesting_user.initiative_ids),
             )
         )
     else:
@@ -196,7 +115,24 @@ def get_user_payments_q(
     iban: str | None,
     offset: int,
     limit: int,
+    start_date: date | None = None,
+    end_date: date | None = None,
+    min_amount: TransactionAmount | None = None,
+    max_amount: TransactionAmount | None = None,
+    route: ent.Route | None = None,
+    only_unlinked: bool = False,
 ):
+    # A semi-join instead of a join on UserBankAccountRole, so that a user who is
+    # both owner and user of a bank account doesn't get the payments twice, without
+    # having to sort the whole result for a DISTINCT before the limit.
+    has_access = (
+        select(ent.UserBankAccountRole.bank_account_id)
+        .where(
+            ent.UserBankAccountRole.bank_account_id == ent.Payment.bank_account_id,
+            ent.UserBankAccountRole.user_id == user_id,
+        )
+        .exists()
+    )
     q = (
         select(
             ent.Payment,
@@ -214,12 +150,7 @@ def get_user_payments_q(
         .join(ent.BankAccount)
         .outerjoin(ent.Initiative, ent.Payment.initiative_id == ent.Initiative.id)
         .outerjoin(ent.Activity, ent.Payment.activity_id == ent.Activity.id)
-        .join(
-            ent.UserBankAccountRole,
-            ent.BankAccount.id == ent.UserBankAccountRole.bank_account_id,
-        )
-        .join(ent.User)
-        .where(ent.User.id == user_id)
+        .where(has_access)
     )
 
     if initiative_name:
@@ -228,12 +159,86 @@ def get_user_payments_q(
         q = q.where(ent.Activity.name.ilike(f"%{activity_name}%"))
     if iban:
         q = q.where(ent.BankAccount.iban.ilike(f"%{iban}%"))
+    if only_unlinked:
+        q = q.where(ent.Payment.initiative_id == None)
+    q = apply_date_range_filter(q, start_date, end_date)
+    q = apply_amount_range_filter(q, min_amount, max_amount)
+    q = apply_route_filter(q, route)
+
+    q = (
+        q.order_by(ent.Payment.booking_date.desc().nulls_last(), ent.Payment.id.desc())
+        .offset(offset)
+        .limit(limit)
+    )
+
+    return q
+
+
+def get_search_q(
+    optional_user: ent.User | None, text: str, limit: int, offset: int = 0
+):
+    """Ranked hits across entity types. Every type matches with ILIKE, which can use
+    the trigram indexes, and is ranked on trigram similarity. The visibility rules
+    are the same as those of the list endpoints."""
+    pattern = f"%{text}%"
+
+    def hits(entity_type: str, id_column, name, match_column):
+        return select(
+            # A constant instead of a parameter, so Postgres knows its type.
+            literal_column(f"'{entity_type}'").label("entity_type"),
+            id_column.label("id"),
+            name.label("name"),
+            func.similarity(match_column, text).label("score"),
+        ).where(match_column.ilike(pattern))
+
+    users = apply_user_visibility(
+        hits(
+            "user",
+            ent.User.id,
+            func.concat_ws(" ", ent.User.first_name, ent.User.last_name),
+            ent.User.email,
+        ),
+        optional_user,
+    )
+    initiatives = apply_initiative_visibility(
+        hits("initiative", ent.Initiative.id, ent.Initiative.name, ent.Initiative.name),
+        optional_user,
+    )
+    funders = hits("funder", ent.Funder.id, ent.Funder.name, ent.Funder.name)
+    regulations = hits(
+        "regulation", ent.Regulation.id, ent.Regulation.name, ent.Regulation.name
+    )
+    grants = hits("grant", ent.Grant.id, ent.Grant.name, ent.Grant.name)
+    payments = apply_payment_visibility(
+        hits(
+            "payment",
+            ent.Payment.id,
+            ent.Payment.short_user_description,
+            ent.Payment.short_user_description,
+        ),
+        optional_user,
+    )
+    # Payments that are not linked to an initiative are only listed for the users
+    # of their bank account, like in the user payment list.
+    if optional_user is None:
+        payments = payments.where(ent.Payment.initiative_id != None)
+    elif not RequestingUser(optional_user).sees_everything:
+        payments = payments.where(
+            or_(
+                ent.Payment.initiative_id != None,
+                in_ids(
+                    ent.Payment.bank_account_id,
+                    RequestingUser(optional_user).used_and_owned_bank_accounts,
+                ),
+            )
+        )
 
-    # Distinct because the join condition on UserBankAccountRole can
-    # result in double records where a user is both owner and user.
+    all_hits = union_all(
+        users, initiatives, funders, regulations, grants, payments
+    ).subquery()
     q = (
-        q.order_by(ent.Payment.booking_date.desc())
-        .distinct()
+        select(all_hits)
+        .order_by(all_hits.c.score.desc(), all_hits.c.entity_type, all_hits.c.id)
         .offset(offset)
         .limit(limit)
     )
@@ -254,16 +259,16 @@ def get_linkable_initiatives_q(required_user: ent.User):
                 # Initiatives of your activities.
                 ent.Initiative.id.in_(
                     select(ent.Activity.initiative_id).where(
-                        ent.Activity.id.in_(requesting_user.activity_ids)
+                        in_ids(ent.Activity.id, requesting_user.activity_ids)
                     )
                 ),
                 # Your own initiatives.
-                ent.Initiative.id.in_(requesting_user.initiative_ids),
+                in_ids(ent.Initiative.id, requesting_user.initiative_ids),
                 # Initiatives where you are overseer.
                 ent.Initiative.id.in_(
                     select(ent.Initiative.id)
                     .join(ent.Grant)
-                    .where(ent.Grant.id.in_(requesting_user.grant_ids))
+                    .where(in_ids(ent.Grant.id, requesting_user.grant_ids))
                 ),
             )
         )
@@ -310,101 +315,89 @@ def apply_route_filter(query, route: ent.Route | None):
     return query
 
 
+def encode_payment_cursor(payment: ent.Payment) -> str:
+    """Encodes the position of the last payment on a page as an opaque string."""
+    booking_date = (
+        payment.booking_date.isoformat() if payment.booking_date is not None else None
+    )
+    raw = json.dumps([booking_date, payment.id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_payment_cursor(cursor: str) -> tuple[datetime | None, int]:
+    try:
+        booking_date, payment_id = json.loads(base64.urlsafe_b64decode(cursor))
+        if booking_date is not None:
+            booking_date = datetime.fromisoformat(booking_date)
+        if not isinstance(payment_id, int):
+            raise ValueError
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise UnprocessableContent(message="Invalid cursor")
+    return booking_date, payment_id
+
+
+def apply_payment_ordering(query, cursor: str | None, offset: int, limit: int | None):
+    """Orders payments on (booking_date, id), newest first. If a cursor is given, the
+    page starts right after the payment the cursor points to (keyset pagination),
+    so that deep pages cost an index seek and don't shift when payments are imported
+    in the mean time. Offset is only used when no cursor is given. Without a limit,
+    all remaining payments are returned, which is what the exports use."""
+    if cursor is not None:
+        booking_date, payment_id = decode_payment_cursor(cursor)
+        if booking_date is None:
+            # Payments without a booking date are sorted last.
+            query = query.where(
+                and_(ent.Payment.booking_date == None, ent.Payment.id < payment_id)
+            )
+        else:
+            query = query.where(
+                or_(
+                    tuple_(ent.Payment.booking_date, ent.Payment.id)
+                    < tuple_(booking_date, payment_id),
+                    ent.Payment.booking_date == None,
+                )
+            )
+    else:
+        query = query.offset(offset)
+
+    return query.order_by(
+        ent.Payment.booking_date.desc().nulls_last(), ent.Payment.id.desc()
+    ).limit(limit)
+
+
 def get_initiative_payments_q(
     optional_user: ent.User | None,
     initiative_id: int,
     offset: int,
-    limit: int,
+    limit: int | None,
     start_date: date | None,
     end_date: date | None,
     min_amount: TransactionAmount | None,
     max_amount: TransactionAmount | None,
     route: ent.Route | None,
+    cursor: str | None = None,
 ):
     q = (
         select(
             ent.Payment,
             ent.Activity.name.label("activity_name"),
-            func.count(ent.Attachment.id).label("n_attachments"),
+            ent.Payment.n_attachments.label("n_attachments"),
         )
         .options(
             noload(ent.Payment.activity),
             noload(ent.Payment.initiative),
             noload(ent.Payment.bank_account),
         )
-        .join(ent.Initiative, ent.Payment.initiative_id == ent.Initiative.id)
-        .join(ent.Grant, ent.Initiative.grant_id == ent.Grant.id)
-        .join(ent.Regulation, ent.Grant.regulation_id == ent.Regulation.id)
         .outerjoin(ent.Activity, ent.Payment.activity_id == ent.Activity.id)
-        .outerjoin(
-            ent.Attachment,
-            and_(
-                ent.Payment.id == ent.Attachment.entity_id,
-                ent.Attachment.entity_type == ent.AttachmentEntityType.PAYMENT.value,
-            ),
-        )
         .where(ent.Payment.initiative_id == initiative_id)
-        .group_by(
-            ent.Payment.id,
-            ent.Payment.transaction_id,
-            ent.Payment.entry_reference,
-            ent.Payment.end_to_end_id,
-            ent.Payment.booking_date,
-            ent.Payment.transaction_amount,
-            ent.Payment.creditor_name,
-            ent.Payment.creditor_account,
-            ent.Payment.debtor_name,
-            ent.Payment.debtor_account,
-            ent.Payment.route,
-            ent.Payment.remittance_information_unstructured,
-            ent.Payment.remittance_information_structured,
-            ent.Payment.short_user_description,
-            ent.Payment.long_user_description,
-            ent.Payment.hidden,
-            ent.Payment.activity_id,
-            ent.Payment.initiative_id,
-            ent.Payment.debit_card_id,
-            ent.Payment.bank_account_id,
-            ent.Activity.name,
-        )
     )
 
-    if optional_user is not None:
-        requesting_user = RequestingUser(optional_user)
-
-    if optional_user is None:
-        q = q.where(ent.Payment.hidden == False)
-    else:
-        q = q.where(
-            or_(
-                ent.Payment.hidden == False,
-                # You can see hidden payments if you are initiative owner.
-                ent.Payment.initiative_id.in_(requesting_user.initiative_ids),
-                # You can see hidden payments if you are activity owner.
-                ent.Payment.activity_id.in_(requesting_user.activity_ids),
-                # You can see hidden payments if you are overseer.
-                ent.Payment.initiative_id.in_(
-                    select(ent.Initiative.id)
-                    .join(ent.Grant)
-                    .where(ent.Grant.id.in_(requesting_user.grant_ids))
-                ),
-                # You can see hidden payments in your regulation as an officer.
-                ent.Regulation.id.in_(requesting_user.go_regulation_ids),
-                ent.Regulation.id.in_(requesting_user.po_regulation_ids),
-                # Administrators or super users can see everything.
-                literal(requesting_user.is_administrator),
-                literal(requesting_user.is_superuser),
-                # Users can always see payments from their bank accounts.
-                ent.Payment.bank_account_id.in_(
-                    requesting_user.used_and_owned_bank_accounts
-                ),
-            )
-        )
+    q = apply_payment_visibility(q, optional_user)
 
     q = apply_date_range_filter(q, start_date, end_date)
     q = apply_amount_range_filter(q, min_amount, max_amount)
     q = apply_route_filter(q, route)
-    q = q.order_by(ent.Payment.id.desc()).offset(offset).limit(limit)
+    q = apply_payment_ordering(q, cursor, offset, limit)
 
     return q
 
@@ -419,101 +412,185 @@ def get_activity_payments_q(
     min_amount: TransactionAmount | None,
     max_amount: TransactionAmount | None,
     route: ent.Route | None,
+    cursor: str | None = None,
 ):
     q = (
         select(
             ent.Payment,
-            func.count(ent.Attachment.id).label("n_attachments"),
+            ent.Payment.n_attachments.label("n_attachments"),
         )
         .options(
             noload(ent.Payment.activity),
             noload(ent.Payment.initiative),
             noload(ent.Payment.bank_account),
         )
-        .join(ent.Initiative, ent.Payment.initiative_id == ent.Initiative.id)
-        .join(ent.Grant, ent.Initiative.grant_id == ent.Grant.id)
-        .join(ent.Regulation, ent.Grant.regulation_id == ent.Regulation.id)
-        .outerjoin(
-            ent.Attachment,
-            and_(
-                ent.Payment.id == ent.Attachment.entity_id,
-                ent.Attachment.entity_type == ent.AttachmentEntityType.PAYMENT.value,
-            ),
-        )
         .where(ent.Payment.activity_id == activity_id)
-        .group_by(
-            ent.Payment.id,
-            ent.Payment.transaction_id,
-            ent.Payment.entry_reference,
-            ent.Payment.end_to_end_id,
-            ent.Payment.booking_date,
-            ent.Payment.transaction_amount,
-            ent.Payment.creditor_name,
-            ent.Payment.creditor_account,
-            ent.Payment.debtor_name,
-            ent.Payment.debtor_account,
-            ent.Payment.route,
-            ent.Payment.remittance_information_unstructured,
-            ent.Payment.remittance_information_structured,
-            ent.Payment.short_user_description,
-            ent.Payment.long_user_description,
-            ent.Payment.hidden,
-            ent.Payment.activity_id,
-            ent.Payment.initiative_id,
-            ent.Payment.debit_card_id,
-            ent.Payment.bank_account_id,
+    )
+
+    q = apply_payment_visibility(q, optional_user)
+
+    q = apply_date_range_filter(q, start_date, end_date)
+    q = apply_amount_range_filter(q, min_amount, max_amount)
+    q = apply_route_filter(q, route)
+    q = apply_payment_ordering(q, cursor, offset, limit)
+
+    return q
+
+
+def get_grant_payments_q(
+    optional_user: ent.User | None,
+    grant_id: int,
+    start_date: date | None,
+    end_date: date | None,
+    min_amount: TransactionAmount | None,
+    max_amount: TransactionAmount | None,
+    route: ent.Route | None,
+):
+    q = (
+        select(
+            ent.Payment,
+            ent.Activity.name.label("activity_name"),
+            ent.Payment.n_attachments.label("n_attachments"),
         )
+        .options(
+            noload(ent.Payment.activity),
+            noload(ent.Payment.initiative),
+            noload(ent.Payment.bank_account),
+        )
+        .join(ent.Initiative, ent.Payment.initiative_id == ent.Initiative.id)
+        .outerjoin(ent.Activity, ent.Payment.activity_id == ent.Activity.id)
+        .where(ent.Initiative.grant_id == grant_id)
     )
 
-    if optional_user is not None:
-        requesting_user = RequestingUser(optional_user)
+    q = apply_payment_visibility(q, optional_user)
 
-    if optional_user is None:
-        q = q.where(ent.Payment.hidden == False)
-    else:
-        q = q.where(
-            or_(
-                ent.Payment.hidden == False,
-                # You can see hidden payments if you are initiative owner.
-                ent.Payment.initiative_id.in_(requesting_user.initiative_ids),
-                # You can see hidden payments if you are activity owner.
-                ent.Payment.activity_id.in_(requesting_user.activity_ids),
-                # You can see hidden payments if you are overseer.
-                ent.Payment.initiative_id.in_(
-                    select(ent.Initiative.id)
-                    .join(ent.Grant)
-                    .where(ent.Grant.id.in_(requesting_user.grant_ids))
-                ),
-                # You can see hidden payments in your regulation as an officer.
-                ent.Regulation.id.in_(requesting_user.go_regulation_ids),
-                ent.Regulation.id.in_(requesting_user.po_regulation_ids),
-                # Administrators or super users can see everything.
-                literal(requesting_user.is_administrator),
-                literal(requesting_user.is_superuser),
-                # Users can always see payments from their bank accounts.
-                ent.Payment.bank_account_id.in_(
-                    requesting_user.used_and_owned_bank_accounts
-                ),
-            )
+    # Payments of hidden initiatives are left out, like the initiatives themselves
+    # are in the initiative list.
+    q = apply_payment_initiative_visibility(q, optional_user)
+
+    q = apply_date_range_filter(q, start_date, end_date)
+    q = apply_amount_range_filter(q, min_amount, max_amount)
+    q = apply_route_filter(q, route)
+    q = apply_payment_ordering(q, None, 0, None)
+
+    return q
+
+
+def get_bank_account_payments_q(
+    bank_account_id: int,
+    start_date: date | None,
+    end_date: date | None,
+    min_amount: TransactionAmount | None,
+    max_amount: TransactionAmount | None,
+    route: ent.Route | None,
+):
+    # Whoever can read the bank account can see all of its payments.
+    q = (
+        select(
+            ent.Payment,
+            ent.Activity.name.label("activity_name"),
+            ent.Payment.n_attachments.label("n_attachments"),
+        )
+        .options(
+            noload(ent.Payment.activity),
+            noload(ent.Payment.initiative),
+            noload(ent.Payment.bank_account),
         )
+        .outerjoin(ent.Activity, ent.Payment.activity_id == ent.Activity.id)
+        .where(ent.Payment.bank_account_id == bank_account_id)
+    )
 
     q = apply_date_range_filter(q, start_date, end_date)
     q = apply_amount_range_filter(q, min_amount, max_amount)
     q = apply_route_filter(q, route)
-    q = q.order_by(ent.Payment.id.desc()).offset(offset).limit(limit)
+    q = apply_payment_ordering(q, None, 0, None)
 
     return q
 
 
+def _finance_series_q(
+    optional_user: ent.User | None,
+    interval: FinanceInterval,
+    start_date: date | None,
+    end_date: date | None,
+    by_activity: bool = False,
+):
+    # The interval is one of a few fixed values, and rendering it inline keeps the
+    # expression in the select and the group by identical.
+    period = func.date_trunc(
+        literal_column(f"'{interval.value}'"), ent.Payment.booking_date
+    ).label("period")
+    group_by = [period, ent.Payment.activity_id] if by_activity else [period]
+    q = (
+        select(
+            *group_by,
+            ent.get_finance_aggregate(ent.Route.INCOME).label("income"),
+            ent.get_finance_aggregate(ent.Route.EXPENSES).label("expenses"),
+        )
+        .join(ent.Initiative, ent.Payment.initiative_id == ent.Initiative.id)
+        .where(ent.Payment.booking_date != None)
+    )
+    q = apply_payment_visibility(q, optional_user)
+    q = apply_date_range_filter(q, start_date, end_date)
+    return q.group_by(*group_by).order_by(*group_by)
+
+
+def get_initiative_finance_q(
+    optional_user: ent.User | None,
+    initiative_id: int,
+    interval: FinanceInterval,
+    start_date: date | None,
+    end_date: date | None,
+):
+    q = _finance_series_q(
+        optional_user, interval, start_date, end_date, by_activity=True
+    )
+    return q.where(ent.Payment.initiative_id == initiative_id)
+
+
+def get_activity_finance_q(
+    optional_user: ent.User | None,
+    activity_id: int,
+    interval: FinanceInterval,
+    start_date: date | None,
+    end_date: date | None,
+):
+    q = _finance_series_q(optional_user, interval, start_date, end_date)
+    return q.where(ent.Payment.activity_id == activity_id)
+
+
+def get_grant_finance_q(
+    optional_user: ent.User | None,
+    grant_id: int,
+    interval: FinanceInterval,
+    start_date: date | None,
+    end_date: date | None,
+):
+    q = _finance_series_q(optional_user, interval, start_date, end_date)
+    q = apply_payment_initiative_visibility(q, optional_user)
+    return q.where(ent.Initiative.grant_id == grant_id)
+
+
+def get_regulation_finance_q(
+    optional_user: ent.User | None,
+    regulation_id: int,
+    interval: FinanceInterval,
+    start_date: date | None,
+    end_date: date | None,
+):
+    q = _finance_series_q(optional_user, interval, start_date, end_date)
+    q = apply_payment_initiative_visibility(q, optional_user)
+    return q.join(ent.Grant, ent.Initiative.grant_id == ent.Grant.id).where(
+        ent.Grant.regulation_id == regulation_id
+    )
+
+
 async def get_initiative_media_q(
     optional_user: ent.User | None, initiative_id: int, offset: int, limit: int
 ):
     q = (
         select(ent.Attachment)
         .join(ent.Payment, ent.Payment.id == ent.Attachment.entity_id)
-        .join(ent.Initiative, ent.Payment.initiative_id == ent.Initiative.id)
-        .join(ent.Grant, ent.Initiative.grant_id == ent.Grant.id)
-        .join(ent.Regulation, ent.Grant.regulation_id == ent.Regulation.id)
         .where(
             and_(
                 ent.Payment.initiative_id == initiative_id,
@@ -522,37 +599,7 @@ async def get_initiative_media_q(
         )
     )
 
-    if optional_user is not None:
-        requesting_user = RequestingUser(optional_user)
-
-    if optional_user is None:
-        q = q.where(ent.Payment.hidden == False)
-    else:
-        q = q.where(
-            or_(
-                ent.Payment.hidden == False,
-                # You can see hidden payments if you are initiative owner.
-                ent.Payment.initiative_id.in_(requesting_user.initiative_ids),
-                # You can see hidden payments if you are activity owner.
-                ent.Payment.activity_id.in_(requesting_user.activity_ids),
-                # You can see hidden payments if you are overseer.
-                ent.Payment.initiative_id.in_(
-                    select(ent.Initiative.id)
-                    .join(ent.Grant)
-                    .where(ent.Grant.id.in_(requesting_user.grant_ids))
-                ),
-                # You can see hidden payments in your regulation as an officer.
-                ent.Regulation.id.in_(requesting_user.go_regulation_ids),
-                ent.Regulation.id.in_(requesting_user.po_regulation_ids),
-                # Administrators or super users can see everything.
-                literal(requesting_user.is_administrator),
-                literal(requesting_user.is_superuser),
-                # Users can always see payments from their bank accounts.
-                ent.Payment.bank_account_id.in_(
-                    requesting_user.used_and_owned_bank_accounts
-                ),
-            )
-        )
+    q = apply_payment_visibility(q, optional_user)
 
     q = q.order_by(ent.Attachment.id.desc()).offset(offset).limit(limit)
 
@@ -565,9 +612,6 @@ async def get_activity_media_q(
     q = (
         select(ent.Attachment)
         .join(ent.Payment, ent.Payment.id == ent.Attachment.entity_id)
-        .join(ent.Initiative, ent.Payment.initiative_id == ent.Initiative.id)
-        .join(ent.Grant, ent.Initiative.grant_id == ent.Grant.id)
-        .join(ent.Regulation, ent.Grant.regulation_id == ent.Regulation.id)
         .join(ent.Activity, ent.Payment.activity_id == ent.Activity.id)
         .where(
             and_(
@@ -577,37 +621,7 @@ async def get_activity_media_q(
         )
     )
 
-    if optional_user is not None:
-        requesting_user = RequestingUser(optional_user)
-
-    if optional_user is None:
-        q = q.where(ent.Payment.hidden == False)
-    else:
-        q = q.where(
-            or_(
-                ent.Payment.hidden == False,
-                # You can see hidden payments if you are initiative owner.
-                ent.Payment.initiative_id.in_(requesting_user.initiative_ids),
-                # You can see hidden payments if you are activity owner.
-                ent.Payment.activity_id.in_(requesting_user.activity_ids),
-                # You can see hidden payments if you are overseer.
-                ent.Payment.initiative_id.in_(
-                    select(ent.Initiative.id)
-                    .join(ent.Grant)
-                    .where(ent.Grant.id.in_(requesting_user.grant_ids))
-                ),
-                # You can see hidden payments in your regulation as an officer.
-                ent.Regulation.id.in_(requesting_user.go_regulation_ids),
-                ent.Regulation.id.in_(requesting_user.po_regulation_ids),
-                # Administrators or super users can see everything.
-                literal(requesting_user.is_administrator),
-                literal(requesting_user.is_superuser),
-                # Users can always see payments from their bank accounts.
-                ent.Payment.bank_account_id.in_(
-                    requesting_user.used_and_owned_bank_accounts
-                ),
-            )
-        )
+    q = apply_payment_visibility(q, optional_user)
 
     q = q.order_by(ent.Attachment.id.desc()).offset(offset).limit(limit)
 
@@ -12,8 +12,8 @@ from fastapi import (
     Path,
 )
 from typing import Annotated, Union, Protocol
-from fastapi.responses import RedirectResponse
-from .database import get_async_session
+from fastapi.responses import RedirectResponse, StreamingResponse
+from .database import get_async_session, get_async_read_session, statement_cache_stats
 from . import schemas as s
 from . import models as ent
 from . import managers as m
@@ -21,6 +21,7 @@ from .utils.utils import (
     temp_password_generator,
     get_requester_ip,
 )
+from .utils.export import stream_export, EXPORT_MEDIA_TYPES
 import os
 from .bng.api import create_consent
 from .bng import import_bng_payments, retrieve_access_token, create_consent
@@ -36,13 +37,13 @@ from .authorization import SECRET_KEY, ALGORITHM
 from . import authorization as auth
 from .gocardless import (
     get_nordigen_client,
-    get_gocardless_payments,
+    enqueue_import,
     GoCardlessInstitutionList,
 )
 from .gocardless import get_institutions as get_institutions_from_gocardless
 from nordigen import NordigenClient
 import uuid
-from .exc import NotAuthorized, EntityNotFound
+from .exc import NotAuthorized, EntityNotFound, UnprocessableContent
 from .logger import audit_logger
 from .query import (
     get_initiatives_q,
@@ -57,7 +58,17 @@ from .query import (
     get_activity_payments_q,
     get_initiative_media_q,
     get_activity_media_q,
+    get_search_q,
+    get_grant_payments_q,
+    get_bank_account_payments_q,
+    get_initiative_finance_q,
+    get_activity_finance_q,
+    get_grant_finance_q,
+    get_regulation_finance_q,
+    encode_payment_cursor,
 )
+from .visibility import payment_visibility_key
+from .utils.finance_cache import finance_cache, finance_cache_key, FINANCE_CACHE_TTL
 from time import time
 
 user_router = APIRouter(tags=["user"])
@@ -67,6 +78,34 @@ payment_router = APIRouter(tags=["payment"])
 permission_router = APIRouter(tags=["auth"])
 utils_router = APIRouter(tags=["utils"])
 
+# Larger pages are served through the exports, which stream their rows.
+MAX_PAGE_SIZE = 100
+PageLimit = Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)]
+EXPORT_BATCH_SIZE = 500
+
+
+def batch_ids(ids: str = Query(regex=r"^\d+(,\d+)*$", example="1,2,3")) -> list[int]:
+    # Deduplicated, in the order they were requested.
+    parsed_ids = list(dict.fromkeys(int(i) for i in ids.split(",")))
+    if len(parsed_ids) > MAX_PAGE_SIZE:
+        raise UnprocessableContent(
+            f"At most {MAX_PAGE_SIZE} ids can be requested at once"
+        )
+    return parsed_ids
+
+
+BatchIds = Annotated[list[int], Depends(batch_ids)]
+
+
+async def get_readable_output_fields(
+    actor: ent.User | None, resources: list[ent.Base]
+) -> list[dict]:
+    # Entities that can't be read are left out instead of failing the whole batch.
+    readable = await auth.is_allowed_many_async(actor, "read", resources)
+    return await auth.get_authorized_output_fields_many_async(
+        actor, "read", [i for i, allowed in zip(resources, readable) if allowed]
+    )
+
 
 @user_router.post("/user", response_model=s.UserRead, response_model_exclude_unset=True)
 async def create_user(
@@ -109,6 +148,21 @@ async def get_user(
     return auth.get_authorized_output_fields(optional_login, "read", user_db)
 
 
+@user_router.get(
+    "/users/batch",
+    response_model=s.UserReadLinkedList,
+    response_model_exclude_unset=True,
+)
+async def get_users_batch(
+    ids: BatchIds,
+    optional_login: ent.User | None = Depends(m.optional_login),
+    user_manager: m.UserManager = Depends(m.UserManager),
+):
+    users_db = await user_manager.detail_load_many(ids)
+    filtered_users = await get_readable_output_fields(optional_login, users_db)
+    return s.UserReadLinkedList(users=filtered_users)
+
+
 @user_router.patch(
     "/user/{user_id}",
     response_model=s.UserRead,
@@ -147,10 +201,10 @@ async def delete_user(
     "/users", response_model=s.UserReadList, response_model_exclude_unset=True
 )
 async def get_users(
-    session: AsyncSession = Depends(get_async_session),
+    session: AsyncSession = Depends(get_async_read_session),
     optional_user: ent.User | None = Depends(m.optional_login),
     offset: int = 0,
-    limit: int = 20,
+    limit: PageLimit = 20,
     email: str | None = None,
 ):
     query = get_users_q(optional_user, email, offset, limit)
@@ -158,10 +212,9 @@ async def get_users(
     users_result = await session.execute(query)
     users_scalar = users_result.scalars().all()
 
-    filtered_users = [
-        auth.get_authorized_output_fields(optional_user, "read", i)
-        for i in users_scalar
-    ]
+    filtered_users = await auth.get_authorized_output_fields_many_async(
+        optional_user, "read", users_scalar
+    )
     return s.UserReadList(users=filtered_users)
 
 
@@ -376,7 +429,6 @@ async def gocardless_initiatite(
 @user_router.get("/users/{user_id}/gocardless-callback", include_in_schema=False)
 async def gocardless_callback(
     user_id: int,
-    background_tasks: BackgroundTasks,
     request: Request,
     ref: str,
     error: str | None = None,
@@ -421,8 +473,9 @@ async def gocardless_callback(
     session.add(requisition)
     await session.commit()
 
-    background_tasks.add_task(
-        get_gocardless_payments,
+    # Imported by `open-poen worker`.
+    await enqueue_import(
+        session,
         requisition.id,
         datetime.today() - timedelta(days=requisition.n_days_history + 1),
     )
@@ -439,7 +492,9 @@ async def get_bank_account(
     user_id: int,
     bank_account_id: int,
     required_user=Depends(m.required_login),
-    bank_account_manager: m.BankAccountManager = Depends(m.BankAccountManager),
+    bank_account_manager: m.BankAccountManager = Depends(
+        m.reading(m.BankAccountManager)
+    ),
 ):
     bank_account_db = await bank_account_manager.detail_load(bank_account_id)
     auth.authorize(required_user, "read", bank_account_db)
@@ -515,13 +570,108 @@ async def link_bank_account_users(
 async def get_initiative(
     initiative_id: int,
     optional_user=Depends(m.optional_login),
-    initiative_manager: m.InitiativeManager = Depends(m.InitiativeManager),
+    initiative_manager: m.InitiativeManager = Depends(m.reading(m.InitiativeManager)),
 ):
     initiative_db = await initiative_manager.detail_load(initiative_id)
     auth.authorize(optional_user, "read", initiative_db)
     return auth.get_authorized_output_fields(optional_user, "read", initiative_db)
 
 
+@initiative_router.get(
+    "/initiatives/batch",
+    response_model=s.InitiativeReadLinkedList,
+    response_model_exclude_unset=True,
+)
+async def get_initiatives_batch(
+    ids: BatchIds,
+    optional_user: ent.User | None = Depends(m.optional_login),
+    initiative_manager: m.InitiativeManager = Depends(m.reading(m.InitiativeManager)),
+):
+    initiatives_db = await initiative_manager.detail_load_many(ids)
+    filtered_initiatives = await get_readable_output_fields(
+        optional_user, initiatives_db
+    )
+    return s.InitiativeReadLinkedList(initiatives=filtered_initiatives)
+
+
+async def get_finance_series(
+    session: AsyncSession,
+    primary_session: AsyncSession,
+    parent: ent.Initiative | ent.Activity | ent.Grant | ent.Regulation,
+    query,
+    optional_user: ent.User | None,
+    interval: s.FinanceInterval,
+    cache_key_parts: tuple,
+    by_activity: bool = False,
+) -> s.FinanceSeries:
+    """Income and expenses per period from one of the finance queries of `parent`,
+    which group by period (and activity if `by_activity`). Cached per set of visible
+    payments."""
+    key = await finance_cache_key(
+        primary_session, parent, *cache_key_parts, payment_visibility_key(optional_user)
+    )
+    series = await finance_cache.get(key)
+    if series is not None:
+        return series
+
+    result = await session.execute(query)
+    periods: dict[datetime, s.FinancePeriod] = {}
+    activities: dict[int | None, list[s.FinancePeriod]] = {}
+    for row in result.all():
+        total = periods.setdefault(
+            row.period, s.FinancePeriod(period=row.period, income=0, expenses=0)
+        )
+        total.income += row.income
+        total.expenses += row.expenses
+        if by_activity:
+            activities.setdefault(row.activity_id, []).append(
+                s.FinancePeriod.from_orm(row)
+            )
+
+    series = s.FinanceSeries(
+        interval=interval,
+        periods=list(periods.values()),
+        activities=[
+            s.ActivityFinanceSeries(activity_id=k, periods=v)
+            for k, v in activities.items()
+        ]
+        if by_activity
+        else None,
+    )
+    await finance_cache.set(key, series, ttl=FINANCE_CACHE_TTL)
+    return series
+
+
+@initiative_router.get(
+    "/initiative/{initiative_id}/finance", response_model=s.FinanceSeries
+)
+async def get_initiative_finance(
+    initiative_id: int,
+    session: AsyncSession = Depends(get_async_read_session),
+    primary_session: AsyncSession = Depends(get_async_session),
+    optional_user=Depends(m.optional_login),
+    interval: s.FinanceInterval = s.FinanceInterval.MONTH,
+    start_date: date | None = None,
+    end_date: date | None = None,
+    initiative_manager: m.InitiativeManager = Depends(m.reading(m.InitiativeManager)),
+):
+    initiative_db = await initiative_manager.detail_load(initiative_id)
+    auth.authorize(optional_user, "read", initiative_db)
+    query = get_initiative_finance_q(
+        optional_user, initiative_id, interval, start_date, end_date
+    )
+    return await get_finance_series(
+        session,
+        primary_session,
+        initiative_db,
+        query,
+        optional_user,
+        interval,
+        (interval.value, start_date, end_date),
+        by_activity=True,
+    )
+
+
 @initiative_router.get(
     "/initiative/{initiative_id}/media",
     response_model=s.AttachmentList,
@@ -529,10 +679,10 @@ async def get_initiative(
 )
 async def get_initiative_media(
     initiative_id: int,
-    session: AsyncSession = Depends(get_async_session),
+    session: AsyncSession = Depends(get_async_read_session),
     optional_user=Depends(m.optional_login),
     offset: int = 0,
-    limit: int = 20,
+    limit: PageLimit = 20,
 ):
     # TODO: Is initiative hidden? Also for other routes.
     query = await get_initiative_media_q(
@@ -649,20 +799,19 @@ async def delete_initiative_profile_picture(
     response_model_exclude_unset=True,
 )
 async def get_initiatives(
-    session: AsyncSession = Depends(get_async_session),
+    session: AsyncSession = Depends(get_async_read_session),
     optional_user: ent.User | None = Depends(m.optional_login),
     offset: int = 0,
-    limit: int = 20,
+    limit: PageLimit = 20,
     name: str | None = None,
     only_mine: bool = False,
 ):
     query = get_initiatives_q(optional_user, name, only_mine, offset, limit)
     initiatives_result = await session.execute(query)
     initiatives_scalar = initiatives_result.scalars().all()
-    filtered_initiatives = [
-        auth.get_authorized_output_fields(optional_user, "read", i)
-        for i in initiatives_scalar
-    ]
+    filtered_initiatives = await auth.get_authorized_output_fields_many_async(
+        optional_user, "read", initiatives_scalar
+    )
     return s.InitiativeReadList(initiatives=filtered_initiatives)
 
 
@@ -697,13 +846,59 @@ async def get_activity(
     initiative_id: int,
     activity_id: int,
     optional_user=Depends(m.optional_login),
-    activity_manager: m.ActivityManager = Depends(m.ActivityManager),
+    activity_manager: m.ActivityManager = Depends(m.reading(m.ActivityManager)),
 ):
     activity_db = await activity_manager.detail_load(activity_id)
     auth.authorize(optional_user, "read", activity_db)
     return auth.get_authorized_output_fields(optional_user, "read", activity_db)
 
 
+@initiative_router.get(
+    "/activities/batch",
+    response_model=s.ActivityReadLinkedList,
+    response_model_exclude_unset=True,
+)
+async def get_activities_batch(
+    ids: BatchIds,
+    optional_user: ent.User | None = Depends(m.optional_login),
+    activity_manager: m.ActivityManager = Depends(m.reading(m.ActivityManager)),
+):
+    activities_db = await activity_manager.detail_load_many(ids)
+    filtered_activities = await get_readable_output_fields(optional_user, activities_db)
+    return s.ActivityReadLinkedList(activities=filtered_activities)
+
+
+@initiative_router.get(
+    "/initiative/{initiative_id}/activity/{activity_id}/finance",
+    response_model=s.FinanceSeries,
+)
+async def get_activity_finance(
+    initiative_id: int,
+    activity_id: int,
+    session: AsyncSession = Depends(get_async_read_session),
+    primary_session: AsyncSession = Depends(get_async_session),
+    optional_user=Depends(m.optional_login),
+    interval: s.FinanceInterval = s.FinanceInterval.MONTH,
+    start_date: date | None = None,
+    end_date: date | None = None,
+    activity_manager: m.ActivityManager = Depends(m.reading(m.ActivityManager)),
+):
+    activity_db = await activity_manager.detail_load(activity_id)
+    auth.authorize(optional_user, "read", activity_db)
+    query = get_activity_finance_q(
+        optional_user, activity_id, interval, start_date, end_date
+    )
+    return await get_finance_series(
+        session,
+        primary_session,
+        activity_db,
+        query,
+        optional_user,
+        interval,
+        (interval.value, start_date, end_date),
+    )
+
+
 @initiative_router.get(
     "/initiative/{initiative_id}/activity/{activity_id}/media",
     response_model=s.AttachmentList,
@@ -712,10 +907,10 @@ async def get_activity(
 async def get_activity_media(
     initiative_id: int,
     activity_id: int,
-    session: AsyncSession = Depends(get_async_session),
+    session: AsyncSession = Depends(get_async_read_session),
     optional_user=Depends(m.optional_login),
     offset: int = 0,
-    limit: int = 20,
+    limit: PageLimit = 20,
 ):
     # TODO: Is initiative or activity hidden? Also for other routes.
     query = await get_activity_media_q(
@@ -888,7 +1083,7 @@ async def create_funder(
 async def get_funder(
     funder_id: int,
     optional_user=Depends(m.optional_login),
-    funder_manager: m.FunderManager = Depends(m.FunderManager),
+    funder_manager: m.FunderManager = Depends(m.reading(m.FunderManager)),
 ):
     funder_db = await funder_manager.detail_load(funder_id)
     auth.authorize(optional_user, "read", funder_db)
@@ -933,10 +1128,10 @@ async def delete_funder(
     response_model_exclude_unset=True,
 )
 async def get_funders(
-    session: AsyncSession = Depends(get_async_session),
+    session: AsyncSession = Depends(get_async_read_session),
     optional_user=Depends(m.optional_login),
     offset: int = 0,
-    limit: int = 20,
+    limit: PageLimit = 20,
     name: str | None = None,
 ):
     query = get_funders_q(name, offset, limit)
@@ -944,10 +1139,9 @@ async def get_funders(
     funders_result = await session.execute(query)
     funders_scalar = funders_result.scalars().all()
 
-    filtered_funders = [
-        auth.get_authorized_output_fields(optional_user, "read", i)
-        for i in funders_scalar
-    ]
+    filtered_funders = await auth.get_authorized_output_fields_many_async(
+        optional_user, "read", funders_scalar
+    )
 
     return s.FunderReadList(funders=filtered_funders)
 
@@ -990,13 +1184,44 @@ async def get_regulation(
     funder_id: int,
     regulation_id: int,
     optional_user=Depends(m.optional_login),
-    regulation_manager: m.RegulationManager = Depends(m.RegulationManager),
+    regulation_manager: m.RegulationManager = Depends(m.reading(m.RegulationManager)),
 ):
     regulation_db = await regulation_manager.detail_load(regulation_id)
     auth.authorize(optional_user, "read", regulation_db)
     return auth.get_authorized_output_fields(optional_user, "read", regulation_db)
 
 
+@funder_router.get(
+    "/funder/{funder_id}/regulation/{regulation_id}/finance",
+    response_model=s.FinanceSeries,
+)
+async def get_regulation_finance(
+    funder_id: int,
+    regulation_id: int,
+    session: AsyncSession = Depends(get_async_read_session),
+    primary_session: AsyncSession = Depends(get_async_session),
+    optional_user=Depends(m.optional_login),
+    interval: s.FinanceInterval = s.FinanceInterval.MONTH,
+    start_date: date | None = None,
+    end_date: date | None = None,
+    regulation_manager: m.RegulationManager = Depends(m.reading(m.RegulationManager)),
+):
+    regulation_db = await regulation_manager.detail_load(regulation_id)
+    auth.authorize(optional_user, "read", regulation_db)
+    query = get_regulation_finance_q(
+        optional_user, regulation_id, interval, start_date, end_date
+    )
+    return await get_finance_series(
+        session,
+        primary_session,
+        regulation_db,
+        query,
+        optional_user,
+        interval,
+        (interval.value, start_date, end_date),
+    )
+
+
 @funder_router.patch(
     "/funder/{funder_id}/regulation/{regulation_id}",
     response_model=s.RegulationRead,
@@ -1076,10 +1301,10 @@ async def delete_regulation(
 )
 async def get_regulations(
     funder_id: int,
-    session: AsyncSession = Depends(get_async_session),
+    session: AsyncSession = Depends(get_async_read_session),
     optional_user=Depends(m.optional_login),
     offset: int = 0,
-    limit: int = 20,
+    limit: PageLimit = 20,
     name: str | None = None,
 ):
     query = get_regulations_q(funder_id, name, offset, limit)
@@ -1087,10 +1312,9 @@ async def get_regulations(
     regulations_result = await session.execute(query)
     regulations_scalar = regulations_result.scalars().all()
 
-    filtered_regulations = [
-        auth.get_authorized_output_fields(optional_user, "read", i)
-        for i in regulations_scalar
-    ]
+    filtered_regulations = await auth.get_authorized_output_fields_many_async(
+        optional_user, "read", regulations_scalar
+    )
 
     return s.RegulationReadList(regulations=filtered_regulations)
 
@@ -1135,13 +1359,43 @@ async def get_grant(
     regulation_id: int,
     grant_id: int,
     optional_user=Depends(m.optional_login),
-    grant_manager: m.GrantManager = Depends(m.GrantManager),
+    grant_manager: m.GrantManager = Depends(m.reading(m.GrantManager)),
 ):
     grant_db = await grant_manager.detail_load(grant_id)
     auth.authorize(optional_user, "read", grant_db)
     return auth.get_authorized_output_fields(optional_user, "read", grant_db)
 
 
+@funder_router.get(
+    "/funder/{funder_id}/regulation/{regulation_id}/grant/{grant_id}/finance",
+    response_model=s.FinanceSeries,
+)
+async def get_grant_finance(
+    funder_id: int,
+    regulation_id: int,
+    grant_id: int,
+    session: AsyncSession = Depends(get_async_read_session),
+    primary_session: AsyncSession = Depends(get_async_session),
+    optional_user=Depends(m.optional_login),
+    interval: s.FinanceInterval = s.FinanceInterval.MONTH,
+    start_date: date | None = None,
+    end_date: date | None = None,
+    grant_manager: m.GrantManager = Depends(m.reading(m.GrantManager)),
+):
+    grant_db = await grant_manager.detail_load(grant_id)
+    auth.authorize(optional_user, "read", grant_db)
+    query = get_grant_finance_q(optional_user, grant_id, interval, start_date, end_date)
+    return await get_finance_series(
+        session,
+        primary_session,
+        grant_db,
+        query,
+        optional_user,
+        interval,
+        (interval.value, start_date, end_date),
+    )
+
+
 @funder_router.patch(
     "/funder/{funder_id}/regulation/{regulation_id}/grant/{grant_id}",
     response_model=s.GrantRead,
@@ -1214,10 +1468,10 @@ async def delete_grant(
 async def get_grants(
     funder_id: int,
     regulation_id: int,
-    async_session: AsyncSession = Depends(get_async_session),
+    async_session: AsyncSession = Depends(get_async_read_session),
     optional_user=Depends(m.optional_login),
     offset: int = 0,
-    limit: int = 20,
+    limit: PageLimit = 20,
     name: str | None = None,
 ):
     query = get_grants_q(regulation_id, name, offset, limit)
@@ -1225,10 +1479,9 @@ async def get_grants(
     grants_result = await async_session.execute(query)
     grants_scalar = grants_result.scalars().all()
 
-    filtered_grants = [
-        auth.get_authorized_output_fields(optional_user, "read", i)
-        for i in grants_scalar
-    ]
+    filtered_grants = await auth.get_authorized_output_fields_many_async(
+        optional_user, "read", grants_scalar
+    )
     return s.GrantReadList(grants=filtered_grants)
 
 
@@ -1296,13 +1549,28 @@ async def create_payment(
 async def get_payment(
     payment_id: int,
     optional_login: ent.User | None = Depends(m.optional_login),
-    payment_manager: m.PaymentManager = Depends(m.PaymentManager),
+    payment_manager: m.PaymentManager = Depends(m.reading(m.PaymentManager)),
 ):
     payment_db = await payment_manager.detail_load(payment_id)
     auth.authorize(optional_login, "read", payment_db)
     return auth.get_authorized_output_fields(optional_login, "read", payment_db)
 
 
+@payment_router.get(
+    "/payments/batch",
+    response_model=s.PaymentReadLinkedList,
+    response_model_exclude_unset=True,
+)
+async def get_payments_batch(
+    ids: BatchIds,
+    optional_login: ent.User | None = Depends(m.optional_login),
+    payment_manager: m.PaymentManager = Depends(m.reading(m.PaymentManager)),
+):
+    payments_db = await payment_manager.detail_load_many(ids)
+    filtered_payments = await get_readable_output_fields(optional_login, payments_db)
+    return s.PaymentReadLinkedList(payments=filtered_payments)
+
+
 @payment_router.patch(
     "/payment/{payment_id}",
     response_model=s.PaymentRead,
@@ -1450,38 +1718,59 @@ async def get_bng_payments(
 )
 async def get_user_payments(
     user_id: int,
-    session: AsyncSession = Depends(get_async_session),
+    session: AsyncSession = Depends(get_async_read_session),
     required_user=Depends(m.required_login),
     offset: int = 0,
-    limit: int = 20,
+    limit: PageLimit = 20,
     initiative_name: str | None = None,
     activity_name: str | None = None,
     iban: str | None = None,
+    start_date: date | None = None,
+    end_date: date | None = None,
+    min_amount: s.TransactionAmount | None = None,
+    max_amount: s.TransactionAmount | None = None,
+    route: ent.Route | None = None,
+    only_unlinked: bool = False,
 ):
     if required_user.id != user_id:
         raise NotAuthorized("Not authorized")
 
     query = get_user_payments_q(
-        user_id, initiative_name, activity_name, iban, offset, limit
+        user_id,
+        initiative_name,
+        activity_name,
+        iban,
+        offset,
+        limit,
+        start_date,
+        end_date,
+        min_amount,
+        max_amount,
+        route,
+        only_unlinked,
     )
 
     payments_result = await session.execute(query)
     payments_scalar = payments_result.all()
 
     # For every payment, determine if it's linkable to/from initiatives/activities.
-    payments_with_linkability = []
-    for row in payments_scalar:
-        payments_with_linkability.append(
-            {
-                **row._mapping,
-                "linkable_initiative": auth.is_allowed(
-                    required_user, "link_initiative", row.t[0]
-                ),
-                "linkable_activity": auth.is_allowed(
-                    required_user, "link_activity", row.t[0]
-                ),
-            }
+    payments_db = [row.t[0] for row in payments_scalar]
+    linkable_initiative = await auth.is_allowed_many_async(
+        required_user, "link_initiative", payments_db
+    )
+    linkable_activity = await auth.is_allowed_many_async(
+        required_user, "link_activity", payments_db
+    )
+    payments_with_linkability = [
+        {
+            **row._mapping,
+            "linkable_initiative": initiative,
+            "linkable_activity": activity,
+        }
+        for row, initiative, activity in zip(
+            payments_scalar, linkable_initiative, linkable_activity
         )
+    ]
 
     payments = [s.PaymentReadUser(**i) for i in payments_with_linkability]
 
@@ -1495,15 +1784,16 @@ async def get_user_payments(
 )
 async def get_initiative_payments(
     initiative_id: int,
-    session: AsyncSession = Depends(get_async_session),
+    session: AsyncSession = Depends(get_async_read_session),
     optional_user=Depends(m.optional_login),
     offset: int = 0,
-    limit: int = 20,
+    limit: PageLimit = 20,
     start_date: date | None = None,
     end_date: date | None = None,
     min_amount: s.TransactionAmount | None = None,
     max_amount: s.TransactionAmount | None = None,
     route: ent.Route | None = None,
+    cursor: str | None = None,
 ):
     query = get_initiative_payments_q(
         optional_user,
@@ -1515,18 +1805,17 @@ async def get_initiative_payments(
         min_amount,
         max_amount,
         route,
+        cursor,
     )
 
     payments_result = await session.execute(query)
     payments_scalar = payments_result.all()
 
+    payment_fields = await auth.get_authorized_output_fields_many_async(
+        optional_user, "read", [i[0] for i in payments_scalar]
+    )
     filtered_payments = [
-        (
-            auth.get_authorized_output_fields(optional_user, "read", i[0]),
-            i[1],
-            i[2],
-        )
-        for i in payments_scalar
+        (fields, i[1], i[2]) for fields, i in zip(payment_fields, payments_scalar)
     ]
 
     payments = [
@@ -1534,7 +1823,14 @@ async def get_initiative_payments(
         for i in filtered_payments
     ]
 
-    return s.PaymentReadInitiativeList(payments=payments)
+    # A full page means there might be more payments after the last one.
+    next_cursor = (
+        encode_payment_cursor(payments_scalar[-1][0])
+        if len(payments_scalar) > 0 and len(payments_scalar) == limit
+        else None
+    )
+
+    return s.PaymentReadInitiativeList(payments=payments, next_cursor=next_cursor)
 
 
 @payment_router.get(
@@ -1545,15 +1841,16 @@ async def get_initiative_payments(
 async def get_activity_payments(
     initiative_id: int,
     activity_id: int,
-    session: AsyncSession = Depends(get_async_session),
+    session: AsyncSession = Depends(get_async_read_session),
     optional_user=Depends(m.optional_login),
     offset: int = 0,
-    limit: int = 20,
+    limit: PageLimit = 20,
     start_date: date | None = None,
     end_date: date | None = None,
     min_amount: s.TransactionAmount | None = None,
     max_amount: s.TransactionAmount | None = None,
     route: ent.Route | None = None,
+    cursor: str | None = None,
 ):
     # What if activity is hidden?
     query = get_activity_payments_q(
@@ -1566,17 +1863,17 @@ async def get_activity_payments(
         min_amount,
         max_amount,
         route,
+        cursor,
     )
 
     payments_result = await session.execute(query)
     payments_scalar = payments_result.all()
 
+    payment_fields = await auth.get_authorized_output_fields_many_async(
+        optional_user, "read", [i[0] for i in payments_scalar]
+    )
     filtered_payments = [
-        (
-            auth.get_authorized_output_fields(optional_user, "read", i[0]),
-            i[1],
-        )
-        for i in payments_scalar
+        (fields, i[1]) for fields, i in zip(payment_fields, payments_scalar)
     ]
 
     payments = [
@@ -1584,7 +1881,135 @@ async def get_activity_payments(
         for i in filtered_payments
     ]
 
-    return s.PaymentReadActivityList(payments=payments)
+    # A full page means there might be more payments after the last one.
+    next_cursor = (
+        encode_payment_cursor(payments_scalar[-1][0])
+        if len(payments_scalar) > 0 and len(payments_scalar) == limit
+        else None
+    )
+
+    return s.PaymentReadActivityList(payments=payments, next_cursor=next_cursor)
+
+
+def stream_payments_export(
+    session: AsyncSession,
+    query,
+    optional_user: ent.User | None,
+    export_format: s.ExportFormat,
+    filename: str,
+) -> StreamingResponse:
+    async def rows():
+        # Server side cursor, so rows are fetched in batches while they are sent.
+        payments_result = await session.stream(
+            query.execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        async for partition in payments_result.partitions():
+            payment_fields = await auth.get_authorized_output_fields_many_async(
+                optional_user, "read", [i[0] for i in partition]
+            )
+            for fields, (_, activity_name, n_attachments) in zip(
+                payment_fields, partition
+            ):
+                yield s.PaymentExport(
+                    **fields,
+                    activity_name=activity_name,
+                    n_attachments=n_attachments,
+                )
+
+    return StreamingResponse(
+        stream_export(rows(), s.PaymentExport, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}.{export_format.value}"'
+        },
+    )
+
+
+@payment_router.get(
+    "/payments/initiative/{initiative_id}/export", response_class=StreamingResponse
+)
+async def export_initiative_payments(
+    initiative_id: int,
+    session: AsyncSession = Depends(get_async_read_session),
+    optional_user=Depends(m.optional_login),
+    format: s.ExportFormat = s.ExportFormat.CSV,
+    start_date: date | None = None,
+    end_date: date | None = None,
+    min_amount: s.TransactionAmount | None = None,
+    max_amount: s.TransactionAmount | None = None,
+    route: ent.Route | None = None,
+):
+    query = get_initiative_payments_q(
+        optional_user,
+        initiative_id,
+        0,
+        None,
+        start_date,
+        end_date,
+        min_amount,
+        max_amount,
+        route,
+    )
+    return stream_payments_export(
+        session, query, optional_user, format, f"initiative_{initiative_id}_payments"
+    )
+
+
+@payment_router.get(
+    "/payments/grant/{grant_id}/export", response_class=StreamingResponse
+)
+async def export_grant_payments(
+    grant_id: int,
+    session: AsyncSession = Depends(get_async_read_session),
+    optional_user=Depends(m.optional_login),
+    grant_manager: m.GrantManager = Depends(m.reading(m.GrantManager)),
+    format: s.ExportFormat = s.ExportFormat.CSV,
+    start_date: date | None = None,
+    end_date: date | None = None,
+    min_amount: s.TransactionAmount | None = None,
+    max_amount: s.TransactionAmount | None = None,
+    route: ent.Route | None = None,
+):
+    grant_db = await grant_manager.detail_load(grant_id)
+    auth.authorize(optional_user, "read", grant_db)
+    query = get_grant_payments_q(
+        optional_user, grant_id, start_date, end_date, min_amount, max_amount, route
+    )
+    return stream_payments_export(
+        session, query, optional_user, format, f"grant_{grant_id}_payments"
+    )
+
+
+@payment_router.get(
+    "/payments/bank-account/{bank_account_id}/export",
+    response_class=StreamingResponse,
+)
+async def export_bank_account_payments(
+    bank_account_id: int,
+    session: AsyncSession = Depends(get_async_read_session),
+    required_user=Depends(m.required_login),
+    bank_account_manager: m.BankAccountManager = Depends(
+        m.reading(m.BankAccountManager)
+    ),
+    format: s.ExportFormat = s.ExportFormat.CSV,
+    start_date: date | None = None,
+    end_date: date | None = None,
+    min_amount: s.TransactionAmount | None = None,
+    max_amount: s.TransactionAmount | None = None,
+    route: ent.Route | None = None,
+):
+    bank_account_db = await bank_account_manager.detail_load(bank_account_id)
+    auth.authorize(required_user, "read", bank_account_db)
+    query = get_bank_account_payments_q(
+        bank_account_id, start_date, end_date, min_amount, max_amount, route
+    )
+    return stream_payments_export(
+        session,
+        query,
+        required_user,
+        format,
+        f"bank_account_{bank_account_id}_payments",
+    )
 
 
 class DetailLoaderProtocol(Protocol):
@@ -1653,7 +2078,7 @@ async def get_authorized_fields(
 
 @permission_router.get("/linkable-initiatives", response_model=s.LinkableInitiatives)
 async def get_linkable_initiatives(
-    session: AsyncSession = Depends(get_async_session),
+    session: AsyncSession = Depends(get_async_read_session),
     required_user: ent.User = Depends(m.required_login),
 ):
     query = get_linkable_initiatives_q(required_user)
@@ -1662,10 +2087,12 @@ async def get_linkable_initiatives(
     initiatives_scalar = initiatives_result.all()
 
     # For every initiative, determine if it's possible to link a payment to it.
-    linkable_initiatives = []
-    for row in initiatives_scalar:
-        if auth.is_allowed(required_user, "link_payment", row.t[0]):
-            linkable_initiatives.append(row._mapping)
+    linkable = await auth.is_allowed_many_async(
+        required_user, "link_payment", [row.t[0] for row in initiatives_scalar]
+    )
+    linkable_initiatives = [
+        row._mapping for row, allowed in zip(initiatives_scalar, linkable) if allowed
+    ]
 
     initiatives = [s.LinkableInitiative(**i) for i in linkable_initiatives]
 
@@ -1678,7 +2105,7 @@ async def get_linkable_initiatives(
 )
 async def get_linkable_activities(
     initiative_id: int,
-    session: AsyncSession = Depends(get_async_session),
+    session: AsyncSession = Depends(get_async_read_session),
     required_user: ent.User = Depends(m.required_login),
 ):
     query = get_linkable_activities_q(required_user, initiative_id)
@@ -1687,16 +2114,95 @@ async def get_linkable_activities(
     activities_scalar = activities_result.all()
 
     # For every activity, determine if it's possible to link a payment to it.
-    linkable_activities = []
-    for row in activities_scalar:
-        if auth.is_allowed(required_user, "link_payment", row.t[0]):
-            linkable_activities.append(row._mapping)
+    linkable = await auth.is_allowed_many_async(
+        required_user, "link_payment", [row.t[0] for row in activities_scalar]
+    )
+    linkable_activities = [
+        row._mapping for row, allowed in zip(activities_scalar, linkable) if allowed
+    ]
 
     activities = [s.LinkableActivity(**i) for i in linkable_activities]
 
     return s.LinkableActivities(activities=activities)
 
 
+# The types of search hits with fields that not everyone can read, with the fields
+# their name is made of and the field they are matched on.
+SEARCH_HIT_FIELDS = {
+    "user": (ent.User, ("first_name", "last_name"), "email"),
+    "payment": (ent.Payment, ("short_user_description",), "short_user_description"),
+}
+
+
+async def authorize_search_hits(
+    session: AsyncSession, optional_user: ent.User | None, rows
+) -> list[s.SearchHit]:
+    """Leaves out the hits that were matched on a field the user can't read, and
+    makes the names of the others of the fields the user can read, like the list
+    endpoints do."""
+    hits = [s.SearchHit.from_orm(i) for i in rows]
+    fields_by_hit: dict[tuple[str, int], dict] = {}
+    for entity_type, (db_model, _, _) in SEARCH_HIT_FIELDS.items():
+        ids = [i.id for i in hits if i.entity_type == entity_type]
+        if len(ids) == 0:
+            continue
+        entities_result = await session.execute(
+            select(db_model).where(db_model.id.in_(ids))
+        )
+        entities = entities_result.scalars().unique().all()
+        fields = await auth.get_authorized_output_fields_many_async(
+            optional_user, "read", entities
+        )
+        fields_by_hit |= {(entity_type, i.id): j for i, j in zip(entities, fields)}
+
+    authorized = []
+    for hit in hits:
+        if hit.entity_type not in SEARCH_HIT_FIELDS:
+            authorized.append(hit)
+            continue
+        _, name_fields, match_field = SEARCH_HIT_FIELDS[hit.entity_type]
+        fields = fields_by_hit.get((hit.entity_type, hit.id))
+        if fields is None or match_field not in fields:
+            continue
+        name = " ".join(str(fields[i]) for i in name_fields if fields.get(i))
+        authorized.append(hit.copy(update={"name": name or None}))
+    return authorized
+
+
+@utils_router.get("/search", response_model=s.SearchHitList)
+async def search(
+    q: str = Query(min_length=3, max_length=128),
+    limit: PageLimit = 20,
+    session: AsyncSession = Depends(get_async_read_session),
+    optional_user: ent.User | None = Depends(m.optional_login),
+):
+    # Trigram indexes can't narrow down searches shorter than three characters.
+    # Hits matched on fields the user can't read are only left out after the query,
+    # so more are fetched, in growing batches, until the page is full.
+    hits: list[s.SearchHit] = []
+    offset, batch_size = 0, 2 * limit
+    while len(hits) < limit:
+        hits_result = await session.execute(
+            get_search_q(optional_user, q, batch_size, offset)
+        )
+        rows = hits_result.all()
+        hits += await authorize_search_hits(session, optional_user, rows)
+        if len(rows) < batch_size:
+            break
+        offset, batch_size = offset + batch_size, 2 * batch_size
+    return s.SearchHitList(hits=hits[:limit])
+
+
+@utils_router.get("/utils/statement-cache", response_model=s.StatementCacheStatsRead)
+async def get_statement_cache_stats(superuser=Depends(m.superuser)):
+    return statement_cache_stats
+
+
+@utils_router.get("/utils/decision-cache", response_model=s.DecisionCacheStatsRead)
+async def get_decision_cache_stats(superuser=Depends(m.superuser)):
+    return auth.decision_cache_stats
+
+
 @utils_router.get(
     "/utils/gocardless/institutions", response_model=GoCardlessInstitutionList
 )
@@ -14,3 +14,6 @@ from .payment import *
 from .auth import *
 from .file_upload import *
 from .attachment import *
+from .search import *
+from .stats import *
+from .finance import *
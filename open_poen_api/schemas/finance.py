@@ -0,0 +1,31 @@
+from pydantic import BaseModel
+from datetime import datetime
+from decimal import Decimal
+from enum import Enum
+
+
+class FinanceInterval(str, Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+
+class FinancePeriod(BaseModel):
+    period: datetime
+    income: Decimal
+    expenses: Decimal
+
+    class Config:
+        orm_mode = True
+
+
+class ActivityFinanceSeries(BaseModel):
+    # None for the payments of the initiative that aren't linked to an activity.
+    activity_id: int | None
+    periods: list[FinancePeriod]
+
+
+class FinanceSeries(BaseModel):
+    interval: FinanceInterval
+    periods: list[FinancePeriod]
+    activities: list[ActivityFinanceSeries] | None
@@ -8,7 +8,7 @@ from .grant import GrantRead
 from .bank_account import BankAccountRead
 from .payment import PaymentRead
 from .attachment import Attachment
-from pydantic import validator
+from pydantic import BaseModel, validator
 
 
 class FunderReadLinked(FunderRead):
@@ -42,6 +42,13 @@ class InitiativeReadLinked(InitiativeRead):
         return list(v)
 
 
+class InitiativeReadLinkedList(BaseModel):
+    initiatives: list[InitiativeReadLinked]
+
+    class Config:
+        orm_mode = True
+
+
 class ActivityReadLinked(ActivityRead):
     activity_owners: list[UserRead]
     initiative: InitiativeRead
@@ -51,6 +58,13 @@ class ActivityReadLinked(ActivityRead):
         return list(v)
 
 
+class ActivityReadLinkedList(BaseModel):
+    activities: list[ActivityReadLinked]
+
+    class Config:
+        orm_mode = True
+
+
 class UserReadLinked(UserRead):
     initiatives: list[InitiativeRead]
     activities: list[ActivityRead]
@@ -72,6 +86,13 @@ class UserReadLinked(UserRead):
         return list(v)
 
 
+class UserReadLinkedList(BaseModel):
+    users: list[UserReadLinked]
+
+    class Config:
+        orm_mode = True
+
+
 class BankAccountReadLinked(BankAccountRead):
     users: list[UserRead]
     owner: UserRead
@@ -79,3 +100,10 @@ class BankAccountReadLinked(BankAccountRead):
 
 class PaymentReadLinked(PaymentRead):
     attachments: list[Attachment]
+
+
+class PaymentReadLinkedList(BaseModel):
+    payments: list[PaymentReadLinked]
+
+    class Config:
+        orm_mode = True
@@ -3,6 +3,7 @@ from datetime import datetime
 from .mixins import TransactionAmount, NotNullValidatorMixin
 from ..models import Route, PaymentType
 from typing import Literal
+from enum import Enum
 
 
 class PaymentRead(BaseModel):
@@ -48,6 +49,18 @@ class PaymentReadActivity(BaseModel):
     n_attachments: int
 
 
+class PaymentExport(PaymentRead):
+    initiative_id: int | None
+    activity_id: int | None
+    activity_name: str | None
+    n_attachments: int
+
+
+class ExportFormat(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
 class BasePaymentCreate(BaseModel):
     booking_date: datetime
     transaction_amount: TransactionAmount
@@ -139,6 +152,7 @@ class PaymentReadUserList(BaseModel):
 
 class PaymentReadInitiativeList(BaseModel):
     payments: list[PaymentReadInitiative]
+    next_cursor: str | None
 
     class Config:
         orm_mode = True
@@ -146,6 +160,7 @@ class PaymentReadInitiativeList(BaseModel):
 
 class PaymentReadActivityList(BaseModel):
     payments: list[PaymentReadActivity]
+    next_cursor: str | None
 
     class Config:
         orm_mode = True
@@ -0,0 +1,21 @@
+from pydantic import BaseModel
+from typing import Literal
+
+
+class SearchHit(BaseModel):
+    entity_type: Literal[
+        "user", "initiative", "funder", "regulation", "grant", "payment"
+    ]
+    id: int
+    name: str | None
+    score: float
+
+    class Config:
+        orm_mode = True
+
+
+class SearchHitList(BaseModel):
+    hits: list[SearchHit]
+
+    class Config:
+        orm_mode = True
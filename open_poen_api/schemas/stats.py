@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+
+
+class StatementCacheStatsRead(BaseModel):
+    hits: int
+    misses: int
+    uncached: int
+    hit_rate: float | None
+
+    class Config:
+        orm_mode = True
+
+
+class DecisionCacheStatsRead(BaseModel):
+    hits: int
+    misses: int
+    hit_rate: float | None
+
+    class Config:
+        orm_mode = True
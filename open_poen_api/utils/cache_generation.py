@@ -0,0 +1,57 @@
+"""Generation numbers in the database, for caches that live in the memory of every
+process but are computed from what any process can change, like the payments of an
+initiative or the roles of a user.
+
+A session that changes what a cache is computed from marks its generation with
+`mark_changed`, and the generation is bumped in the same transaction, just before
+it commits. Caches put the generations in their keys, so every process stops reading
+what it cached before the commit. A process that reads the generation before the
+commit and the data after it caches newer data under the old key, which is harmless.
+"""
+from sqlalchemy import event, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from .. import models as ent
+
+FINANCE = "finance"
+ROLES = "roles"
+
+
+def mark_changed(session: Session | AsyncSession, name: str) -> None:
+    """Bumps the generation `name` when the session commits. Changes through the ORM
+    are marked by the caches themselves, changes without it have to call this."""
+    session.info.setdefault("changed_generations", set()).add(name)
+
+
+async def get_generations(session: AsyncSession, *names: str) -> tuple[int, ...]:
+    result = await session.execute(
+        select(ent.CacheGeneration.name, ent.CacheGeneration.generation).where(
+            ent.CacheGeneration.name.in_(names)
+        )
+    )
+    generations = dict(result.all())
+    return tuple(generations.get(i, 0) for i in names)
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_generations(session):
+    if not session.info.get("changed_generations"):
+        return
+    # The rows of the generations are locked until the commit, so everything else
+    # is flushed first, to not wait for other locks while holding them.
+    session.flush()
+    names = session.info.pop("changed_generations", set())
+    for name in sorted(names):
+        statement = insert(ent.CacheGeneration).values(name=name, generation=1)
+        session.connection().execute(
+            statement.on_conflict_do_update(
+                index_elements=[ent.CacheGeneration.name],
+                set_={"generation": ent.CacheGeneration.generation + 1},
+            )
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_generations(session):
+    session.info.pop("changed_generations", None)
@@ -0,0 +1,36 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, Type
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from ..schemas import ExportFormat
+
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.CSV: "text/csv",
+    ExportFormat.NDJSON: "application/x-ndjson",
+}
+
+
+async def stream_export(
+    rows: AsyncIterator[BaseModel], model: Type[BaseModel], export_format: ExportFormat
+) -> AsyncIterator[str]:
+    """Serializes rows one at a time as they come in, so an export never holds more
+    than a single row in memory."""
+    if export_format == ExportFormat.NDJSON:
+        async for row in rows:
+            yield json.dumps(jsonable_encoder(row)) + "\n"
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(model.__fields__))
+    writer.writeheader()
+    async for row in rows:
+        writer.writerow(jsonable_encoder(row))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    # Yields the header if there were no rows.
+    if buffer.tell() > 0:
+        yield buffer.getvalue()
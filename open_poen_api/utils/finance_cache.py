@@ -0,0 +1,89 @@
+"""Cache for the finance time series of initiatives, activities, grants and
+regulations.
+
+Instead of tracking which cached series a changed payment ends up in, every commit
+that inserts, updates or deletes a payment of an initiative bumps the finance
+generation of that initiative in the database, and every commit that changes roles
+bumps the role generation. The key of a series holds the generations of all the
+initiatives it's computed from, and the role generation, so stale series are never
+read again by any process, and expire through their TTL. Payments of different
+initiatives are written without waiting for each other, and users that lose a role
+see it at once.
+
+The generations are read through a session on the primary, as a key read from a
+lagging replica could be paired with newer data from the primary, or the other way
+around.
+"""
+import hashlib
+from typing import Iterable
+from aiocache import SimpleMemoryCache
+from sqlalchemy import String, cast, event, func, inspect, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from .. import models as ent
+from .cache_generation import FINANCE, ROLES, get_generations, mark_changed
+
+FINANCE_CACHE_TTL = 10 * 60
+
+finance_cache = SimpleMemoryCache(namespace="finance")
+
+# Followed by the id of the initiative.
+_INITIATIVE_GENERATION = f"{FINANCE}:initiative:"
+
+
+def _initiatives_of(parent: ent.Initiative | ent.Activity | ent.Grant | ent.Regulation):
+    if isinstance(parent, ent.Initiative):
+        return ent.Initiative.id == parent.id
+    if isinstance(parent, ent.Activity):
+        return ent.Initiative.id == parent.initiative_id
+    if isinstance(parent, ent.Grant):
+        return ent.Initiative.grant_id == parent.id
+    if isinstance(parent, ent.Regulation):
+        return ent.Initiative.grant_id.in_(
+            select(ent.Grant.id).where(ent.Grant.regulation_id == parent.id)
+        )
+    raise TypeError(f"No finance series for {type(parent).__name__}")
+
+
+async def finance_cache_key(
+    primary_session: AsyncSession,
+    parent: ent.Initiative | ent.Activity | ent.Grant | ent.Regulation,
+    *parts,
+) -> str:
+    result = await primary_session.execute(
+        select(ent.Initiative.id, func.coalesce(ent.CacheGeneration.generation, 0))
+        .outerjoin(
+            ent.CacheGeneration,
+            ent.CacheGeneration.name
+            == literal(_INITIATIVE_GENERATION) + cast(ent.Initiative.id, String),
+        )
+        .where(_initiatives_of(parent))
+        .order_by(ent.Initiative.id)
+    )
+    # Grants and regulations can have many initiatives, and the key also changes
+    # when an initiative moves to another grant.
+    generations = hashlib.sha1(repr(result.all()).encode()).hexdigest()
+    (roles,) = await get_generations(primary_session, ROLES)
+    return ":".join(
+        str(i) for i in (generations, roles, type(parent).__name__, parent.id, *parts)
+    )
+
+
+def invalidate_finance_cache(
+    session: Session | AsyncSession, initiative_ids: Iterable[int | None]
+) -> None:
+    """Call this before committing changes to payments of the initiatives without
+    the ORM, like with a bulk delete."""
+    for i in initiative_ids:
+        if i is not None:
+            mark_changed(session, f"{_INITIATIVE_GENERATION}{i}")
+
+
+@event.listens_for(Session, "after_flush")
+def _track_payment_changes(session, flush_context):
+    for payment in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(payment, ent.Payment):
+            # The initiatives that the payment was linked to before the flush and is
+            # linked to now.
+            history = inspect(payment).attrs.initiative_id.history
+            invalidate_finance_cache(session, history.sum())
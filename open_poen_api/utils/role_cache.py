@@ -0,0 +1,98 @@
+"""Cache for the requesting user with all of its roles, as loaded by
+`requesting_user_load` on every authenticated request.
+
+Like the finance cache, every commit that inserts, updates or deletes a user or one
+of the role rows bumps the role generation in the database, which is part of every
+cache key. Changes to roles are rare, so invalidating all users at once costs little,
+and every process reads the generation on every request, so a revoked role is gone
+from every worker as soon as it's committed. A user that was loaded while the roles
+changed is stored under the old generation and never read.
+
+The cache holds pickled users, so that every request gets a copy of its own that it
+can't share with another request or a thread of the authorization executor. It
+holds at most `ROLE_CACHE_SIZE` users and drops the least recently used ones first.
+"""
+import pickle
+from collections import OrderedDict
+from time import monotonic
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from .. import models as ent
+from .cache_generation import ROLES, get_generations, mark_changed
+
+ROLE_CACHE_TTL = 60
+ROLE_CACHE_SIZE = 1024
+
+_ROLE_CLASSES = (
+    ent.User,
+    ent.UserInitiativeRole,
+    ent.UserActivityRole,
+    ent.UserBankAccountRole,
+    ent.UserRegulationRole,
+    ent.UserGrantRole,
+)
+
+# Deleting one of these deletes role rows through database cascades, which the
+# session doesn't see.
+_ROLE_PARENT_CLASSES = (
+    ent.Funder,
+    ent.Regulation,
+    ent.Grant,
+    ent.Initiative,
+    ent.Activity,
+    ent.BankAccount,
+)
+
+
+class RoleCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._users: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+
+    def get(self, key: str) -> ent.User | None:
+        """A detached copy of the cached user, or None."""
+        try:
+            expires, pickled_user = self._users[key]
+        except KeyError:
+            return None
+        if expires < monotonic():
+            del self._users[key]
+            return None
+        self._users.move_to_end(key)
+        return pickle.loads(pickled_user)
+
+    def set(self, key: str, user: ent.User) -> None:
+        """Caches a detached user with the roles that it has loaded."""
+        self._users[key] = (monotonic() + self.ttl, pickle.dumps(user))
+        self._users.move_to_end(key)
+        while len(self._users) > self.max_size:
+            self._users.popitem(last=False)
+
+    def clear(self) -> None:
+        self._users.clear()
+
+
+role_cache = RoleCache(ROLE_CACHE_SIZE, ROLE_CACHE_TTL)
+
+
+async def role_cache_key(session: AsyncSession, user_id: int) -> str:
+    # Read through a session on the primary, as a replica can lag behind a revoke.
+    (generation,) = await get_generations(session, ROLES)
+    return f"{generation}:{user_id}"
+
+
+def invalidate_role_cache(session: Session | AsyncSession) -> None:
+    """Call this before committing changes to users or roles without the ORM."""
+    mark_changed(session, ROLES)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_role_changes(session, flush_context):
+    if any(
+        isinstance(i, _ROLE_CLASSES)
+        for i in (*session.new, *session.dirty, *session.deleted)
+    ) or any(isinstance(i, _ROLE_PARENT_CLASSES) for i in session.deleted):
+        # The finance series depend on the roles too.
+        mark_changed(session, ROLES)
@@ -0,0 +1,174 @@
+"""Visibility predicates shared by the list query builders in `query.py`.
+
+Every value that differs per request, like the id of the requesting user or the ids of
+their activities, is a bound parameter. Only the role of the user (anonymous,
+administrator or other) changes the shape of a statement, so the statements compile
+once per shape and the compiled cache takes it from there.
+"""
+from . import models as ent
+from sqlalchemy import or_, and_, any_, literal, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+
+
+def in_ids(column, ids: list[int]):
+    """`column IN ids` as `column = ANY(:ids)`, with all ids in a single array
+    parameter. An expanding IN renders a placeholder per id, which gives a different
+    SQL string, and with that another prepared statement and query plan, for every
+    number of ids."""
+    return column == any_(literal(ids, ARRAY(Integer)))
+
+
+class RequestingUser:
+    def __init__(self, user: ent.User):
+        self.user = user
+
+    @property
+    def initiative_ids(self):
+        return [i.initiative_id for i in self.user.initiative_roles]
+
+    @property
+    def activity_ids(self):
+        return [i.activity_id for i in self.user.activity_roles]
+
+    @property
+    def grant_ids(self):
+        return [i.grant_id for i in self.user.overseer_roles]
+
+    @property
+    def go_regulation_ids(self):
+        return [i.regulation_id for i in self.user.grant_officer_regulation_roles]
+
+    @property
+    def po_regulation_ids(self):
+        return [i.regulation_id for i in self.user.policy_officer_regulation_roles]
+
+    @property
+    def is_officer(self):
+        return (
+            len(self.user.grant_officer_regulation_roles) > 0
+            or len(self.user.policy_officer_regulation_roles) > 0
+        )
+
+    @property
+    def is_administrator(self):
+        return self.user.role == ent.UserRole.ADMINISTRATOR
+
+    @property
+    def is_superuser(self):
+        return self.user.is_superuser
+
+    @property
+    def sees_everything(self):
+        return self.is_administrator or self.is_superuser
+
+    @property
+    def id(self):
+        return self.user.id
+
+    @property
+    def used_and_owned_bank_accounts(self):
+        return [
+            i.bank_account_id
+            for i in self.user.user_bank_account_roles
+            + self.user.owner_bank_account_roles
+        ]
+
+
+def join_visible_initiatives(query, requesting_user: RequestingUser, initiative_id):
+    """Outer joins the row of `UserVisibleInitiative` for the requesting user and the
+    given initiative. Matches at most one row, as (user_id, initiative_id) is the
+    primary key."""
+    return query.outerjoin(
+        ent.UserVisibleInitiative,
+        and_(
+            ent.UserVisibleInitiative.initiative_id == initiative_id,
+            ent.UserVisibleInitiative.user_id == requesting_user.id,
+        ),
+    )
+
+
+def apply_payment_visibility(query, optional_user: ent.User | None):
+    if optional_user is None:
+        return query.where(ent.Payment.hidden == False)
+
+    requesting_user = RequestingUser(optional_user)
+    # Administrators or super users can see everything.
+    if requesting_user.sees_everything:
+        return query
+
+    query = join_visible_initiatives(query, requesting_user, ent.Payment.initiative_id)
+    return query.where(
+        or_(
+            ent.Payment.hidden == False,
+            # You can see hidden payments if you are initiative owner, overseer or
+            # officer in the regulation.
+            ent.UserVisibleInitiative.can_see_hidden_payments == True,
+            # You can see hidden payments if you are activity owner.
+            in_ids(ent.Payment.activity_id, requesting_user.activity_ids),
+            # Users can always see payments from their bank accounts.
+            in_ids(
+                ent.Payment.bank_account_id,
+                requesting_user.used_and_owned_bank_accounts,
+            ),
+        )
+    )
+
+
+def payment_visibility_key(optional_user: ent.User | None) -> str:
+    """Identifies the set of payments `apply_payment_visibility` lets through, for
+    caching results computed from them."""
+    if optional_user is None:
+        return "anon"
+    if RequestingUser(optional_user).sees_everything:
+        return "all"
+    return f"user-{optional_user.id}"
+
+
+def apply_user_visibility(query, optional_user: ent.User | None):
+    if optional_user is None:
+        return query.where(ent.User.hidden == False)
+
+    requesting_user = RequestingUser(optional_user)
+    # Administrators or super users can see everything.
+    if requesting_user.sees_everything:
+        return query
+
+    return query.where(or_(ent.User.hidden == False, ent.User.id == requesting_user.id))
+
+
+def apply_initiative_visibility(query, optional_user: ent.User | None):
+    if optional_user is None:
+        return query.where(ent.Initiative.hidden == False)
+
+    requesting_user = RequestingUser(optional_user)
+    # Administrators or super users can see everything.
+    if requesting_user.sees_everything:
+        return query
+
+    query = join_visible_initiatives(query, requesting_user, ent.Initiative.id)
+    return query.where(
+        or_(
+            ent.Initiative.hidden == False,
+            # You can see initiatives you have a role in, through the initiative
+            # itself, one of its activities, its grant or its regulation.
+            ent.UserVisibleInitiative.user_id != None,
+        )
+    )
+
+
+def apply_payment_initiative_visibility(query, optional_user: ent.User | None):
+    """Leaves out payments of initiatives the user can't see. Expects the initiative
+    to be joined and `apply_payment_visibility` to be applied, which already joined
+    the visibility row on the payment's initiative."""
+    if optional_user is None:
+        return query.where(ent.Initiative.hidden == False)
+
+    if RequestingUser(optional_user).sees_everything:
+        return query
+
+    return query.where(
+        or_(
+            ent.Initiative.hidden == False,
+            ent.UserVisibleInitiative.user_id != None,
+        )
+    )
@@ -0,0 +1,184 @@
+"""Cost of the authorization checks in `authorization.py`, per registered class and
+per kind of actor, so that changes to `main.polar` can be checked for performance
+regressions.
+
+Seeds the dummy data of the tests in a transaction that is rolled back afterwards,
+so it has to be pointed at an empty database, like the tests:
+
+    python -m tests.benchmarks.authorization --sizes 1 20 200
+
+Every check is timed over collections of the given sizes (resources are repeated
+to fill a collection). Decisions aren't memoized, as outside of a request.
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+from typing import Callable
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from open_poen_api import authorization as auth
+from open_poen_api import database as db
+from open_poen_api import managers as m
+from open_poen_api import models as ent
+from open_poen_api.exc import NotAuthorized
+from tests.conftest import (
+    activity_owner,
+    add_dummy_data,
+    admin,
+    anon,
+    grant_officer,
+    initiative_owner,
+    superuser,
+    user,
+)
+
+ACTORS = {
+    "anon": anon,
+    "user": user,
+    "initiative owner": initiative_owner,
+    "activity owner": activity_owner,
+    "officer": grant_officer,
+    "admin": admin,
+    "superuser": superuser,
+}
+
+
+def authorize(actor, resource):
+    try:
+        auth.authorize(actor, "read", resource)
+    except NotAuthorized:
+        pass
+
+
+CHECKS: dict[str, Callable] = {
+    "authorize": authorize,
+    "is_allowed": lambda actor, resource: auth.is_allowed(actor, "read", resource),
+    "get_authorized_fields": lambda actor, resource: auth.get_authorized_fields(
+        actor, "read", resource
+    ),
+    "get_authorized_output_fields": lambda actor, resource: (
+        auth.get_authorized_output_fields(actor, "read", resource)
+    ),
+}
+
+# The same checks for a whole collection at once.
+BATCH_CHECKS: dict[str, Callable] = {
+    "is_allowed_many": lambda actor, resources: auth.is_allowed_many(
+        actor, "read", resources
+    ),
+    "get_authorized_output_fields_many": lambda actor, resources: (
+        auth.get_authorized_output_fields_many(actor, "read", resources)
+    ),
+}
+
+
+async def load_resources(session: AsyncSession) -> dict[str, list[ent.Base]]:
+    """Every resource of every class that is registered with Oso, loaded like the
+    routes load them."""
+    user_db = await db.get_user_db(session).__anext__()
+    loaders = {
+        ent.User: m.UserManager(user_db, session, None),
+        ent.Funder: m.FunderManager(session, None),
+        ent.Regulation: m.RegulationManager(session, None),
+        ent.Grant: m.GrantManager(session, None),
+        ent.BankAccount: m.BankAccountManager(session, None),
+        ent.Initiative: m.InitiativeManager(session, None),
+        ent.Activity: m.ActivityManager(session, None),
+        ent.Payment: m.PaymentManager(session, None),
+    }
+    registered = {
+        i.cls
+        for i in auth.OSO.host.types.values()
+        if isinstance(i.cls, type) and issubclass(i.cls, ent.Base)
+    }
+    resources = {}
+    for cls in sorted(registered, key=lambda cls: cls.__name__):
+        ids = (await session.execute(select(cls.id).order_by(cls.id))).scalars().all()
+        if cls in loaders:
+            resources[cls.__name__] = [await loaders[cls].detail_load(i) for i in ids]
+        else:
+            # No detail loader, so all relationships are loaded eagerly.
+            result = await session.execute(
+                select(cls).options(selectinload("*")).where(cls.id.in_(ids))
+            )
+            resources[cls.__name__] = result.scalars().all()
+    return resources
+
+
+async def load_actors(session: AsyncSession) -> dict[str, ent.User | None]:
+    user_db = await db.get_user_db(session).__anext__()
+    user_manager = m.UserManager(user_db, session, None)
+    return {
+        name: None if id is None else await user_manager.requesting_user_load(id)
+        for name, id in ACTORS.items()
+    }
+
+
+def measure(run: Callable[[], object], size: int, repeat: int) -> tuple:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    p50 = statistics.median(timings) * 1000
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+    per_second = size * repeat / sum(timings)
+    return p50, p99, per_second
+
+
+def report(cls: str, actor: str, check: str, size: int, numbers: tuple) -> None:
+    p50, p99, per_second = numbers
+    print(
+        f"{cls:>12} {actor:>17} {check:>34} {size:>6} "
+        f"{p50:>10.3f} {p99:>10.3f} {per_second:>12.0f}"
+    )
+
+
+async def run(sizes: list[int], repeat: int) -> None:
+    print(
+        f"{'class':>12} {'actor':>17} {'check':>34} {'size':>6} "
+        f"{'p50 (ms)':>10} {'p99 (ms)':>10} {'evals/s':>12}"
+    )
+    async with db.async_engine.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            # The dummy data commits, which only releases a savepoint here.
+            session = AsyncSession(bind=conn, join_transaction_mode="create_savepoint")
+            await add_dummy_data(session)
+            resources = await load_resources(session)
+            actors = await load_actors(session)
+            for cls, instances in resources.items():
+                if len(instances) == 0:
+                    continue
+                for (actor_name, actor), size in itertools.product(
+                    actors.items(), sizes
+                ):
+                    collection = list(
+                        itertools.islice(itertools.cycle(instances), size)
+                    )
+                    for check_name, check in CHECKS.items():
+                        numbers = measure(
+                            lambda: [check(actor, i) for i in collection], size, repeat
+                        )
+                        report(cls, actor_name, check_name, size, numbers)
+                    for check_name, check in BATCH_CHECKS.items():
+                        numbers = measure(
+                            lambda: check(actor, collection), size, repeat
+                        )
+                        report(cls, actor_name, check_name, size, numbers)
+        finally:
+            await transaction.rollback()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 20, 200])
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.repeat))
@@ -0,0 +1,188 @@
+"""Page latency of the initiative payment listing, before and after maintaining
+`Payment.n_attachments` instead of aggregating attachments per page.
+
+Seeds an initiative with the given amounts of payments in a transaction that is
+rolled back afterwards, so it can be pointed at the development database:
+
+    python -m tests.benchmarks.payment_listing --sizes 10000 100000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import and_, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import noload
+
+from open_poen_api import database as db
+from open_poen_api import models as ent
+from open_poen_api.query import get_initiative_payments_q
+
+PAGE_SIZE = 20
+ATTACHMENT_RATIO = 10  # Every tenth payment gets an attachment.
+
+
+def legacy_initiative_payments_q(initiative_id: int, offset: int, limit: int):
+    """The listing as it was: aggregate attachments and group by every column."""
+    return (
+        select(
+            ent.Payment,
+            ent.Activity.name.label("activity_name"),
+            func.count(ent.Attachment.id).label("n_attachments"),
+        )
+        .options(
+            noload(ent.Payment.activity),
+            noload(ent.Payment.initiative),
+            noload(ent.Payment.bank_account),
+        )
+        .join(ent.Initiative, ent.Payment.initiative_id == ent.Initiative.id)
+        .join(ent.Grant, ent.Initiative.grant_id == ent.Grant.id)
+        .join(ent.Regulation, ent.Grant.regulation_id == ent.Regulation.id)
+        .outerjoin(ent.Activity, ent.Payment.activity_id == ent.Activity.id)
+        .outerjoin(
+            ent.Attachment,
+            and_(
+                ent.Payment.id == ent.Attachment.entity_id,
+                ent.Attachment.entity_type == ent.AttachmentEntityType.PAYMENT.value,
+            ),
+        )
+        .where(ent.Payment.initiative_id == initiative_id)
+        .where(ent.Payment.hidden == False)
+        .group_by(*ent.Payment.__table__.columns, ent.Activity.name)
+        .order_by(ent.Payment.booking_date.desc().nulls_last(), ent.Payment.id.desc())
+        .offset(offset)
+        .limit(limit)
+    )
+
+
+async def seed(session: AsyncSession, n_payments: int) -> int:
+    funder = ent.Funder(name=f"Benchmark {n_payments}", url="https://example.com")
+    session.add(funder)
+    await session.flush()
+    regulation = ent.Regulation(
+        name="Benchmark", description="Benchmark", funder_id=funder.id
+    )
+    session.add(regulation)
+    await session.flush()
+    grant = ent.Grant(
+        name="Benchmark",
+        reference=f"benchmark-{n_payments}",
+        budget=Decimal("1000.00"),
+        regulation_id=regulation.id,
+    )
+    session.add(grant)
+    await session.flush()
+    initiative = ent.Initiative(
+        name=f"Benchmark {n_payments}",
+        description="Benchmark",
+        purpose="Benchmark",
+        target_audience="Benchmark",
+        owner="Benchmark",
+        owner_email="benchmark@example.com",
+        legal_entity=ent.LegalEntity.STICHTING,
+        address_applicant="Benchmark",
+        location="Benchmark",
+        budget=Decimal("1000.00"),
+        grant_id=grant.id,
+    )
+    session.add(initiative)
+    await session.flush()
+
+    # Core inserts bypass the ORM, so this doesn't trigger the aggregates.
+    now = datetime.now()
+    payment_ids = (
+        (
+            await session.execute(
+                insert(ent.Payment).returning(ent.Payment.id),
+                [
+                    {
+                        "transaction_id": f"benchmark-{n_payments}-{i}",
+                        "booking_date": now - timedelta(minutes=i),
+                        "transaction_amount": Decimal("-1.00"),
+                        "route": ent.Route.EXPENSES,
+                        "type": ent.PaymentType.MANUAL,
+                        "hidden": False,
+                        "initiative_id": initiative.id,
+                        "n_attachments": int(i % ATTACHMENT_RATIO == 0),
+                        "created_at": now,
+                        "updated_at": now,
+                    }
+                    for i in range(n_payments)
+                ],
+            )
+        )
+        .scalars()
+        .all()
+    )
+    await session.execute(
+        insert(ent.Attachment),
+        [
+            {
+                "entity_id": payment_id,
+                "entity_type": ent.AttachmentEntityType.PAYMENT,
+                "attachment_type": ent.AttachmentAttachmentType.PICTURE,
+                "raw_attachment_url": "",
+                "created_at": now,
+                "updated_at": now,
+            }
+            for i, payment_id in enumerate(payment_ids)
+            if i % ATTACHMENT_RATIO == 0
+        ],
+    )
+    await session.execute(text("ANALYZE payment, attachments"))
+    return initiative.id
+
+
+async def time_query(session: AsyncSession, q, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        (await session.execute(q)).all()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+async def run(sizes: list[int], repeat: int) -> None:
+    print(f"{'payments':>10} {'page':>6} {'before (ms)':>12} {'after (ms)':>12}")
+    async with db.async_engine.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            session = AsyncSession(bind=conn)
+            for n_payments in sizes:
+                initiative_id = await seed(session, n_payments)
+                for page in (0, n_payments // PAGE_SIZE // 2):
+                    offset = page * PAGE_SIZE
+                    before = await time_query(
+                        session,
+                        legacy_initiative_payments_q(initiative_id, offset, PAGE_SIZE),
+                        repeat,
+                    )
+                    after = await time_query(
+                        session,
+                        get_initiative_payments_q(
+                            None,
+                            initiative_id,
+                            offset,
+                            PAGE_SIZE,
+                            None,
+                            None,
+                            None,
+                            None,
+                            None,
+                        ),
+                        repeat,
+                    )
+                    print(f"{n_payments:>10} {page:>6} {before:>12.2f} {after:>12.2f}")
+        finally:
+            await transaction.rollback()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.repeat))
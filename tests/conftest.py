@@ -11,6 +11,8 @@ from open_poen_api.models import (
     BankAccountRole,
 )
 from open_poen_api.managers import superuser, required_login, optional_login
+from open_poen_api.utils.finance_cache import finance_cache
+from open_poen_api.utils.role_cache import role_cache
 import pytest
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -210,6 +212,10 @@ async def dummy_session(async_session):
 
     await trans.rollback()
     await connection.close()
+    # Series and users cached during the test may include changes that were just
+    # rolled back. The generations of the series are rolled back with them.
+    await finance_cache.clear()
+    role_cache.clear()
 
 
 async def add_dummy_data(async_session):
@@ -354,5 +360,6 @@ async def overridden_app(get_mock_user, dummy_session):
     app.dependency_overrides[required_login] = get_mock_user
     app.dependency_overrides[optional_login] = get_mock_user
     app.dependency_overrides[db.get_async_session] = lambda: dummy_session
+    app.dependency_overrides[db.get_async_read_session] = lambda: dummy_session
     yield app
     app.dependency_overrides = {}
@@ -1,4 +1,22 @@
+import time
+from datetime import date, datetime, timedelta, timezone
 import pytest
+from aiohttp import ClientResponseError
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import selectinload
+from open_poen_api import models as ent
+from open_poen_api.gocardless import payments as gocardless_payments
+from open_poen_api.gocardless.payments import (
+    GOCARDLESS_INITIAL_SYNC_DAYS,
+    GOCARDLESS_SYNC_OVERLAP_DAYS,
+    PAYMENT_RETRIEVAL_INTERVAL,
+    get_sync_start,
+    process_account,
+    save_payments,
+)
+from open_poen_api.gocardless.payment_schema import Payment
+from open_poen_api.gocardless.rate_limit import RateLimited, TokenBucket
 from tests.conftest import user
 
 
@@ -58,3 +76,177 @@ async def test_create_gocardless(
 async def test_get_institutions(async_client, get_mock_user):
     response = await async_client.get("/utils/gocardless/institutions")
     assert any([i["id"] == "ING_INGBNL2A" for i in response.json()["institutions"]])
+
+
+async def test_save_payments(dummy_session, monkeypatch):
+    monkeypatch.setattr(gocardless_payments, "PAYMENT_INSERT_BATCH_SIZE", 2)
+    account = await dummy_session.get(ent.BankAccount, 1)
+    payments = [
+        Payment(
+            transactionId=transaction_id,
+            transactionAmount={"amount": amount, "currency": "EUR"},
+            bookingDate="2023-09-01T00:00:00",
+        )
+        for transaction_id, amount in [("a", "10.00"), ("b", "-5.00"), ("a", "10.00")]
+    ]
+
+    async def generations():
+        result = await dummy_session.execute(
+            select(ent.CacheGeneration.name, ent.CacheGeneration.generation)
+        )
+        return dict(result.all())
+
+    # The same transaction twice in a window is only imported once.
+    before = await generations()
+    assert await save_payments(dummy_session, account, payments) == (2, 1)
+    # Unlinked payments don't make any cached series stale.
+    assert await generations() == before
+    assert await save_payments(dummy_session, account, payments) == (0, 3)
+    saved = await dummy_session.execute(
+        select(ent.Payment.route, ent.Payment.bank_account_id)
+        .where(ent.Payment.transaction_id.in_(["a", "b"]))
+        .order_by(ent.Payment.transaction_id)
+    )
+    assert saved.all() == [(ent.Route.INCOME, 1), (ent.Route.EXPENSES, 1)]
+
+
+async def test_rate_limiter():
+    bucket = TokenBucket(rate=100, capacity=1)
+    called_at = []
+
+    async def rate_limited_once():
+        called_at.append(time.monotonic())
+        if len(called_at) == 1:
+            raise ClientResponseError(
+                None, (), status=429, headers={"Retry-After": "0.05"}
+            )
+        return "response"
+
+    assert await bucket.call(rate_limited_once) == "response"
+    assert called_at[1] - called_at[0] >= 0.05
+
+    async def rate_limited_for_a_day():
+        raise ClientResponseError(
+            None,
+            (),
+            status=429,
+            headers={"HTTP_X_RATELIMIT_ACCOUNT_SUCCESS_RESET": "86400"},
+        )
+
+    with pytest.raises(RateLimited):
+        await bucket.call(rate_limited_for_a_day)
+
+
+def test_get_sync_start():
+    synced = ent.BankAccount(synced_until=date(2023, 9, 10))
+    assert get_sync_start(synced, None) == datetime(2023, 9, 10) - timedelta(
+        days=GOCARDLESS_SYNC_OVERLAP_DAYS
+    )
+    # An explicit date retrieves everything since, as for a new requisition.
+    assert get_sync_start(synced, datetime(2023, 1, 1)) == datetime(2023, 1, 1)
+    never_synced = ent.BankAccount(synced_until=None)
+    assert get_sync_start(never_synced, None).date() == date.today() - timedelta(
+        days=GOCARDLESS_INITIAL_SYNC_DAYS
+    )
+
+
+class StubAccountApi:
+    """The account API of GoCardless for ACC001, with one payment per window. It
+    fails from the window starting on `fail_from`."""
+
+    def __init__(self, fail_from: date | None = None):
+        self.fail_from = fail_from
+
+    async def get_metadata(self):
+        return {"id": "ACC001", "iban": "IBAN001", "status": "READY"}
+
+    async def get_details(self):
+        return {"account": {"name": "Account 1"}}
+
+    async def get_transactions(self, date_from: str, date_to: str):
+        start = date.fromisoformat(date_from)
+        if self.fail_from is not None and start >= self.fail_from:
+            raise RuntimeError("GoCardless is down.")
+        payment = {
+            "transactionId": f"stub-{date_from}",
+            "transactionAmount": {"amount": "10.00", "currency": "EUR"},
+            "bookingDate": f"{date_from}T00:00:00",
+        }
+        return {"transactions": {"booked": [payment]}}
+
+
+class StubClient:
+    def __init__(self, stub: StubAccountApi | None):
+        self.stub = stub
+
+    def account_api(self, account_api_id: str):
+        assert self.stub is not None, "GoCardless wasn't expected to be called."
+        return self.stub
+
+
+async def test_process_account_watermark(dummy_session, monkeypatch):
+    # The windows are saved with sessions on the connection of the test.
+    monkeypatch.setattr(
+        gocardless_payments,
+        "async_session_maker",
+        async_sessionmaker(dummy_session.bind, expire_on_commit=False),
+    )
+    monkeypatch.setattr(
+        gocardless_payments, "rate_limiter", TokenBucket(rate=1000, capacity=1000)
+    )
+    requisition = (
+        await dummy_session.execute(
+            select(ent.Requisition)
+            .options(selectinload(ent.Requisition.user))
+            .where(ent.Requisition.api_requisition_id == "REQ003")
+        )
+    ).scalar_one()
+
+    async def process(account_api, date_from):
+        await process_account(
+            dummy_session,
+            StubClient(account_api),
+            None,
+            requisition,
+            "ACC001",
+            date_from,
+            set(),
+        )
+
+    async def synced_until():
+        return await dummy_session.scalar(
+            select(ent.BankAccount.synced_until).where(ent.BankAccount.id == 1)
+        )
+
+    # Two windows, of which the second fails.
+    today = date.today()
+    date_from = datetime.combine(today - timedelta(days=20), datetime.min.time())
+    first_window_end = date_from.date() + timedelta(days=PAYMENT_RETRIEVAL_INTERVAL)
+    second_window = first_window_end + timedelta(days=1)
+    with pytest.raises(RuntimeError):
+        await process(StubAccountApi(fail_from=second_window), date_from)
+    # The watermark was committed with the payments of the first window.
+    assert await synced_until() == first_window_end
+    saved = await dummy_session.scalars(
+        select(ent.Payment.transaction_id).where(
+            ent.Payment.transaction_id == f"stub-{date_from.date()}"
+        )
+    )
+    assert len(saved.all()) == 1
+
+    await process(StubAccountApi(), None)
+    assert await synced_until() == today
+    # Retrieving an earlier period again doesn't move the watermark back.
+    with pytest.raises(RuntimeError):
+        await process(StubAccountApi(fail_from=second_window), date_from)
+    assert await synced_until() == today
+
+    # An account whose access expired is skipped before calling GoCardless.
+    await dummy_session.execute(
+        update(ent.BankAccount)
+        .where(ent.BankAccount.id == 1)
+        .values(expiration_date=datetime.now(timezone.utc) - timedelta(days=1))
+    )
+    await dummy_session.commit()
+    await process(None, date_from)
+    assert await synced_until() == today
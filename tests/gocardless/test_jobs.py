@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, not_, select, update
+
+from open_poen_api import models as ent
+from open_poen_api.gocardless.jobs import (
+    claim_job,
+    enqueue_import,
+    enqueue_scheduled_imports,
+    fail_job,
+    finish_job,
+    renew_lease,
+)
+from open_poen_api.gocardless.payments import EXCLUDED_STATUSES
+
+
+async def test_import_jobs(dummy_session):
+    date_from = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    await enqueue_import(dummy_session, 1)
+    # A second import of the same requisition retrieves from the earliest date.
+    await enqueue_import(dummy_session, 1, date_from)
+    jobs = (await dummy_session.execute(select(ent.ImportJob))).scalars().all()
+    assert [(i.requisition_id, i.date_from) for i in jobs] == [(1, date_from)]
+
+    job = await claim_job(dummy_session)
+    assert (job.requisition_id, job.date_from, job.attempts) == (1, date_from, 1)
+    # Leased by this worker.
+    assert await claim_job(dummy_session) is None
+
+    await fail_job(dummy_session, job.id, job.attempts, "error")
+    # Waiting for the backoff.
+    assert await claim_job(dummy_session) is None
+    await finish_job(dummy_session, job.id, job.attempts)
+
+
+async def test_enqueue_import_while_running(dummy_session):
+    await enqueue_import(dummy_session, 1)
+    job = await claim_job(dummy_session)
+    # The running job isn't changed, a new one waits for it.
+    date_from = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    await enqueue_import(dummy_session, 1, date_from)
+    assert await claim_job(dummy_session) is None
+
+    # Queuing the running job again merges it into the waiting one.
+    await fail_job(dummy_session, job.id, job.attempts, "error")
+    jobs = (await dummy_session.execute(select(ent.ImportJob))).scalars().all()
+    assert [(i.status, i.date_from, i.attempts) for i in jobs] == [
+        (ent.JobStatus.QUEUED, date_from, 1)
+    ]
+
+
+async def test_enqueue_scheduled_imports(dummy_session):
+    await enqueue_import(dummy_session, 1)
+    await enqueue_scheduled_imports(dummy_session)
+    await enqueue_scheduled_imports(dummy_session)
+
+    n_requisitions = await dummy_session.scalar(
+        select(func.count()).where(not_(ent.Requisition.status.in_(EXCLUDED_STATUSES)))
+    )
+    jobs = await dummy_session.execute(
+        select(ent.ImportJob.requisition_id, func.count()).group_by(
+            ent.ImportJob.requisition_id
+        )
+    )
+    counts = dict(jobs.all())
+    assert len(counts) == n_requisitions
+    assert set(counts.values()) == {1}
+
+
+async def test_stale_worker(dummy_session):
+    await enqueue_import(dummy_session, 1)
+    stale = await claim_job(dummy_session)
+    # The lease passes, and another worker claims the job.
+    await dummy_session.execute(
+        update(ent.ImportJob)
+        .where(ent.ImportJob.id == stale.id)
+        .values(leased_until=func.now() - timedelta(seconds=1))
+    )
+    await dummy_session.commit()
+    job = await claim_job(dummy_session)
+    assert (job.id, job.attempts) == (stale.id, 2)
+
+    # The first worker can't change it anymore.
+    assert not await renew_lease(dummy_session, stale.id, stale.attempts)
+    await finish_job(dummy_session, stale.id, stale.attempts)
+    await fail_job(dummy_session, stale.id, stale.attempts, "error")
+    status = await dummy_session.scalar(
+        select(ent.ImportJob.status).where(ent.ImportJob.id == job.id)
+    )
+    assert status == ent.JobStatus.RUNNING
+    assert await renew_lease(dummy_session, job.id, job.attempts)
@@ -1,14 +1,42 @@
 from open_poen_api.authorization import (
     OSO,
     get_authorized_output_fields,
+    get_authorized_output_fields_many,
+    is_allowed_many,
+    is_allowed_many_async,
+    get_authorized_output_fields_many_async,
     get_authorized_actions,
+    get_authorized_fields,
+    is_allowed,
+    decision_cache,
+    decision_cache_stats,
+    get_oso_actor,
 )
 from open_poen_api.models import User, Regulation
+from open_poen_api import models as ent
+from open_poen_api import authorization
 from open_poen_api.managers import RegulationManager
+from open_poen_api.query import (
+    get_users_q,
+    get_initiatives_q,
+    get_initiative_payments_q,
+)
 import pytest_asyncio
 import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import lazyload, selectinload
 from oso.exceptions import NotFoundError, ForbiddenError
-from tests.conftest import superuser, user, userowner, admin, grant_officer
+from tests.conftest import (
+    superuser,
+    user,
+    userowner,
+    admin,
+    grant_officer,
+    policy_officer,
+    initiative_owner,
+    activity_owner,
+    anon,
+)
 
 
 @pytest_asyncio.fixture(scope="function")
@@ -188,3 +216,241 @@ async def test_get_authorized_editable_fields(
     if status_code == 200:
         assert fields_present <= set(response.json()["fields"])
         assert (fields_absent & set(response.json()["fields"])) == set()
+
+
+@pytest.mark.parametrize("actor,action,resource,allowed", action_combs)
+async def test_decision_cache(actor, action, resource, allowed, user_data):
+    actor = user_data[actor]
+    resource = user_data[resource]
+    with decision_cache():
+        hits = decision_cache_stats.hits
+        assert is_allowed(actor, action, resource) == allowed
+        assert is_allowed(actor, action, resource) == allowed
+        assert decision_cache_stats.hits == hits + 1
+
+        fields = get_authorized_fields(actor, "read", resource)
+        # Callers get their own copy of the cached fields.
+        fields.clear()
+        assert get_authorized_fields(actor, "read", resource) == OSO.authorized_fields(
+            actor, "read", resource
+        )
+
+
+async def test_decision_cache_after_write(dummy_session):
+    payment = await dummy_session.get(ent.Payment, 7)
+    with decision_cache():
+        assert is_allowed(None, "read", payment)
+        # Hiding the initiative of the payment doesn't change the payment itself.
+        payment.initiative.hidden = True
+        await dummy_session.flush()
+        misses = decision_cache_stats.misses
+        assert is_allowed(None, "read", payment) == OSO.is_allowed(
+            get_oso_actor(None), "read", payment
+        )
+        assert decision_cache_stats.misses == misses + 1
+
+
+@pytest.mark.parametrize(
+    "get_mock_user",
+    [
+        superuser,
+        admin,
+        user,
+        userowner,
+        grant_officer,
+        policy_officer,
+        initiative_owner,
+        activity_owner,
+        anon,
+    ],
+    indirect=["get_mock_user"],
+)
+async def test_get_authorized_output_fields_many(dummy_session, get_mock_user):
+    actor = get_mock_user()
+    if actor is not None:
+        actor = await actor
+    queries = [
+        get_users_q(actor, None, 0, 100),
+        get_initiatives_q(actor, None, False, 0, 100),
+        select(ent.Funder),
+        select(ent.Regulation),
+        select(ent.Grant),
+        get_initiative_payments_q(actor, 1, 0, None, None, None, None, None, None),
+    ]
+    for query in queries:
+        await assert_output_fields_many_match(dummy_session, actor, query)
+
+
+async def assert_output_fields_many_match(session, actor, query):
+    result = await session.execute(query)
+    resources = result.scalars().unique().all()
+    assert len(resources) > 0
+
+    # In run_sync, so that the rules can load the relationships that aren't loaded.
+    def compare(_):
+        # The fields of a page have to be the same as when they're determined for
+        # every resource on its own.
+        assert get_authorized_output_fields_many(actor, "read", resources) == [
+            get_authorized_output_fields(actor, "read", i) for i in resources
+        ]
+
+    await session.run_sync(compare)
+
+
+async def test_get_authorized_output_fields_many_overseer(dummy_session):
+    # An overseer of two grants, with initiatives of both on the same page.
+    dummy_session.add_all(
+        [
+            ent.UserGrantRole(user_id=user, grant_id=1),
+            ent.UserGrantRole(user_id=user, grant_id=2),
+        ]
+    )
+    await dummy_session.commit()
+    result = await dummy_session.execute(
+        select(User)
+        .options(
+            selectinload(User.initiative_roles),
+            selectinload(User.activity_roles),
+            selectinload(User.user_bank_account_roles),
+            selectinload(User.owner_bank_account_roles),
+            selectinload(User.grant_officer_regulation_roles),
+            selectinload(User.policy_officer_regulation_roles),
+            selectinload(User.overseer_roles),
+        )
+        .where(User.id == user)
+        .execution_options(populate_existing=True)
+    )
+    actor = result.scalars().one()
+
+    initiatives = select(ent.Initiative).where(ent.Initiative.grant_id.in_([1, 2, 3]))
+    await assert_output_fields_many_match(dummy_session, actor, initiatives)
+    # Without the grants loaded.
+    await assert_output_fields_many_match(
+        dummy_session,
+        actor,
+        initiatives.options(lazyload(ent.Initiative.grant)).execution_options(
+            populate_existing=True
+        ),
+    )
+
+
+@pytest.mark.parametrize(
+    "get_mock_user",
+    [
+        superuser,
+        admin,
+        user,
+        userowner,
+        grant_officer,
+        policy_officer,
+        initiative_owner,
+        activity_owner,
+        anon,
+    ],
+    indirect=["get_mock_user"],
+)
+async def test_is_allowed_many(dummy_session, get_mock_user):
+    actor = get_mock_user()
+    if actor is not None:
+        actor = await actor
+    queries = [
+        (select(ent.Payment), ("read", "edit", "link_initiative", "link_activity")),
+        (
+            select(ent.Initiative).options(selectinload(ent.Initiative.activities)),
+            ("read", "edit", "link_payment"),
+        ),
+        (select(ent.Activity), ("read", "edit", "link_payment")),
+    ]
+    for query, actions in queries:
+        result = await dummy_session.execute(query)
+        resources = result.scalars().unique().all()
+        assert len(resources) > 0
+        for action in actions:
+            assert is_allowed_many(actor, action, resources) == [
+                is_allowed(actor, action, i) for i in resources
+            ]
+
+
+@pytest.mark.parametrize(
+    "get_mock_user",
+    [superuser, user, initiative_owner, anon],
+    indirect=["get_mock_user"],
+)
+async def test_authorization_off_loop(dummy_session, get_mock_user, monkeypatch):
+    monkeypatch.setattr(authorization, "OFF_LOOP_MIN_BATCH", 1)
+    actor = get_mock_user()
+    if actor is not None:
+        actor = await actor
+    result = await dummy_session.execute(select(ent.Payment))
+    payments = result.scalars().all()
+    assert await is_allowed_many_async(actor, "read", payments) == is_allowed_many(
+        actor, "read", payments
+    )
+    assert await get_authorized_output_fields_many_async(
+        actor, "read", payments
+    ) == get_authorized_output_fields_many(actor, "read", payments)
+
+
+@pytest.mark.parametrize(
+    "get_mock_user",
+    [
+        superuser,
+        admin,
+        user,
+        userowner,
+        initiative_owner,
+        activity_owner,
+        anon,
+    ],
+    indirect=["get_mock_user"],
+)
+async def test_many_with_finished_activity_and_hidden_payments(
+    dummy_session, get_mock_user
+):
+    # Payments of initiative 1 of a finished and an unfinished activity, hidden and
+    # visible, on the same page.
+    activity = await dummy_session.get(ent.Activity, 2)
+    activity.finished = True
+    for payment_id in (1, 7):
+        payment = await dummy_session.get(ent.Payment, payment_id)
+        payment.hidden = True
+    await dummy_session.commit()
+    actor = get_mock_user()
+    if actor is not None:
+        actor = await actor
+
+    payments = select(ent.Payment).where(ent.Payment.initiative_id == 1)
+    await assert_output_fields_many_match(dummy_session, actor, payments)
+    result = await dummy_session.execute(payments)
+    resources = result.scalars().all()
+    assert {i.activity_id for i in resources} >= {1, 2}
+    assert {i.hidden for i in resources} == {True, False}
+    for action in ("read", "edit", "link_initiative", "link_activity"):
+        assert is_allowed_many(actor, action, resources) == [
+            is_allowed(actor, action, i) for i in resources
+        ]
+
+
+@pytest.mark.parametrize(
+    "get_mock_user",
+    [superuser, userowner, initiative_owner, activity_owner],
+    indirect=["get_mock_user"],
+)
+async def test_is_allowed_many_link_actions(dummy_session, get_mock_user):
+    # The payments of a justified initiative and a finished activity next to those
+    # of other initiatives and activities.
+    initiative = await dummy_session.get(ent.Initiative, 1)
+    initiative.justified = True
+    activity = await dummy_session.get(ent.Activity, 1)
+    activity.finished = True
+    await dummy_session.commit()
+    actor = get_mock_user()
+    if actor is not None:
+        actor = await actor
+
+    result = await dummy_session.execute(select(ent.Payment))
+    payments = result.scalars().all()
+    for action in ("link_initiative", "link_activity"):
+        assert await is_allowed_many_async(actor, action, payments) == [
+            is_allowed(actor, action, i) for i in payments
+        ]
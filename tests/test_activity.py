@@ -218,3 +218,33 @@ async def test_get_activity_payments(async_client, dummy_session, length):
     )
     assert response.status_code == 200
     assert len(response.json()["payments"]) == length
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, limit, total_length",
+    [(superuser, 4, 9), (user, 3, 8)],
+    ids=[
+        "Super user walks all pages with a cursor",
+        "User walks all non hidden pages with a cursor",
+    ],
+    indirect=["get_mock_user"],
+)
+async def test_get_activity_payments_cursor(
+    async_client, dummy_session, limit, total_length
+):
+    initiative_id, activity_id = 1, 1
+    params: dict = {"limit": limit}
+    seen_ids: list[int] = []
+    while True:
+        response = await async_client.get(
+            f"/payments/initiative/{initiative_id}/activity/{activity_id}",
+            params=params,
+        )
+        assert response.status_code == 200
+        page = response.json()
+        seen_ids += [i["payment"]["id"] for i in page["payments"]]
+        if page["next_cursor"] is None:
+            break
+        params["cursor"] = page["next_cursor"]
+    assert len(seen_ids) == total_length
+    assert len(set(seen_ids)) == total_length
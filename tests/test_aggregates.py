@@ -0,0 +1,107 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from open_poen_api import models as ent
+from open_poen_api.aggregates import (
+    PAYMENT_PARENTS,
+    DeferredParents,
+    deferred_finance_aggregates,
+    find_aggregate_drift,
+    recompute_aggregates,
+)
+
+
+async def test_recompute_aggregates(dummy_session):
+    # Sessions on the connection of the test, so that everything is rolled back.
+    session_maker = async_sessionmaker(dummy_session.bind, expire_on_commit=False)
+    await recompute_aggregates(session_maker, chunk_size=2, concurrency=1)
+    assert not any((await find_aggregate_drift(session_maker, 2, 1)).values())
+
+    await dummy_session.execute(
+        update(ent.Initiative)
+        .where(ent.Initiative.id == 1)
+        .values(income=ent.Initiative.income + Decimal("1.00"))
+    )
+    await dummy_session.execute(
+        update(ent.BankAccount).where(ent.BankAccount.id == 1).values(user_count=99)
+    )
+    await dummy_session.commit()
+
+    drift = await find_aggregate_drift(session_maker, chunk_size=2, concurrency=1)
+    assert [i["id"] for i in drift["Initiative"]] == [1]
+    stored, expected = drift["Initiative"][0]["income"]
+    assert stored - expected == Decimal("1.00")
+    assert drift["BankAccount"] == [{"id": 1, "user_count": (99, 0)}]
+
+    changed = await recompute_aggregates(session_maker, chunk_size=2, concurrency=1)
+    assert changed["Initiative"] == [1]
+    assert changed["BankAccount"] == [1]
+    assert not any((await find_aggregate_drift(session_maker, 2, 1)).values())
+
+
+async def test_deferred_finance_aggregates(dummy_session):
+    session_maker = async_sessionmaker(dummy_session.bind, expire_on_commit=False)
+    income = await dummy_session.scalar(
+        select(ent.Initiative.income).where(ent.Initiative.id == 1)
+    )
+
+    async with deferred_finance_aggregates(dummy_session) as parents:
+        dummy_session.add(
+            ent.Payment(
+                transaction_amount=Decimal("5.00"),
+                route=ent.Route.INCOME,
+                type=ent.PaymentType.MANUAL,
+                initiative_id=1,
+            )
+        )
+        await dummy_session.commit()
+        deleted = await dummy_session.execute(
+            delete(ent.Payment)
+            .where(ent.Payment.id == 7)
+            .returning(*[getattr(ent.Payment, i) for i in PAYMENT_PARENTS])
+        )
+        parents.add_payments(deleted)
+        await dummy_session.commit()
+        # Nothing is maintained until the end of the block.
+        assert income == await dummy_session.scalar(
+            select(ent.Initiative.income).where(ent.Initiative.id == 1)
+        )
+
+    assert set(parents.ids) == {ent.Initiative, ent.Activity}
+    assert not any((await find_aggregate_drift(session_maker, 2, 1)).values())
+
+
+async def test_deferred_finance_aggregates_error(dummy_session, monkeypatch):
+    session_maker = async_sessionmaker(dummy_session.bind, expire_on_commit=False)
+
+    def add_payment():
+        dummy_session.add(
+            ent.Payment(
+                transaction_amount=Decimal("5.00"),
+                route=ent.Route.INCOME,
+                type=ent.PaymentType.MANUAL,
+                initiative_id=1,
+            )
+        )
+
+    # What was committed before the error is recomputed.
+    with pytest.raises(ValueError):
+        async with deferred_finance_aggregates(dummy_session):
+            add_payment()
+            await dummy_session.commit()
+            raise ValueError
+    assert not any((await find_aggregate_drift(session_maker, 2, 1)).values())
+
+    # An error in recomputing doesn't hide the original one.
+    def fail(self, session):
+        raise RuntimeError
+
+    monkeypatch.setattr(DeferredParents, "recompute", fail)
+    with pytest.raises(ValueError):
+        async with deferred_finance_aggregates(dummy_session):
+            add_payment()
+            await dummy_session.commit()
+            raise ValueError
@@ -1,5 +1,8 @@
 import pytest
 
+from sqlalchemy import func, select
+
+from open_poen_api.models import Payment
 from tests.conftest import anon, grant_officer, superuser, user, userowner
 
 
@@ -40,3 +43,25 @@ async def test_get_bank_account_detail(
     assert response.status_code == status_code
     assert all([i in response.json() for i in fields_present])
     assert all([i not in response.json() for i in fields_not_present])
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, status_code",
+    [(userowner, 200), (user, 403), (grant_officer, 403)],
+    ids=["User owner can export", "User cannot export", "Grant officer cannot export"],
+    indirect=["get_mock_user"],
+)
+async def test_export_bank_account_payments(async_client, dummy_session, status_code):
+    bank_account_id = 1
+    response = await async_client.get(
+        f"/payments/bank-account/{bank_account_id}/export",
+        params={"format": "ndjson"},
+    )
+    assert response.status_code == status_code
+    if status_code == 200:
+        q = await dummy_session.execute(
+            select(func.count(Payment.id)).where(
+                Payment.bank_account_id == bank_account_id
+            )
+        )
+        assert len(response.text.splitlines()) == q.scalar()
@@ -1,10 +1,12 @@
 import pytest
-from open_poen_api.models import User, Initiative, Payment
+from open_poen_api.models import User, Initiative, Payment, Attachment
+from open_poen_api.managers import PaymentManager
+from open_poen_api.exc import EntityNotFound
 from tests.conftest import userowner, initiative_owner, user, superuser
 import asyncio
 from fastapi import UploadFile
 from io import BytesIO
-from sqlalchemy import select
+from sqlalchemy import delete, select, update
 from sqlalchemy.orm import selectinload, joinedload
 
 
@@ -106,3 +108,71 @@ async def test_upload_attachment(
         )
         r = q.scalars().first()
         assert len(r.attachments) == n_added + 1
+        assert r.n_attachments == n_added + 1
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, existing_attachment, status_code, n_attachments",
+    [(superuser, True, 200, 0), (superuser, False, 404, 1)],
+    ids=[
+        "Deleting attachment decrements count",
+        "Deleting unknown attachment leaves count as is",
+    ],
+    indirect=["get_mock_user"],
+)
+async def test_delete_attachment(
+    async_client,
+    dummy_session,
+    get_mock_user,
+    existing_attachment,
+    status_code,
+    n_attachments,
+):
+    payment_id = 15
+    q = await dummy_session.execute(
+        select(Payment)
+        .options(selectinload(Payment.attachments))
+        .where(Payment.id == payment_id)
+    )
+    attachment_id = q.scalars().first().attachments[0].id
+    if not existing_attachment:
+        attachment_id += 1000
+
+    response = await async_client.delete(
+        f"/payment/{payment_id}/attachment/{attachment_id}"
+    )
+    assert response.status_code == status_code
+
+    q = await dummy_session.execute(
+        select(Payment)
+        .options(selectinload(Payment.attachments))
+        .where(Payment.id == payment_id)
+        .execution_options(populate_existing=True)
+    )
+    r = q.scalars().first()
+    assert len(r.attachments) == n_attachments
+    assert r.n_attachments == n_attachments
+
+
+async def test_delete_attachment_deleted_concurrently(dummy_session):
+    payment_manager = PaymentManager(dummy_session, None)
+    payment = await payment_manager.detail_load(15)
+    attachment_id = payment.attachments[0].id
+    # Another request deletes the attachment after this one loaded the payment.
+    await dummy_session.execute(
+        delete(Attachment)
+        .where(Attachment.id == attachment_id)
+        .execution_options(synchronize_session=False)
+    )
+    await dummy_session.execute(
+        update(Payment).where(Payment.id == 15).values(n_attachments=0)
+    )
+
+    with pytest.raises(EntityNotFound):
+        await payment_manager.attachment_handler.delete(payment, attachment_id, None)
+    assert (
+        await dummy_session.scalar(
+            select(Payment.n_attachments).where(Payment.id == 15)
+        )
+        == 0
+    )
@@ -7,7 +7,8 @@ from tests.conftest import (
     grant_info,
     grant_officer,
 )
-from open_poen_api.models import Grant
+from open_poen_api.models import Grant, Initiative, UserVisibleInitiative
+from sqlalchemy import select
 from open_poen_api.managers import GrantManager
 
 
@@ -149,3 +150,34 @@ async def test_get_linked_grant_detail(async_client, dummy_session, status_code)
         f"/funder/{funder_id}/regulation/{regulation_id}/grant/{grant_id}"
     )
     assert response.status_code == status_code
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, status_code",
+    [(superuser, 200)],
+    ids=["Overseers can see the initiatives of their grant"],
+    indirect=["get_mock_user"],
+)
+async def test_overseer_visible_initiatives(async_client, dummy_session, status_code):
+    funder_id, regulation_id, grant_id = 1, 1, 1
+    url = f"/funder/{funder_id}/regulation/{regulation_id}/grant/{grant_id}/overseers"
+
+    async def visible_initiative_ids():
+        q = await dummy_session.execute(
+            select(UserVisibleInitiative.initiative_id).where(
+                UserVisibleInitiative.user_id == user,
+                UserVisibleInitiative.can_see_hidden_payments == True,
+            )
+        )
+        return set(q.scalars().all())
+
+    response = await async_client.patch(url, json={"user_ids": [user]})
+    assert response.status_code == status_code
+    q = await dummy_session.execute(
+        select(Initiative.id).where(Initiative.grant_id == grant_id)
+    )
+    assert await visible_initiative_ids() == set(q.scalars().all())
+
+    response = await async_client.patch(url, json={"user_ids": []})
+    assert response.status_code == status_code
+    assert await visible_initiative_ids() == set()
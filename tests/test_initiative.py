@@ -1,7 +1,14 @@
+import csv
+import json
+from decimal import Decimal
+
 import pytest
 
 from open_poen_api.managers import InitiativeManager
-from open_poen_api.models import Initiative
+from open_poen_api.models import Grant, Initiative, Payment, Regulation, User
+from open_poen_api.utils.role_cache import RoleCache, role_cache_key
+from open_poen_api.utils.cache_generation import ROLES, get_generations
+from open_poen_api.utils.finance_cache import finance_cache_key
 from tests.conftest import (
     activity_owner,
     admin,
@@ -132,6 +139,52 @@ async def test_add_initiative_owner(async_client, dummy_session, status_code):
         assert db_initiative.initiative_owners[0].email == "user1@example.com"
 
 
+@pytest.mark.parametrize(
+    "get_mock_user",
+    [superuser],
+    indirect=["get_mock_user"],
+)
+async def test_add_initiative_owner_invalidates_role_cache(async_client, dummy_session):
+    key = await role_cache_key(dummy_session, 1)
+    response = await async_client.patch("/initiative/1", json={"location": "Here"})
+    assert response.status_code == 200
+    assert await role_cache_key(dummy_session, 1) == key
+    generation = await get_generations(dummy_session, ROLES)
+    response = await async_client.patch("/initiative/1/owners", json={"user_ids": [1]})
+    assert response.status_code == 200
+    assert await role_cache_key(dummy_session, 1) != key
+    # The finance series of every process depend on the roles too.
+    assert await get_generations(dummy_session, ROLES) > generation
+
+
+@pytest.mark.parametrize(
+    "get_mock_user",
+    [superuser],
+    indirect=["get_mock_user"],
+)
+async def test_delete_initiative_invalidates_role_cache(async_client, dummy_session):
+    # The roles of the initiative owner are deleted by a database cascade.
+    key = await role_cache_key(dummy_session, initiative_owner)
+    response = await async_client.delete("/initiative/1")
+    assert response.status_code == 204
+    assert await role_cache_key(dummy_session, initiative_owner) != key
+
+
+async def test_role_cache_copies_and_evicts(dummy_session):
+    cache = RoleCache(max_size=2, ttl=60)
+    users = [await dummy_session.get(User, i) for i in (1, 5, 6)]
+    for i in users:
+        dummy_session.expunge(i)
+        cache.set(str(i.id), i)
+    # Every get is a copy of its own.
+    first, second = cache.get("6"), cache.get("6")
+    assert first is not second and first is not users[2]
+    assert first.id == second.id == 6
+    # The least recently used user is dropped.
+    assert cache.get("1") is None
+    assert cache.get("5").id == 5
+
+
 @pytest.mark.skip(reason="Debit cards are not used ATM.")
 @pytest.mark.parametrize(
     "get_mock_user, status_code",
@@ -394,3 +447,206 @@ async def test_get_initiative_payments_filters(
     if status_code == 200:
         payments = response.json()["payments"]
         assert len(payments) == expected_length
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, limit, total_length",
+    [(superuser, 4, 11), (user, 4, 9), (superuser, 11, 11)],
+    ids=[
+        "Super user walks all pages with a cursor",
+        "User walks all non hidden pages with a cursor",
+        "Exactly one full page returns a cursor to an empty page",
+    ],
+    indirect=["get_mock_user"],
+)
+async def test_get_initiative_payments_cursor(
+    async_client, dummy_session, limit, total_length
+):
+    initiative_id = 1
+    params: dict = {"limit": limit}
+    seen_ids: list[int] = []
+    while True:
+        response = await async_client.get(
+            f"/payments/initiative/{initiative_id}", params=params
+        )
+        assert response.status_code == 200
+        page = response.json()
+        seen_ids += [i["payment"]["id"] for i in page["payments"]]
+        if page["next_cursor"] is None:
+            break
+        params["cursor"] = page["next_cursor"]
+    assert len(seen_ids) == total_length
+    assert len(set(seen_ids)) == total_length
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, cursor, status_code",
+    [(superuser, "not-a-cursor", 422), (superuser, "WzEsIDJd", 422)],
+    ids=["Garbage cursor returns error", "Malformed cursor returns error"],
+    indirect=["get_mock_user"],
+)
+async def test_get_initiative_payments_invalid_cursor(
+    async_client, dummy_session, cursor, status_code
+):
+    initiative_id = 1
+    response = await async_client.get(
+        f"/payments/initiative/{initiative_id}", params={"cursor": cursor}
+    )
+    assert response.status_code == status_code
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, format, length",
+    [
+        (superuser, "csv", 11),
+        (user, "csv", 9),
+        (superuser, "ndjson", 11),
+        (anon, "ndjson", 9),
+    ],
+    ids=[
+        "Super user exports all payments as csv",
+        "User exports non hidden payments as csv",
+        "Super user exports all payments as ndjson",
+        "Anon exports non hidden payments as ndjson",
+    ],
+    indirect=["get_mock_user"],
+)
+async def test_export_initiative_payments(async_client, dummy_session, format, length):
+    initiative_id = 1
+    response = await async_client.get(
+        f"/payments/initiative/{initiative_id}/export", params={"format": format}
+    )
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    if format == "csv":
+        header, rows = lines[0], list(csv.DictReader(lines))
+        assert "transaction_amount" in header
+    else:
+        rows = [json.loads(line) for line in lines]
+    assert len(rows) == length
+    assert all(int(row["id"]) > 0 for row in rows)
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, limit, status_code",
+    [(superuser, 100, 200), (superuser, 101, 422), (superuser, 0, 422)],
+    ids=["Maximum page size is allowed", "Larger page fails", "Empty page fails"],
+    indirect=["get_mock_user"],
+)
+async def test_get_initiative_payments_limit_cap(
+    async_client, dummy_session, limit, status_code
+):
+    initiative_id = 1
+    response = await async_client.get(
+        f"/payments/initiative/{initiative_id}", params={"limit": limit}
+    )
+    assert response.status_code == status_code
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, initiative_ids",
+    [
+        (superuser, [2, 1]),
+        (initiative_owner, [2, 1]),
+        (user, [2]),
+        (anon, [2]),
+    ],
+    ids=[
+        "Superuser gets both in requested order",
+        "Initiative owner gets own hidden initiative",
+        "User does not get hidden initiative",
+        "Anon does not get hidden initiative",
+    ],
+    indirect=["get_mock_user"],
+)
+async def test_get_initiatives_batch(async_client, dummy_session, initiative_ids):
+    await hide_instance(dummy_session, Initiative, 1)
+    response = await async_client.get("/initiatives/batch", params={"ids": "2,1,9999"})
+    assert response.status_code == 200
+    initiatives = response.json()["initiatives"]
+    assert [i["id"] for i in initiatives] == initiative_ids
+    assert all("activities" in i for i in initiatives)
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, ids",
+    [
+        (anon, "1,a"),
+        (anon, ",".join(str(i) for i in range(1, 102))),
+    ],
+    ids=[
+        "Ids have to be numbers",
+        "At most 100 ids at once",
+    ],
+    indirect=["get_mock_user"],
+)
+async def test_get_initiatives_batch_invalid_ids(async_client, dummy_session, ids):
+    response = await async_client.get("/initiatives/batch", params={"ids": ids})
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, income, expenses",
+    [
+        (superuser, "1342.82", "2827.44"),
+        (initiative_owner, "1342.82", "2827.44"),
+        (anon, "886.04", "2038.12"),
+    ],
+    ids=[
+        "Superuser sees hidden payments in totals",
+        "Initiative owner sees hidden payments in totals",
+        "Anon does not see hidden payments in totals",
+    ],
+    indirect=["get_mock_user"],
+)
+async def test_get_initiative_finance(async_client, dummy_session, income, expenses):
+    initiative_id = 1
+    response = await async_client.get(
+        f"/initiative/{initiative_id}/finance", params={"interval": "month"}
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert len(body["periods"]) == 3
+    assert sum(Decimal(i["income"]) for i in body["periods"]) == Decimal(income)
+    assert sum(Decimal(i["expenses"]) for i in body["periods"]) == Decimal(expenses)
+    # The per activity breakdown adds up to the same totals.
+    activity_periods = [j for i in body["activities"] for j in i["periods"]]
+    assert sum(Decimal(i["income"]) for i in activity_periods) == Decimal(income)
+
+
+@pytest.mark.parametrize(
+    "get_mock_user",
+    [superuser],
+    ids=["Unlinking a payment updates the cached series"],
+    indirect=["get_mock_user"],
+)
+async def test_initiative_finance_cache_invalidation(async_client, dummy_session):
+    initiative_id, payment_id = 1, 6
+    url = f"/initiative/{initiative_id}/finance"
+    response = await async_client.get(url)
+    expenses = sum(Decimal(i["expenses"]) for i in response.json()["periods"])
+
+    response = await async_client.patch(
+        f"/payment/{payment_id}/initiative", json={"initiative_id": None}
+    )
+    assert response.status_code == 200
+
+    response = await async_client.get(url)
+    new_expenses = sum(Decimal(i["expenses"]) for i in response.json()["periods"])
+    assert new_expenses == expenses - Decimal("150.75")
+
+
+async def test_finance_cache_key_per_initiative(dummy_session):
+    parents = [
+        await dummy_session.get(Initiative, 1),
+        await dummy_session.get(Initiative, 2),
+        await dummy_session.get(Grant, 1),
+        await dummy_session.get(Regulation, 6),
+    ]
+    keys = [await finance_cache_key(dummy_session, i) for i in parents]
+    payment = await dummy_session.get(Payment, 6)
+    payment.short_user_description = "Changed"
+    await dummy_session.commit()
+    # Initiative 1 of grant 1 of regulation 6, and nothing else, is stale.
+    new_keys = [await finance_cache_key(dummy_session, i) for i in parents]
+    assert [i != j for i, j in zip(keys, new_keys)] == [True, False, True, True]
@@ -13,7 +13,9 @@ from tests.conftest import (
     policy_officer,
 )
 from open_poen_api.models import Payment, Initiative
+from open_poen_api import models as ent
 from decimal import Decimal
+from sqlalchemy import select
 
 
 @pytest.mark.parametrize(
@@ -271,3 +273,84 @@ async def test_initiative_budget_update(
     assert initiative.expenses == should_be
 
     print("stop")
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, payment_ids",
+    [
+        (superuser, [15, 13]),
+        (user, [13]),
+    ],
+    ids=[
+        "Superuser gets hidden payment",
+        "User does not get hidden payment",
+    ],
+    indirect=["get_mock_user"],
+)
+async def test_get_payments_batch(async_client, dummy_session, payment_ids):
+    response = await async_client.get("/payments/batch", params={"ids": "15,13,9999"})
+    assert response.status_code == 200
+    payments = response.json()["payments"]
+    assert [i["id"] for i in payments] == payment_ids
+    assert all("attachments" in i for i in payments)
+
+
+async def assert_finance_aggregates_match_payments(session):
+    for parent, payments_of in (
+        (ent.Initiative, ent.Payment.initiative_id == ent.Initiative.id),
+        (ent.Activity, ent.Payment.activity_id == ent.Activity.id),
+        (
+            ent.Grant,
+            ent.Payment.initiative_id.in_(
+                select(ent.Initiative.id).where(ent.Initiative.grant_id == ent.Grant.id)
+            ),
+        ),
+    ):
+        stored = await session.execute(
+            select(parent.id, parent.income, parent.expenses).order_by(parent.id)
+        )
+        summed = await session.execute(
+            select(
+                parent.id,
+                select(ent.get_finance_aggregate(ent.Route.INCOME))
+                .where(payments_of)
+                .scalar_subquery(),
+                select(ent.get_finance_aggregate(ent.Route.EXPENSES))
+                .where(payments_of)
+                .scalar_subquery(),
+            ).order_by(parent.id)
+        )
+        assert stored.all() == summed.all()
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, payment_id, url, body",
+    [
+        (superuser, 6, "/payment/6/initiative", {"initiative_id": 2}),
+        (superuser, 6, "/payment/6/initiative", {"initiative_id": None}),
+        (superuser, 1, "/payment/1/activity", {"initiative_id": 1, "activity_id": 1}),
+        (superuser, 7, "/payment/7", {"transaction_amount": "1000.00"}),
+    ],
+    ids=[
+        "Relink to another initiative",
+        "Unlink from initiative",
+        "Link to activity",
+        "Change amount",
+    ],
+    indirect=["get_mock_user"],
+)
+async def test_finance_aggregates_follow_payments(
+    async_client, dummy_session, payment_id, url, body
+):
+    await assert_finance_aggregates_match_payments(dummy_session)
+    response = await async_client.patch(url, json=body)
+    assert response.status_code == 200
+    await assert_finance_aggregates_match_payments(dummy_session)
+
+
+@pytest.mark.parametrize("get_mock_user", [superuser], indirect=True)
+async def test_finance_aggregates_follow_deleted_payment(async_client, dummy_session):
+    await assert_finance_aggregates_match_payments(dummy_session)
+    response = await async_client.delete("/payment/1")
+    assert response.status_code == 204
+    await assert_finance_aggregates_match_payments(dummy_session)
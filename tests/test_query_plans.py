@@ -0,0 +1,158 @@
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from open_poen_api import models as ent
+from open_poen_api.query import (
+    apply_payment_ordering,
+    get_activity_payments_q,
+    get_bank_account_payments_q,
+    get_grant_payments_q,
+    get_initiative_payments_q,
+    get_user_payments_q,
+)
+
+N_PAYMENTS = 50000
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def compile_explain(element, compiler, **kw):
+    return "EXPLAIN " + compiler.process(element.statement, **kw)
+
+
+async def explain(session, statement) -> str:
+    result = await session.execute(Explain(statement))
+    return "\n".join(result.scalars().all())
+
+
+async def seed_payments(session):
+    # Lots of payments (with attachments) on another bank account than the one of
+    # the dummy data, so that the payments of the dummy data are a small fraction of
+    # the table, like the payments of a single initiative are in production.
+    await session.execute(
+        text(
+            """
+            INSERT INTO payment (
+                transaction_id, booking_date, transaction_amount, route, type,
+                hidden, n_attachments, bank_account_id, created_at, updated_at
+            )
+            SELECT
+                'plan-' || i, now() - i * interval '1 hour', i % 1000,
+                CASE WHEN i % 2 = 0 THEN 'inkomen' ELSE 'uitgaven' END,
+                'GoCardless', false, 1, 2, now(), now()
+            FROM generate_series(1, :n) AS i
+            """
+        ),
+        {"n": N_PAYMENTS},
+    )
+    await session.execute(
+        text(
+            """
+            INSERT INTO attachments (
+                entity_id, entity_type, attachment_type, raw_attachment_url,
+                created_at, updated_at
+            )
+            SELECT id, 'payment', 'picture', 'https://example.com', now(), now()
+            FROM payment WHERE transaction_id LIKE 'plan-%'
+            """
+        )
+    )
+    await session.execute(text("ANALYZE payment"))
+    await session.execute(text("ANALYZE attachments"))
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        get_initiative_payments_q(None, 1, 0, 20, None, None, None, None, None),
+        get_activity_payments_q(None, 1, 0, 20, None, None, None, None, None),
+        get_grant_payments_q(None, 1, None, None, None, None, None),
+        apply_payment_ordering(
+            get_bank_account_payments_q(1, None, None, None, None, None), None, 0, 20
+        ),
+        get_user_payments_q(1, None, None, None, 0, 20),
+        get_user_payments_q(1, None, None, None, 0, 20, only_unlinked=True),
+        select(ent.Attachment).where(
+            ent.Attachment.entity_type == ent.AttachmentEntityType.PAYMENT,
+            ent.Attachment.entity_id == 15,
+        ),
+    ],
+    ids=[
+        "Initiative payments",
+        "Activity payments",
+        "Grant payments",
+        "Bank account payments",
+        "User payments",
+        "Unlinked user payments",
+        "Attachments of a payment",
+    ],
+)
+async def test_payment_queries_use_index(dummy_session, statement):
+    await seed_payments(dummy_session)
+    plan = await explain(dummy_session, statement)
+    assert "Seq Scan on payment" not in plan, plan
+    assert "Seq Scan on attachments" not in plan, plan
+
+
+@pytest.mark.parametrize(
+    "statement, index",
+    [
+        (
+            select(ent.UserInitiativeRole).where(
+                ent.UserInitiativeRole.initiative_id == 1
+            ),
+            "ix_user_initiative_roles_initiative_id",
+        ),
+        (
+            select(ent.UserActivityRole).where(ent.UserActivityRole.activity_id == 1),
+            "ix_user_activity_roles_activity_id",
+        ),
+        (
+            select(ent.UserBankAccountRole).where(
+                ent.UserBankAccountRole.bank_account_id == 1
+            ),
+            "ix_user_bank_account_roles_bank_account_id",
+        ),
+        (
+            select(ent.UserGrantRole).where(ent.UserGrantRole.grant_id == 1),
+            "ix_user_grant_roles_grant_id",
+        ),
+        (
+            select(ent.UserRegulationRole).where(
+                ent.UserRegulationRole.regulation_id == 1
+            ),
+            "ix_user_regulation_roles_regulation_id",
+        ),
+        (
+            select(ent.Activity).where(ent.Activity.initiative_id == 1),
+            "ix_activity_initiative_id",
+        ),
+        (
+            select(ent.Initiative).where(ent.Initiative.grant_id == 1),
+            "ix_initiative_grant_id",
+        ),
+    ],
+    ids=[
+        "Initiative owners",
+        "Activity owners",
+        "Bank account users",
+        "Overseers",
+        "Officers",
+        "Activities of an initiative",
+        "Initiatives of a grant",
+    ],
+)
+async def test_detail_load_queries_use_index(dummy_session, statement, index):
+    # These tables are tiny in the dummy data, so the planner would rightly prefer a
+    # sequential scan. Discourage it to check that there's an index it can use.
+    await dummy_session.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = await explain(dummy_session, statement)
+    assert index in plan, plan
@@ -0,0 +1,101 @@
+import pytest
+
+from open_poen_api.models import Funder, Initiative
+from tests.conftest import (
+    activity_owner,
+    admin,
+    anon,
+    hide_instance,
+    initiative_owner,
+    superuser,
+    user,
+)
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, present",
+    [
+        (superuser, True),
+        (admin, True),
+        (initiative_owner, True),
+        (activity_owner, True),
+        (user, False),
+        (anon, False),
+    ],
+    ids=[
+        "Superuser finds hidden initiative",
+        "Administrator finds hidden initiative",
+        "Initiative owner finds own hidden initiative",
+        "Activity owner finds hidden initiative of own activity",
+        "User does not find hidden initiative",
+        "Anon does not find hidden initiative",
+    ],
+    indirect=["get_mock_user"],
+)
+async def test_search_hidden_initiative(async_client, dummy_session, present):
+    await hide_instance(dummy_session, Initiative, 1)
+    response = await async_client.get("/search?q=clean energy research")
+    assert response.status_code == 200
+    hits = response.json()["hits"]
+    assert (
+        any(h["entity_type"] == "initiative" and h["id"] == 1 for h in hits) == present
+    )
+
+
+@pytest.mark.parametrize(
+    "get_mock_user",
+    [anon],
+    ids=["Best match is ranked first"],
+    indirect=["get_mock_user"],
+)
+async def test_search_ranking(async_client, dummy_session):
+    response = await async_client.get("/search?q=EcoFuture Fund")
+    assert response.status_code == 200
+    hits = response.json()["hits"]
+    assert hits[0]["entity_type"] == "funder"
+    assert hits[0]["name"] == "EcoFuture Fund"
+    scores = [h["score"] for h in hits]
+    assert scores == sorted(scores, reverse=True)
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, query, status_code",
+    [(anon, "ab", 422), (anon, "abc", 200)],
+    ids=["Too short query fails", "Three characters is enough"],
+    indirect=["get_mock_user"],
+)
+async def test_search_query_length(async_client, dummy_session, query, status_code):
+    response = await async_client.get(f"/search?q={query}")
+    assert response.status_code == status_code
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, full_name",
+    [(superuser, True), (anon, False)],
+    ids=["Superuser gets the full name", "Anon gets no hidden fields"],
+    indirect=["get_mock_user"],
+)
+async def test_search_user_name(async_client, dummy_session, full_name):
+    response = await async_client.get("/search?q=user1@example.com")
+    assert response.status_code == 200
+    names = [h["name"] for h in response.json()["hits"] if h["entity_type"] == "user"]
+    # The name is made of the fields that /users would return.
+    assert any("Doe" in (i or "") for i in names) == full_name
+
+
+@pytest.mark.parametrize(
+    "get_mock_user",
+    [anon],
+    ids=["Hits that are left out don't shorten the page"],
+    indirect=["get_mock_user"],
+)
+async def test_search_page_is_filled(async_client, dummy_session):
+    # Ranked below the user with this email, which anon can't find by it.
+    dummy_session.add(Funder(name="user1@example.com fund", url="https://fund.org"))
+    await dummy_session.commit()
+    response = await async_client.get("/search?q=user1@example.com&limit=1")
+    assert response.status_code == 200
+    hits = response.json()["hits"]
+    assert [(h["entity_type"], h["name"]) for h in hits] == [
+        ("funder", "user1@example.com fund")
+    ]
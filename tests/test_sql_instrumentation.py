@@ -0,0 +1,43 @@
+import re
+
+import pytest
+from sqlalchemy import select
+
+from open_poen_api import models as ent
+from open_poen_api.database import N_PLUS_ONE_THRESHOLD, record_queries
+from tests.conftest import anon, superuser
+
+
+@pytest.mark.parametrize(
+    "get_mock_user",
+    [superuser, anon],
+    ids=["Superuser", "Anon"],
+    indirect=["get_mock_user"],
+)
+async def test_server_timing(async_client, dummy_session):
+    response = await async_client.get("/initiatives")
+    assert response.status_code == 200
+    match = re.fullmatch(
+        r'db;dur=[\d.]+;desc="(\d+) queries"', response.headers["Server-Timing"]
+    )
+    assert match is not None
+    assert int(match.group(1)) > 0
+
+
+async def test_repeated_statements(dummy_session):
+    with record_queries() as queries:
+        # One query for the list and one per row, like a lazy relationship.
+        await dummy_session.execute(select(ent.Initiative.id))
+        for initiative_id in range(1, N_PLUS_ONE_THRESHOLD + 1):
+            await dummy_session.execute(
+                select(ent.Activity.id).where(
+                    ent.Activity.initiative_id == initiative_id
+                )
+            )
+
+    assert queries.count == N_PLUS_ONE_THRESHOLD + 1
+    repeated = queries.repeated()
+    assert len(repeated) == 1
+    [(statement, count)] = repeated.items()
+    assert "activity" in statement
+    assert count == N_PLUS_ONE_THRESHOLD
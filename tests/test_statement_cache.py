@@ -0,0 +1,42 @@
+import pytest
+
+from open_poen_api.database import statement_cache_stats
+from tests.conftest import activity_owner, superuser, user
+
+
+@pytest.mark.parametrize(
+    "get_mock_user",
+    [user, activity_owner],
+    ids=["User", "Activity owner"],
+    indirect=["get_mock_user"],
+)
+async def test_list_queries_hit_statement_cache(async_client, dummy_session):
+    # The first request may compile, after that the same shape comes from the cache,
+    # whatever the ids and the number of roles of the requesting user.
+    for initiative_id in (1, 2):
+        response = await async_client.get(f"/payments/initiative/{initiative_id}")
+        assert response.status_code == 200
+
+    hits = statement_cache_stats.hits
+    misses = statement_cache_stats.misses
+    for initiative_id in (3, 4):
+        response = await async_client.get(f"/payments/initiative/{initiative_id}")
+        assert response.status_code == 200
+
+    assert statement_cache_stats.misses == misses
+    assert statement_cache_stats.hits > hits
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, status_code",
+    [(superuser, 200)],
+    ids=["Superuser can see statement cache stats"],
+    indirect=["get_mock_user"],
+)
+async def test_get_statement_cache_stats(async_client, dummy_session, status_code):
+    await async_client.get("/initiatives")
+    response = await async_client.get("/utils/statement-cache")
+    assert response.status_code == status_code
+    body = response.json()
+    assert body["hits"] + body["misses"] > 0
+    assert 0 <= body["hit_rate"] <= 1
@@ -227,3 +227,33 @@ async def test_get_user_payments(async_client, dummy_session, status_code):
     assert response.status_code == status_code
     if response.status_code == 200:
         assert len(response.json()["payments"]) == 9
+
+
+@pytest.mark.parametrize(
+    "get_mock_user, params, payment_count",
+    [
+        (userowner, {"only_unlinked": True}, 2),
+        (userowner, {"route": "inkomen"}, 4),
+        (userowner, {"start_date": "2023-09-01", "end_date": "2023-09-15"}, 5),
+        (userowner, {"min_amount": "400.00"}, 4),
+        (userowner, {"only_unlinked": True, "route": "inkomen"}, 1),
+    ],
+    ids=[
+        "Only unlinked payments",
+        "Only income",
+        "Date range",
+        "Minimum amount",
+        "Combined filters",
+    ],
+    indirect=["get_mock_user"],
+)
+async def test_filter_user_payments(async_client, dummy_session, params, payment_count):
+    user_id = 1
+    response = await async_client.get(f"payments/user/{user_id}", params=params)
+    assert response.status_code == 200
+    payments = response.json()["payments"]
+    assert len(payments) == payment_count
+    # Newest first, and a payment is never listed twice.
+    booking_dates = [i["booking_date"] for i in payments]
+    assert booking_dates == sorted(booking_dates, reverse=True)
+    assert len(set(i["id"] for i in payments)) == len(payments)